@@ -0,0 +1,287 @@
+"""
+本地模拟的 llama-server
+实现 OpenAI 兼容的 /v1/chat/completions（流式与非流式）和 /health，
+可配置每个 token 的耗时、槽位数和错误率，用于离线测试翻译吞吐量
+"""
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+_NUMBERED_JSON_RE = re.compile(r"\{.*\}", re.S)
+
+
+class FakeLlamaServer:
+    """
+    模拟服务器
+    译文为 "译:" + 原文；生成耗时 = 译文字符数 × token_latency，槽位被占满时请求排队等待；
+    请求带 id_slot 时按字符模拟提示词前缀缓存，只有未命中的部分计入预填充耗时；
+    设置 draft_acceptance 时模拟投机解码：每步草稿模型起草 draft_max 个 token，主模型一次验证，
+    接受的 token 加上主模型自己生成的一个 token 一起输出
+    """
+
+    def __init__(self, port: int = 0, slots: int = 1, token_latency: float = 0.0,
+                 prompt_latency: float = 0.0, error_rate: float = 0.0, seed: int = 0,
+                 draft_acceptance: Optional[float] = None, draft_max: int = 16, draft_latency: float = 0.0):
+        """
+        :param port: 监听端口，0 表示自动分配
+        :param slots: 并行槽位数，对应 llama-server 的 --parallel
+        :param token_latency: 每生成一个 token（按一个字符计）的耗时（秒）
+        :param prompt_latency: 每个提示词字符的预填充耗时（秒）
+        :param error_rate: 返回 500 错误的概率
+        :param seed: 错误注入使用的随机种子
+        :param draft_acceptance: 每个草稿 token 被接受的概率，为 None 时不模拟投机解码
+        :param draft_max: 每步起草的 token 数
+        :param draft_latency: 草稿模型生成一个 token 的耗时（秒）
+        """
+        self.slots = slots
+        self.token_latency = token_latency
+        self.prompt_latency = prompt_latency
+        self.error_rate = error_rate
+        self.draft_acceptance = draft_acceptance
+        self.draft_max = draft_max
+        self.draft_latency = draft_latency
+        self._random = random.Random(seed)
+        self._slot_semaphore = threading.Semaphore(slots)
+        self._lock = threading.Lock()
+        self._latencies: List[float] = []
+        self._spans: List[tuple] = []  # 每个成功请求占用槽位的 (开始, 结束) 时间
+        self._errors = 0
+        self._slot_prompts: Dict[int, str] = {}  # 每个槽位上一次的提示词，用于模拟前缀缓存
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def port(self) -> int:
+        return self._httpd.server_address[1]
+
+    @property
+    def api_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v1/chat/completions"
+
+    def start(self):
+        """在后台线程中启动服务器"""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止服务器"""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def reset_stats(self):
+        """清空统计数据"""
+        with self._lock:
+            self._latencies.clear()
+            self._spans.clear()
+            self._errors = 0
+
+    def get_stats(self) -> Dict[str, float]:
+        """
+        获取请求数、错误数、请求延迟的 p50/p99（秒，包含等待槽位的时间），
+        以及尾部时间（最后一个请求开始后到全部结束的时间，这段时间里槽位陆续空闲）和槽位利用率
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+            spans = list(self._spans)
+            errors = self._errors
+        tail = utilization = 0.0
+        if spans:
+            first = min(start for start, _ in spans)
+            last = max(end for _, end in spans)
+            tail = last - max(start for start, _ in spans)
+            busy = sum(end - start for start, end in spans)
+            utilization = busy / (self.slots * (last - first)) if last > first else 0.0
+        return {
+            "requests": len(latencies),
+            "errors": errors,
+            "latency_p50": percentile(latencies, 0.50),
+            "latency_p99": percentile(latencies, 0.99),
+            "tail": tail,
+            "utilization": utilization,
+        }
+
+    def _record(self, latency: float, error: bool = False, span: tuple = None):
+        with self._lock:
+            self._latencies.append(latency)
+            if span is not None:
+                self._spans.append(span)
+            if error:
+                self._errors += 1
+
+    def _should_fail(self) -> bool:
+        if self.error_rate <= 0:
+            return False
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def _reuse_prefix(self, slot, prompt: str) -> int:
+        """模拟 cache_prompt：返回与该槽位上一次提示词相同的前缀长度"""
+        if slot is None:
+            return 0
+        with self._lock:
+            previous = self._slot_prompts.get(slot, "")
+            self._slot_prompts[slot] = prompt
+        common = 0
+        for a, b in zip(previous, prompt):
+            if a != b:
+                break
+            common += 1
+        return common
+
+    def _decode_steps(self, length: int) -> List[tuple]:
+        """
+        把生成过程拆成若干步，返回 (本步输出的 token 数, 本步耗时, 起草数, 接受数)
+        不使用投机解码时每步输出一个 token
+        """
+        if self.draft_acceptance is None:
+            return [(1, self.token_latency, 0, 0)] * length
+        steps = []
+        remaining = length
+        with self._lock:
+            while remaining > 0:
+                drafted = min(self.draft_max, remaining - 1) if remaining > 1 else 0
+                accepted = 0
+                while accepted < drafted and self._random.random() < self.draft_acceptance:
+                    accepted += 1
+                # 草稿逐个生成，主模型一次前向验证全部草稿并补上一个 token
+                steps.append((accepted + 1, drafted * self.draft_latency + self.token_latency, drafted, accepted))
+                remaining -= accepted + 1
+        return steps
+
+    @staticmethod
+    def translate(messages: List[dict]) -> str:
+        """生成模拟译文；批量请求按编号返回 JSON 对象"""
+        system = messages[0]["content"] if messages and messages[0]["role"] == "system" else ""
+        user = messages[-1]["content"] if messages else ""
+        if "JSON" in system:
+            match = _NUMBERED_JSON_RE.search(user)
+            if match:
+                try:
+                    numbered = json.loads(match.group())
+                    return json.dumps({k: f"译:{v}" for k, v in numbered.items()}, ensure_ascii=False)
+                except json.JSONDecodeError:
+                    pass
+        text = user.split("：", 1)[1] if "：" in user else user
+        return f"译:{text}"
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status: int, body: bytes, content_type: str = "application/json"):
+                head = (
+                    f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                    f"Content-Type: {content_type}\r\n"
+                    f"Content-Length: {len(body)}\r\n\r\n"
+                ).encode("ascii")
+                self.wfile.write(head + body)
+
+            def _write_chunk(self, data: bytes):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+            def do_GET(self):
+                if self.path == "/health":
+                    self._send(200, b'{"status":"ok"}')
+                else:
+                    self._send(404, b'{"error":"not found"}')
+
+            def do_POST(self):
+                started = time.perf_counter()
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                if self.path != "/v1/chat/completions":
+                    self._send(404, b'{"error":"not found"}')
+                    return
+
+                messages = request.get("messages", [])
+                with server._slot_semaphore:
+                    slot_acquired = time.perf_counter()
+                    if server._should_fail():
+                        self._send(500, b'{"error":"injected failure"}')
+                        server._record(time.perf_counter() - started, error=True)
+                        return
+
+                    prompt = "".join(f"<{m.get('role')}>{m.get('content', '')}" for m in messages)
+                    cached = 0
+                    if request.get("cache_prompt", True):
+                        cached = server._reuse_prefix(request.get("id_slot"), prompt)
+                    time.sleep((len(prompt) - cached) * server.prompt_latency)
+                    reply = server.translate(messages)
+                    steps = server._decode_steps(len(reply))
+                    timings = {
+                        "cache_n": cached,
+                        "prompt_n": len(prompt) - cached,
+                        "predicted_n": len(reply),
+                    }
+                    if server.draft_acceptance is not None:
+                        timings["draft_n"] = sum(step[2] for step in steps)
+                        timings["draft_n_accepted"] = sum(step[3] for step in steps)
+
+                    if request.get("stream"):
+                        self.send_response(200)
+                        self.send_header("Content-Type", "text/event-stream")
+                        self.send_header("Transfer-Encoding", "chunked")
+                        self.end_headers()
+                        position = 0
+                        for count, latency, _, _ in steps:
+                            time.sleep(latency)
+                            for char in reply[position:position + count]:
+                                chunk = {"choices": [{"index": 0, "delta": {"content": char}}]}
+                                self._write_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                            position += count
+                        final = {"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "timings": timings}
+                        self._write_chunk(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+                        self._write_chunk(b"")
+                    else:
+                        time.sleep(sum(step[1] for step in steps))
+                        body = {
+                            "choices": [{"index": 0, "message": {"role": "assistant", "content": reply},
+                                         "finish_reason": "stop"}],
+                            "timings": timings,
+                        }
+                        self._send(200, json.dumps(body, ensure_ascii=False).encode("utf-8"))
+
+                finished = time.perf_counter()
+                server._record(finished - started, span=(slot_acquired, finished))
+
+        return Handler
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """计算已排序数据的分位数"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="本地模拟 llama-server")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--slots", type=int, default=1)
+    parser.add_argument("--token-latency", type=float, default=0.0)
+    parser.add_argument("--prompt-latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--draft-acceptance", type=float, default=None)
+    parser.add_argument("--draft-max", type=int, default=16)
+    parser.add_argument("--draft-latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    fake = FakeLlamaServer(args.port, args.slots, args.token_latency, args.prompt_latency, args.error_rate,
+                           draft_acceptance=args.draft_acceptance, draft_max=args.draft_max,
+                           draft_latency=args.draft_latency)
+    print(f"模拟服务器已启动：{fake.api_url}")
+    fake._httpd.serve_forever()
@@ -0,0 +1,130 @@
+"""
+消息队列微基准测试
+测量每条消息从生产者到消费者的平均开销、get_many 批量读取的开销，
+以及消费者空闲等待时的 CPU 占用（与旧版按 0.05 秒超时轮询的方式对比）
+
+用法（在项目根目录执行）：
+    python -m benchmark.message_queue_benchmark --messages 200000 --idle-seconds 3
+"""
+import argparse
+import os
+import queue
+import sys
+import threading
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from message_queue import MessageQueue  # noqa: E402
+
+
+def bench_user_messages(count: int) -> float:
+    """工作线程阻塞读取输入队列，返回每条消息的平均耗时（微秒）"""
+    message_queue = MessageQueue(input_maxsize=count + 1)
+    received = 0
+
+    def consume():
+        nonlocal received
+        while message_queue.get_user_message() is not None:
+            received += 1
+
+    consumer = threading.Thread(target=consume)
+    started = time.perf_counter()
+    consumer.start()
+    for i in range(count):
+        message_queue.put_user_message("x")
+    message_queue.wake()
+    consumer.join()
+    elapsed = time.perf_counter() - started
+    assert received == count
+    return elapsed / count * 1e6
+
+
+def bench_output_messages(count: int, maxsize: int) -> float:
+    """工作线程写入有界输出队列，GUI 端用 get_many 批量读取，返回每条消息的平均耗时（微秒）"""
+    message_queue = MessageQueue(output_maxsize=maxsize)
+    producer_done = threading.Event()
+
+    def produce():
+        for i in range(count):
+            message_queue.put_ai_message("x", {"partial": True})
+        producer_done.set()
+
+    producer = threading.Thread(target=produce)
+    received = 0
+    started = time.perf_counter()
+    producer.start()
+    while received < count:
+        batch = message_queue.get_many()
+        if batch:
+            received += len(batch)
+        elif not producer_done.is_set():
+            time.sleep(0)
+    producer.join()
+    elapsed = time.perf_counter() - started
+    return elapsed / count * 1e6
+
+
+def _cpu_seconds_while(wait_loop, seconds: float) -> float:
+    """在后台线程运行 wait_loop 指定时间，返回期间进程消耗的 CPU 时间"""
+    stop = threading.Event()
+    thread = threading.Thread(target=wait_loop, args=(stop,))
+    started = time.process_time()
+    thread.start()
+    time.sleep(seconds)
+    stop.set()
+    thread.join()
+    return time.process_time() - started
+
+
+def bench_idle_cpu(seconds: float):
+    """空闲时的 CPU 占用：阻塞等待与旧版 0.05 秒超时轮询对比，返回（阻塞 %, 轮询 %）"""
+    message_queue = MessageQueue()
+
+    def blocking(stop):
+        while not stop.is_set():
+            message_queue.get_user_message()
+
+    def stop_blocking_after(stop_event):
+        stop_event.wait()
+        message_queue.wake()
+
+    def blocking_loop(stop):
+        waker = threading.Thread(target=stop_blocking_after, args=(stop,))
+        waker.start()
+        blocking(stop)
+        waker.join()
+
+    legacy = queue.Queue()
+
+    def polling(stop):
+        while not stop.is_set():
+            try:
+                legacy.get(timeout=0.05)
+            except queue.Empty:
+                pass
+
+    blocking_cpu = _cpu_seconds_while(blocking_loop, seconds)
+    polling_cpu = _cpu_seconds_while(polling, seconds)
+    return blocking_cpu / seconds * 100, polling_cpu / seconds * 100
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="消息队列微基准测试")
+    parser.add_argument("--messages", type=int, default=200000, help="每项测试的消息数")
+    parser.add_argument("--output-maxsize", type=int, default=4096, help="输出队列容量")
+    parser.add_argument("--idle-seconds", type=float, default=3.0, help="空闲 CPU 测试时长（秒）")
+    args = parser.parse_args(argv)
+
+    print(f"输入队列（阻塞读取）：{bench_user_messages(args.messages):.2f} µs/条")
+    print(f"输出队列（容量 {args.output_maxsize}，get_many 批量读取）："
+          f"{bench_output_messages(args.messages, args.output_maxsize):.2f} µs/条")
+    blocking, polling = bench_idle_cpu(args.idle_seconds)
+    print(f"空闲 CPU 占用：阻塞等待 {blocking:.3f}%，0.05 秒轮询 {polling:.3f}%")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,224 @@
+"""
+文件翻译基准测试
+生成合成的 MTool JSON 文件，在本地模拟服务器上运行 Translator.translate_from_file，
+统计吞吐量（条/秒）、请求延迟 p50/p99 和峰值内存，并把结果写入 JSON 文件便于比较
+
+用法（在项目根目录执行）：
+    python -m benchmark.run_benchmark --sizes 1000 10000 100000 --slots 4 --token-latency 0.001
+
+指定 --draft-acceptance 时每个规模各跑一次普通解码和模拟的投机解码，报告接受率和加速比；
+指定 --compare-schedule 时先按文件顺序提交请求跑一次，与默认的长条目优先调度比较尾部时间
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from benchmark.fake_llama_server import FakeLlamaServer  # noqa: E402
+
+# 合成文本使用的词汇，全部包含假名，保证不会被 keep_the_same 跳过
+_WORDS = ["はい", "いいえ", "ありがとう", "すみません", "勇者", "まおう", "ポーション", "どうぐ",
+          "ゴールド", "やくそう", "村", "おはよう", "こんばんは", "たたかう", "にげる", "ぼうぎょ"]
+_COMMON_LINES = ["はい", "いいえ", "アレックス", "たたかう", "にげる", "どうぐ", "セーブしますか？"]
+
+
+def generate_mtool_file(path: str, entries: int, repeat_ratio: float = 0.3, seed: int = 0) -> int:
+    """
+    生成合成的 MTool JSON 文件
+    :param path: 输出路径
+    :param entries: 条目数
+    :param repeat_ratio: 值为常见短语（名字、选项等）的比例
+    :param seed: 随机种子
+    :return: 去重后的原文数量
+    """
+    rng = random.Random(seed)
+    data = {}
+    for i in range(entries):
+        if rng.random() < repeat_ratio:
+            text = rng.choice(_COMMON_LINES)
+        else:
+            length = max(1, int(rng.expovariate(1 / 6)))
+            text = "".join(rng.choice(_WORDS) for _ in range(length)) + f"{i}"
+        data[f"{i:07d}_{text[:8]}"] = text
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
+    return len(set(data.values()))
+
+
+def peak_rss_mb() -> float:
+    """当前进程的峰值内存（MB）"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS 单位为字节，Linux 为 KB
+        return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        try:
+            import psutil
+            return psutil.Process().memory_info().peak_wset / (1 << 20)
+        except (ImportError, AttributeError):
+            return 0.0
+
+
+def run_case(file_path: str, api_port: int, overrides: dict) -> dict:
+    """在当前进程中翻译一个文件并返回计时结果（由子进程调用，保证峰值内存互不影响）"""
+    from config_manager import config_manager
+
+    config_manager.load_config(os.path.join(ROOT_DIR, "config.json"))
+    config_manager.set_config("port", api_port)
+    config_manager.set_config("translation_memory", False)
+    for key, value in overrides.items():
+        config_manager.set_config(key, value)
+
+    from inference_metrics import inference_metrics
+    from translator import Translator
+
+    translator = Translator()
+    started = time.perf_counter()
+    with open(file_path, encoding="utf-8") as f:
+        text = f.read()
+    result = translator.translate_from_file(text, "中文")
+    elapsed = time.perf_counter() - started
+
+    entries = len(json.loads(result))
+    return {
+        "entries": entries,
+        "elapsed_s": round(elapsed, 3),
+        "entries_per_s": round(entries / elapsed, 1) if elapsed else 0.0,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "prompt_cache_hit_rate": round(inference_metrics.prompt_cache_stats("translate")["hit_rate"], 3),
+        "draft_acceptance_rate": round(inference_metrics.speculative_stats("translate")["acceptance_rate"], 3),
+    }
+
+
+def _run_child(file_path: str, port: int, overrides: dict) -> dict:
+    """在子进程中运行一个用例，屏蔽翻译过程的逐条日志"""
+    cmd = [sys.executable, "-m", "benchmark.run_benchmark", "--child", file_path,
+           "--port", str(port), "--overrides", json.dumps(overrides)]
+    completed = subprocess.run(cmd, cwd=ROOT_DIR, capture_output=True, text=True, encoding="utf-8")
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr else "子进程失败")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="文件翻译基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="合成文件的条目数")
+    parser.add_argument("--slots", type=int, default=4, help="模拟服务器的槽位数")
+    parser.add_argument("--workers", type=int, default=None, help="并发请求数，默认与槽位数相同")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="每个 token 的生成耗时（秒）")
+    parser.add_argument("--prompt-latency", type=float, default=0.0, help="每个提示词字符的预填充耗时（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="模拟服务器返回错误的概率")
+    parser.add_argument("--batch-size", type=int, default=1, help="批量翻译时每个请求的条目数")
+    parser.add_argument("--compare-schedule", action="store_true",
+                        help="同时测试按文件顺序提交（fifo），与长条目优先比较尾部时间")
+    parser.add_argument("--draft-acceptance", type=float, default=None,
+                        help="模拟投机解码时每个草稿 token 被接受的概率（第一个被拒绝后这一步其余草稿全部丢弃，"
+                             "报告的接受率会低得多），不指定则只测普通解码")
+    parser.add_argument("--draft-max", type=int, default=16, help="模拟投机解码时每步起草的 token 数")
+    parser.add_argument("--draft-latency", type=float, default=0.0, help="草稿模型生成一个 token 的耗时（秒）")
+    parser.add_argument("--output", default="benchmark_results.json", help="结果文件路径")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--overrides", default="{}", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        # 子进程：翻译日志输出到 stderr，最后一行 stdout 为结果
+        stdout = sys.stdout
+        sys.stdout = sys.stderr
+        result = run_case(args.child, args.port, json.loads(args.overrides))
+        stdout.write(json.dumps(result) + "\n")
+        return 0
+
+    overrides = {"parallel": args.slots, "translate_workers": args.workers or args.slots,
+                 "batch_size": args.batch_size}
+    server = FakeLlamaServer(slots=args.slots, token_latency=args.token_latency,
+                             prompt_latency=args.prompt_latency, error_rate=args.error_rate,
+                             draft_max=args.draft_max, draft_latency=args.draft_latency)
+    server.start()
+    # (调度方式, 投机解码接受率)：长条目优先、不使用投机解码的用例是其他用例的比较基线
+    modes = [("longest_first", None)]
+    if args.compare_schedule:
+        modes.insert(0, ("fifo", None))
+    if args.draft_acceptance is not None:
+        modes.append(("longest_first", args.draft_acceptance))
+
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for size in args.sizes:
+            file_path = os.path.join(temp_dir, f"mtool_{size}.json")
+            unique = generate_mtool_file(file_path, size)
+            fifo = baseline = None
+            for schedule, acceptance in modes:
+                server.draft_acceptance = acceptance
+                server.reset_stats()
+                case = _run_child(file_path, server.port, dict(overrides, schedule=schedule))
+                stats = server.get_stats()
+                case.update({
+                    "size": size,
+                    "unique": unique,
+                    "schedule": schedule,
+                    "speculative": acceptance is not None,
+                    "requests": stats["requests"],
+                    "errors": stats["errors"],
+                    "latency_p50_ms": round(stats["latency_p50"] * 1000, 2),
+                    "latency_p99_ms": round(stats["latency_p99"] * 1000, 2),
+                    "tail_ms": round(stats["tail"] * 1000, 2),
+                    "slot_utilization": round(stats["utilization"], 3),
+                })
+                line = (f"{size:>7} 条  去重后 {unique:>7}  {case['entries_per_s']:>9.1f} 条/秒  "
+                        f"p50 {case['latency_p50_ms']:>7.2f} ms  p99 {case['latency_p99_ms']:>7.2f} ms  "
+                        f"峰值内存 {case['peak_rss_mb']:>7.1f} MB  提示词缓存命中率 {case['prompt_cache_hit_rate']:.1%}  "
+                        f"尾部 {case['tail_ms']:>8.2f} ms  槽位利用率 {case['slot_utilization']:.1%}  [{schedule}]")
+                if schedule == "fifo":
+                    fifo = case
+                elif acceptance is None:
+                    baseline = case
+                    if fifo is not None:
+                        case["tail_reduction_ms"] = round(fifo["tail_ms"] - case["tail_ms"], 2)
+                        case["speedup_vs_fifo"] = (round(fifo["elapsed_s"] / case["elapsed_s"], 2)
+                                                   if case["elapsed_s"] else 0.0)
+                        line += (f"  尾部缩短 {case['tail_reduction_ms']:.2f} ms  "
+                                 f"相对 fifo 加速比 {case['speedup_vs_fifo']:.2f}x")
+                else:
+                    case["speedup"] = round(baseline["elapsed_s"] / case["elapsed_s"], 2) if case["elapsed_s"] else 0.0
+                    line += f"  [投机解码] 接受率 {case['draft_acceptance_rate']:.1%}  加速比 {case['speedup']:.2f}x"
+                results.append(case)
+                print(line)
+
+    server.stop()
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "settings": {
+            "slots": args.slots,
+            "workers": args.workers or args.slots,
+            "token_latency": args.token_latency,
+            "prompt_latency": args.prompt_latency,
+            "error_rate": args.error_rate,
+            "batch_size": args.batch_size,
+            "compare_schedule": args.compare_schedule,
+            "draft_acceptance": args.draft_acceptance,
+            "draft_max": args.draft_max,
+            "draft_latency": args.draft_latency,
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
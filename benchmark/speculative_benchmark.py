@@ -0,0 +1,121 @@
+"""
+投机解码基准测试
+在本机分别以不使用草稿模型和使用草稿模型的方式临时启动 llama-server，发送相同的提示词，
+比较生成速度并统计草稿 token 的接受率，用来判断投机解码在这台机器上是否划算
+
+用法（在项目根目录执行，草稿模型默认取 config.json 中的 draft_model）：
+    python -m benchmark.speculative_benchmark --draft-model models/qwen3-0.6b-q8_0.gguf
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+# 翻译和对话中常见的几类输出：投机解码对可预测的文本收益更大
+PROMPTS = [
+    "把下面的句子翻译成中文：The hero drew his sword and stepped into the dark cave.",
+    "把下面的句子翻译成中文：勇者は剣を抜いて、暗い洞窟へと足を踏み入れた。",
+    "用三句话介绍一下 llama.cpp 是什么。",
+    "列出一周七天的英文名称，每行一个。",
+]
+
+
+def run_pass(draft_model: str, max_tokens: int, repeat: int) -> dict:
+    """启动一个 llama-server，依次发送全部提示词，返回汇总的生成速度和接受率"""
+    from config_manager import config_manager
+    from http_client import http_client
+    from llama_server import LlamaServer
+
+    server = LlamaServer(
+        draft_model=draft_model,
+        port=config_manager.get_config("calibration_port", config_manager.get_port() + 100)
+    )
+    server.start()
+    try:
+        url = f"{server.base_url}/v1/chat/completions"
+        predicted = drafted = accepted = 0
+        predicted_ms = 0.0
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for prompt in PROMPTS:
+                payload = {
+                    "model": "qwen3-4b",
+                    "messages": [{"role": "user", "content": prompt}],
+                    "max_tokens": max_tokens,
+                    "temperature": 0,
+                    "cache_prompt": False
+                }
+                response = http_client.post(url, payload, wait_ready=False)
+                response.raise_for_status()
+                timings = response.json().get("timings", {})
+                predicted += timings.get("predicted_n", 0)
+                predicted_ms += timings.get("predicted_ms", 0.0)
+                drafted += timings.get("draft_n", 0)
+                accepted += timings.get("draft_n_accepted", 0)
+        elapsed = time.perf_counter() - started
+    finally:
+        server.stop()
+
+    return {
+        "draft_model": draft_model,
+        "requests": repeat * len(PROMPTS),
+        "elapsed_s": round(elapsed, 3),
+        "predicted_tokens": predicted,
+        "gen_tokens_per_s": round(predicted / (predicted_ms / 1000), 2) if predicted_ms else 0.0,
+        "draft_tokens": drafted,
+        "draft_accepted_tokens": accepted,
+        "acceptance_rate": round(accepted / drafted, 3) if drafted else 0.0,
+    }
+
+
+def main(argv=None) -> int:
+    from config_manager import config_manager
+
+    parser = argparse.ArgumentParser(description="投机解码基准测试")
+    parser.add_argument("--draft-model", default=None, help="草稿模型路径，默认使用配置中的 draft_model")
+    parser.add_argument("--max-tokens", type=int, default=128, help="每个请求生成的 token 数")
+    parser.add_argument("--repeat", type=int, default=3, help="每个提示词重复的次数")
+    parser.add_argument("--output", default="speculative_results.json", help="结果文件路径")
+    args = parser.parse_args(argv)
+
+    config_manager.load_config(os.path.join(ROOT_DIR, "config.json"))
+    draft_model = args.draft_model or config_manager.get_draft_model()
+    if not draft_model:
+        print("未指定草稿模型：请使用 --draft-model 或在 config.json 中设置 draft_model")
+        return 2
+
+    baseline = run_pass("", args.max_tokens, args.repeat)
+    print(f"基线      生成 {baseline['gen_tokens_per_s']:>8.2f} tokens/秒  总耗时 {baseline['elapsed_s']:.2f} 秒")
+    speculative = run_pass(draft_model, args.max_tokens, args.repeat)
+    speedup = (speculative["gen_tokens_per_s"] / baseline["gen_tokens_per_s"]
+               if baseline["gen_tokens_per_s"] else 0.0)
+    print(f"投机解码  生成 {speculative['gen_tokens_per_s']:>8.2f} tokens/秒  总耗时 {speculative['elapsed_s']:.2f} 秒  "
+          f"接受率 {speculative['acceptance_rate']:.1%}  加速比 {speedup:.2f}x")
+    if speedup < 1:
+        print("投机解码在这台机器上没有加速，建议不设置 draft_model")
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "settings": {
+            "draft_max": config_manager.get_draft_max(),
+            "draft_min": config_manager.get_draft_min(),
+            "max_tokens": args.max_tokens,
+            "repeat": args.repeat,
+        },
+        "baseline": baseline,
+        "speculative": speculative,
+        "speedup": round(speedup, 2),
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
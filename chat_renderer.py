@@ -0,0 +1,91 @@
+"""
+对话窗口的流式渲染
+后台线程写入消息时通过 Qt 信号唤醒界面线程，逐 token 到达的回复先缓冲，
+每帧最多合并为一次文档编辑，避免快速生成时界面卡顿
+"""
+import threading
+import time
+from typing import Dict, List
+
+from PySide6.QtCore import QObject, QTimer, Signal
+from PySide6.QtGui import QTextCursor
+from PySide6.QtWidgets import QTextEdit
+
+# 刷新间隔，约等于 60 帧每秒
+FRAME_INTERVAL_MS = 16
+
+
+class MessageNotifier(QObject):
+    """
+    跨线程唤醒界面线程
+    界面线程处理之前的重复通知会合并为一次信号，不会把事件队列塞满
+    """
+    message_available = Signal()
+
+    def __init__(self, parent: QObject = None):
+        super().__init__(parent)
+        self._pending = threading.Event()
+
+    def notify(self):
+        """由后台线程在写入消息后调用"""
+        if not self._pending.is_set():
+            self._pending.set()
+            self.message_available.emit()
+
+    def acknowledge(self):
+        """界面线程开始读取消息前调用，之后写入的消息会再次触发信号"""
+        self._pending.clear()
+
+
+class StreamingTextRenderer:
+    """把流式 token 缓冲后按帧追加到 QTextEdit 末尾，并统计渲染耗时"""
+
+    def __init__(self, text_edit: QTextEdit, frame_interval_ms: int = FRAME_INTERVAL_MS):
+        self._text_edit = text_edit
+        self._buffer: List[str] = []
+        self._timer = QTimer(text_edit)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(frame_interval_ms)
+        self._timer.timeout.connect(self.flush)
+
+        self._tokens = 0
+        self._flushes = 0
+        self._render_seconds = 0.0
+        self._max_flush_seconds = 0.0
+
+    def append(self, text: str):
+        """缓冲一段回复，在下一帧统一写入"""
+        self._buffer.append(text)
+        self._tokens += 1
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def flush(self):
+        """立即把缓冲的内容写入文档；插入其他内容前需要先调用以保持顺序"""
+        self._timer.stop()
+        if not self._buffer:
+            return
+        started = time.perf_counter()
+        text = "".join(self._buffer)
+        self._buffer.clear()
+
+        cursor = self._text_edit.textCursor()
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        cursor.insertText(text)
+        self._text_edit.setTextCursor(cursor)
+        self._text_edit.ensureCursorVisible()
+
+        elapsed = time.perf_counter() - started
+        self._flushes += 1
+        self._render_seconds += elapsed
+        self._max_flush_seconds = max(self._max_flush_seconds, elapsed)
+
+    def get_stats(self) -> Dict[str, float]:
+        """渲染统计：token 数、文档编辑次数、平均每个 token 的渲染耗时和单次编辑最大耗时"""
+        return {
+            "tokens": self._tokens,
+            "flushes": self._flushes,
+            "render_ms": round(self._render_seconds * 1000, 3),
+            "us_per_token": round(self._render_seconds * 1e6 / self._tokens, 2) if self._tokens else 0.0,
+            "max_flush_ms": round(self._max_flush_seconds * 1000, 3),
+        }
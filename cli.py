@@ -0,0 +1,348 @@
+"""
+命令行批量翻译
+不启动界面，翻译目录或通配符匹配到的全部文件，结果保存为与界面相同的 *_translated.txt。
+解析、翻译、写入三个阶段流水线执行：翻译当前文件的同时解析下一个文件、写入上一个文件。
+多个文件的请求共用一个线程池，一个文件收尾时空闲的槽位会接着翻译下一个文件
+
+用法（在项目根目录执行）：
+    python cli.py game/data --lang 中文 --output-dir translated
+    python cli.py "game/data/*.json" --lang 英文 --output-dir translated --no-server
+"""
+import argparse
+import fnmatch
+import glob
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from config_manager import config_manager
+
+# 退出码
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_INTERRUPTED = 130
+
+# 本程序自己生成的文件，扫描目录时跳过
+_GENERATED_SUFFIXES = ("_translated.txt", "_temp.txt", "_journal.jsonl")
+# 流水线阶段之间最多积压的文件数，限制同时驻留在内存中的已解析文件
+PIPELINE_DEPTH = 1
+
+
+@dataclass
+class FileResult:
+    """一个文件的翻译结果"""
+    path: str
+    output: str
+    status: str = "ok"  # ok / partial / failed / skipped
+    entries: int = 0
+    errors: int = 0
+    avoided_calls: int = 0
+    seconds: float = 0.0
+    message: str = ""
+
+
+def collect_inputs(inputs: List[str], pattern: str) -> List[Tuple[str, str, bool]]:
+    """
+    展开命令行中的目录、文件和通配符
+    :return: (文件路径, 计算输出相对路径的基准目录, 是否由用户直接指定) 的列表，已去重并排序
+    """
+    found = {}
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, dirs, files in os.walk(item):
+                dirs.sort()
+                for name in files:
+                    if fnmatch.fnmatch(name, pattern) and not name.endswith(_GENERATED_SUFFIXES):
+                        found.setdefault(os.path.join(root, name), (item, False))
+        elif os.path.isfile(item):
+            found[item] = (os.path.dirname(item), True)
+        else:
+            for path in glob.glob(item, recursive=True):
+                if os.path.isfile(path) and not os.path.basename(path).endswith(_GENERATED_SUFFIXES):
+                    found.setdefault(path, (os.path.dirname(path), True))
+    return sorted((path, base, explicit) for path, (base, explicit) in found.items())
+
+
+def output_path_for(path: str, base: str, output_dir: str) -> str:
+    """输出文件路径：保留输入相对于基准目录的子目录结构，文件名与界面保存的一致"""
+    relative_dir = os.path.relpath(os.path.dirname(os.path.abspath(path)), os.path.abspath(base))
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.normpath(os.path.join(output_dir, relative_dir, f"{stem}_translated.txt"))
+
+
+class BatchTranslator:
+    """三阶段流水线：解析线程 -> 翻译（调用线程）-> 写入线程，阶段之间用有界队列连接"""
+
+    def __init__(self, target_lang: str, output_dir: str):
+        from translator import Translator
+
+        self.target_lang = target_lang
+        self.output_dir = output_dir
+        self.translator = Translator()
+        self.results: List[FileResult] = []
+        # 正在翻译的文件的处理器，取消时全部中断
+        self._active = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def run(self, files: List[Tuple[str, str, bool]]) -> List[FileResult]:
+        """翻译全部文件，返回每个文件的结果（按完成顺序）"""
+        parsed = queue.Queue(maxsize=PIPELINE_DEPTH)
+        finished = queue.Queue(maxsize=PIPELINE_DEPTH)
+        parser = threading.Thread(target=self._parse_stage, args=(files, parsed), daemon=True, name="cli-parse")
+        writer = threading.Thread(target=self._write_stage, args=(finished,), daemon=True, name="cli-write")
+        parser.start()
+        writer.start()
+        try:
+            self._translate_stage(parsed, finished, len(files))
+        finally:
+            finished.put(None)
+            writer.join()
+        return self.results
+
+    def cancel(self):
+        """停止翻译：正在翻译的文件的进行中请求立即关闭，断点日志保留，下次从断点继续"""
+        with self._lock:
+            self._stop.set()
+            handlers = list(self._active)
+        for handler in handlers:
+            handler.cancel()
+
+    def _parse_stage(self, files, parsed: queue.Queue):
+        try:
+            for path, base, explicit in files:
+                if self._stop.is_set():
+                    break
+                parsed.put(self._parse_file(path, base, explicit))
+        finally:
+            # 无论解析阶段如何结束都要通知翻译阶段，否则翻译阶段会一直等待
+            parsed.put(None)
+
+    def _parse_file(self, path: str, base: str, explicit: bool):
+        """解析一个文件，失败时只记录在结果中，不影响后面的文件"""
+        result = FileResult(path=path, output=output_path_for(path, base, self.output_dir))
+        started = time.perf_counter()
+        from translator import UnsupportedFormat
+
+        handler = None
+        try:
+            handler = self.translator.create_handler(path)
+        except UnsupportedFormat as e:
+            # 扫描目录时遇到不支持的格式只跳过，用户直接指定的文件算作失败
+            result.status = "failed" if explicit else "skipped"
+            result.message = str(e)
+        except ValueError as e:
+            result.status = "failed"
+            result.message = str(e)
+        except OSError as e:
+            result.status = "failed"
+            result.message = f"无法读取文件：{e}"
+        except Exception as e:
+            # 嵌套过深等异常的文件
+            result.status = "failed"
+            result.message = f"解析失败：{type(e).__name__}: {e}"
+        result.seconds = time.perf_counter() - started
+        return result, handler
+
+    def _translate_stage(self, parsed: queue.Queue, finished: queue.Queue, total: int):
+        """
+        最多同时翻译 translate_workers 个文件，全部请求提交到同一个线程池：
+        大文件的请求按顺序排在前面，收尾阶段空出来的线程接着处理下一个文件的请求，
+        小文件则可以同时各占一个槽位
+        """
+        workers = config_manager.get_translate_workers()
+        in_flight = threading.Semaphore(workers)
+        index = 0
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="translate") as executor, \
+                ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cli-file") as files:
+            while True:
+                item = parsed.get()
+                if item is None:
+                    return
+                result, handler = item
+                index += 1
+                if handler is None:
+                    finished.put((result, None, None))
+                    continue
+
+                # 限制同时驻留在内存中的文件数，正在翻译的文件完成后才开始下一个
+                in_flight.acquire()
+                with self._lock:
+                    if self._stop.is_set():
+                        in_flight.release()
+                        handler.close()
+                        return
+                    self._active.add(handler)
+                print(f"[{index}/{total}] 正在翻译 {result.path}")
+                files.submit(self._translate_file, result, handler, executor, finished, in_flight)
+
+    def _translate_file(self, result: FileResult, handler, executor: ThreadPoolExecutor,
+                        finished: queue.Queue, in_flight: threading.Semaphore):
+        from http_client import RequestCancelled
+        from translation_journal import TranslationJournal
+
+        started = time.perf_counter()
+        journal = None
+        try:
+            journal = TranslationJournal.for_input(
+                result.path, self.target_lang, config_manager.get_config("journal_flush_every", 20)
+            )
+            journal.open()
+            handler.translate_loaded(self.target_lang, journal=journal, serialize=False, executor=executor)
+        except RequestCancelled:
+            result.status = "failed"
+            result.message = "已取消"
+        except Exception as e:
+            result.status = "failed"
+            result.message = str(e)
+        finally:
+            with self._lock:
+                self._active.discard(handler)
+            if journal is not None:
+                journal.close()
+            result.seconds += time.perf_counter() - started
+            finished.put((result, handler, journal))
+            in_flight.release()
+
+    def _write_stage(self, finished: queue.Queue):
+        from handler.base import ERROR_PREFIX
+
+        while True:
+            item = finished.get()
+            if item is None:
+                return
+            result, handler, journal = item
+            if handler is not None and result.status == "ok":
+                started = time.perf_counter()
+                try:
+                    result.entries = handler.get_total()
+                    result.avoided_calls = handler.classification.get("avoided_calls", 0)
+                    result.errors = sum(
+                        1 for i in range(result.entries) if handler.get_text(i).startswith(ERROR_PREFIX)
+                    )
+                    os.makedirs(os.path.dirname(result.output) or ".", exist_ok=True)
+                    handler.write_to(result.output)
+                    if result.errors:
+                        # 有条目失败时保留断点日志，重新运行只会重试失败的条目
+                        result.status = "partial"
+                        result.message = f"{result.errors} 条翻译失败"
+                    else:
+                        journal.discard()
+                except Exception as e:
+                    result.status = "failed"
+                    result.message = f"保存文件失败：{e}"
+                result.seconds += time.perf_counter() - started
+            if handler is not None:
+                # 写出之后释放原文件，文本处理器映射的文件不会一直被占用
+                handler.close()
+            self.results.append(result)
+            print(format_result(result))
+
+
+def format_result(result: FileResult) -> str:
+    """一个文件的摘要行"""
+    line = f"  {result.status:<8} {result.path}"
+    if result.status in ("ok", "partial"):
+        line += f" -> {result.output}（{result.entries} 条，{result.seconds:.2f} 秒）"
+    if result.message:
+        line += f"  {result.message}"
+    return line
+
+
+def print_summary(results: List[FileResult], elapsed: float):
+    """按状态汇总并列出失败的文件"""
+    counts = {}
+    for result in results:
+        counts[result.status] = counts.get(result.status, 0) + 1
+    entries = sum(r.entries for r in results)
+    print(f"\n共 {len(results)} 个文件：成功 {counts.get('ok', 0)}，部分失败 {counts.get('partial', 0)}，"
+          f"失败 {counts.get('failed', 0)}，跳过 {counts.get('skipped', 0)}；"
+          f"{entries} 条，用时 {elapsed:.1f} 秒（{entries / elapsed if elapsed else 0:.1f} 条/秒），"
+          f"预分类少请求模型 {sum(r.avoided_calls for r in results)} 次")
+    for result in results:
+        if result.status in ("partial", "failed"):
+            print(format_result(result))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="命令行批量翻译文件（不启动界面）")
+    parser.add_argument("inputs", nargs="+", help="要翻译的目录、文件或通配符（如 \"data/**/*.json\"）")
+    parser.add_argument("--lang", default="中文", help="目标语言，默认中文")
+    parser.add_argument("--output-dir", required=True, help="译文输出目录，保留输入目录的子目录结构")
+    parser.add_argument("--pattern", default="*", help="扫描目录时只翻译匹配的文件名，默认全部")
+    parser.add_argument("--config", default="config.json", help="配置文件路径")
+    parser.add_argument("--no-server", action="store_true", help="不启动 llama-server，使用已经在运行的服务器")
+    parser.add_argument("--verbose", action="store_true", help="逐条打印原文和译文")
+    args = parser.parse_args(argv)
+
+    try:
+        config_manager.load_config(args.config)
+    except (FileNotFoundError, ValueError) as e:
+        print(e, file=sys.stderr)
+        return EXIT_USAGE
+    config_manager.set_config("log_entries", args.verbose)
+
+    files = collect_inputs(args.inputs, args.pattern)
+    if not files:
+        print("没有找到要翻译的文件", file=sys.stderr)
+        return EXIT_USAGE
+    outputs = {}
+    for path, base, _ in files:
+        output = output_path_for(path, base, args.output_dir)
+        if output in outputs:
+            print(f"{path} 与 {outputs[output]} 的输出文件相同：{output}", file=sys.stderr)
+            return EXIT_USAGE
+        outputs[output] = path
+    print(f"找到 {len(files)} 个文件，目标语言：{args.lang}")
+
+    server = None
+    if not args.no_server:
+        from server_pool import ServerPool
+
+        # 模型在后台加载，加载期间先解析文件，翻译请求排队等待
+        server = ServerPool()
+        server.start_in_background(on_error=lambda error: print(f"llama-server 启动失败：{error}", file=sys.stderr))
+
+    batch = BatchTranslator(args.lang, args.output_dir)
+    started = time.perf_counter()
+    interrupted = False
+    done = threading.Event()
+
+    def translate():
+        try:
+            batch.run(files)
+        finally:
+            done.set()
+
+    try:
+        worker = threading.Thread(target=translate, name="cli-translate")
+        worker.start()
+        # 主线程保持可中断，Ctrl+C 时取消翻译；
+        # Thread.join 被 Ctrl+C 打断后 is_alive() 会错误地返回 False，所以等待事件而不是线程
+        while not done.wait(0.5):
+            pass
+    except KeyboardInterrupt:
+        interrupted = True
+        print("\n正在停止，已完成的条目保存在断点日志中，下次运行时从断点继续...")
+        batch.cancel()
+        done.wait()
+    finally:
+        if server is not None:
+            server.stop()
+
+    print_summary(batch.results, time.perf_counter() - started)
+    if interrupted:
+        return EXIT_INTERRUPTED
+    if any(result.status in ("failed", "partial") for result in batch.results):
+        return EXIT_FAILED
+    return EXIT_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,6 @@
 import json
-from typing import Dict, Any
+import os
+from typing import Dict, Any, List, Optional
 
 
 class ConfigManager:
@@ -9,6 +10,9 @@ class ConfigManager:
     """
     _instance = None
     _config_data: Dict[str, Any] = None
+    _config_path: str = "config.json"
+    # 运行时用 set_config 做的修改，换用新读取的配置时仍然保留
+    _overrides: Dict[str, Any] = None
 
     def __new__(cls):
         if cls._instance is None:
@@ -25,12 +29,32 @@ class ConfigManager:
             try:
                 with open(config_path, "r", encoding="utf-8") as f:
                     self._config_data = json.load(f)
+                self._config_path = config_path
             except FileNotFoundError:
                 raise FileNotFoundError(f"配置文件 {config_path} 不存在")
             except json.JSONDecodeError:
                 raise ValueError(f"配置文件 {config_path} 格式错误")
         return self._config_data
 
+    def read_file(self) -> "ConfigSnapshot":
+        """
+        重新读取配置文件，返回独立的配置对象，当前配置保持不变；运行时用 set_config 做的修改同样叠加在上面
+        :return: 可以使用全部 get_ 方法的配置对象，用 apply 换成当前配置
+        """
+        try:
+            with open(self._config_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"配置文件 {self._config_path} 不存在")
+        except json.JSONDecodeError:
+            raise ValueError(f"配置文件 {self._config_path} 格式错误")
+        data.update(self._overrides or {})
+        return ConfigSnapshot(data, self._config_path)
+
+    def apply(self, snapshot: "ConfigManager"):
+        """换成 read_file 读到的配置，运行时用 set_config 做的修改仍然保留"""
+        self._config_data = dict(snapshot.get_config(), **(self._overrides or {}))
+
     def get_config(self, key: str = None, default=None):
         """
         获取配置值
@@ -46,6 +70,23 @@ class ConfigManager:
             return self._config_data
         return self._config_data.get(key, default)
 
+    def set_config(self, key: str, value):
+        """
+        在运行时修改配置值（不写回配置文件）
+        :param key: 配置键名
+        :param value: 配置值
+        """
+        if self._config_data is None:
+            self.load_config()
+        self._config_data[key] = value
+        if self._overrides is None:
+            self._overrides = {}
+        self._overrides[key] = value
+
+    def get_config_dir(self) -> str:
+        """获取配置文件所在目录"""
+        return os.path.dirname(os.path.abspath(self._config_path))
+
     def get_model_path(self) -> str:
         """获取模型路径"""
         return self.get_config("model", "")
@@ -58,15 +99,95 @@ class ConfigManager:
         """获取线程数"""
         return self.get_config("threads", 8)
 
+    def get_parallel(self) -> int:
+        """获取 llama-server 的并行槽位数（--parallel）"""
+        return self.get_config("parallel", 1)
+
+    def get_translate_workers(self) -> int:
+        """获取文件翻译的并发请求数，默认与全部实例的槽位总数一致"""
+        return self.get_config("translate_workers", self.get_parallel() * len(self.get_instances()))
+
+    def get_slot_affinity(self) -> bool:
+        """是否把请求固定到 llama-server 的槽位上以复用提示词缓存"""
+        return self.get_config("slot_affinity", True)
+
+    def get_chat_slot(self) -> int:
+        """对话使用的槽位，默认为最后一个槽位"""
+        return self.get_config("chat_slot", self.get_parallel() - 1)
+
+    def get_batch_size(self) -> int:
+        """获取批量翻译时单个请求最多包含的条目数，1 表示关闭批量模式"""
+        return self.get_config("batch_size", 1)
+
+    def get_batch_max_chars(self) -> int:
+        """获取可以参与批量翻译的条目最大字符数，更长的条目单独翻译"""
+        return self.get_config("batch_max_chars", 40)
+
+    def get_draft_model(self) -> str:
+        """获取投机解码使用的草稿模型路径，为空时不启用投机解码"""
+        return self.get_config("draft_model", "")
+
+    def get_draft_max(self) -> int:
+        """获取投机解码每步最多起草的 token 数"""
+        return self.get_config("draft_max", 16)
+
+    def get_draft_min(self) -> int:
+        """获取投机解码每步最少起草的 token 数"""
+        return self.get_config("draft_min", 0)
+
+    def get_draft_p_min(self) -> Optional[float]:
+        """获取投机解码继续起草所需的最低概率（--draft-p-min），为 None 时使用 llama-server 的默认值"""
+        return self.get_config("draft_p_min")
+
     def get_port(self) -> int:
         """获取端口号"""
         return self.get_config("port", 8080)
 
+    def get_instances(self) -> List[Dict[str, Any]]:
+        """
+        获取 llama-server 实例列表，实例使用从 port 开始的连续端口
+        instances 可以是实例数，此时线程数平均分配，pin_instances 为 true 时按连续的 CPU 编号分组绑定；
+        也可以是列表，逐个指定 threads、cpus（CPU 编号列表）和 port
+        :return: 每个实例的 port、threads、cpus，未指定的 threads / cpus 为 None
+        """
+        instances = self.get_config("instances", 1)
+        if isinstance(instances, int):
+            count = max(1, instances)
+            threads = max(1, self.get_threads() // count) if count > 1 else None
+            cpus_per_instance = (os.cpu_count() or count) // count
+            instances = []
+            for i in range(count):
+                cpus = None
+                if count > 1 and self.get_config("pin_instances", False) and cpus_per_instance:
+                    cpus = list(range(i * cpus_per_instance, (i + 1) * cpus_per_instance))
+                instances.append({"threads": threads, "cpus": cpus})
+
+        port = self.get_port()
+        return [
+            {
+                "port": instance.get("port", port + i),
+                "threads": instance.get("threads"),
+                "cpus": instance.get("cpus"),
+            }
+            for i, instance in enumerate(instances)
+        ]
+
     def get_api_url(self) -> str:
         """获取API URL"""
         port = self.get_port()
         return f"http://127.0.0.1:{port}/v1/chat/completions"
 
 
+class ConfigSnapshot(ConfigManager):
+    """某一时刻读取的配置，与全局配置相互独立"""
+
+    def __new__(cls, data: Dict[str, Any], config_path: str):
+        return object.__new__(cls)
+
+    def __init__(self, data: Dict[str, Any], config_path: str):
+        self._config_data = data
+        self._config_path = config_path
+
+
 # 全局配置实例
 config_manager = ConfigManager()
\ No newline at end of file
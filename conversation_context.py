@@ -0,0 +1,144 @@
+"""
+对话上下文管理
+按 token 数而不是消息条数裁剪对话历史：始终保留系统提示词，从最早的轮次开始丢弃，
+并为回复预留空间，保证请求不会超出槽位的上下文长度
+"""
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+from config_manager import config_manager
+from http_client import http_client
+from server_router import server_router
+
+DEFAULT_SYSTEM_PROMPT = "你是一个智能AI助手，能够进行自然对话。"
+# 每条消息的角色标记和分隔符在聊天模板中大致占用的 token 数
+MESSAGE_OVERHEAD_TOKENS = 4
+# 回复预留的最少 token 数
+MIN_REPLY_TOKENS = 256
+# 超出预算时裁剪到预算的这个比例，之后若干轮都不必再裁剪，请求前缀保持不变，
+# 槽位中的 KV cache 可以继续复用
+DEFAULT_TRIM_RATIO = 0.6
+
+
+class TokenCounter:
+    """
+    token 计数
+    优先调用 llama-server 的 /tokenize 接口，服务器不可用时按字符粗略估算；结果按文本缓存
+    """
+
+    def __init__(self, api_url: str, cache_size: int = 1024):
+        parts = urlsplit(api_url)
+        self.tokenize_url = f"{parts.scheme}://{parts.netloc}/tokenize"
+        self._cache: "OrderedDict[str, int]" = OrderedDict()
+        self._cache_size = cache_size
+
+    def count(self, text: str) -> int:
+        """计算文本的 token 数"""
+        cached = self._cache.get(text)
+        if cached is not None:
+            self._cache.move_to_end(text)
+            return cached
+
+        try:
+            # 由本程序启动的服务器可能在切换模型后换了端口，通过路由选择当前的实例
+            with server_router.lease(prefer=config_manager.get_config("chat_instance", 0)) as base_url:
+                url = f"{base_url}/tokenize" if base_url else self.tokenize_url
+                response = http_client.post(url, {"content": text}, timeout=2)
+            response.raise_for_status()
+            tokens = len(response.json()["tokens"])
+        except Exception:
+            # 估算值不缓存，服务器恢复后重新获取准确值
+            return self.estimate(text)
+
+        self._cache[text] = tokens
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+        return tokens
+
+    @staticmethod
+    def estimate(text: str) -> int:
+        """粗略估算：中日韩字符每字 1 个 token，其他字符每 3 个算 1 个 token（偏保守）"""
+        wide = sum(1 for ch in text if ord(ch) >= 0x2E80)
+        return wide + (len(text) - wide + 2) // 3
+
+
+class ConversationContext:
+    """带 token 预算的对话历史"""
+
+    def __init__(self, api_url: str, system_prompt: str = DEFAULT_SYSTEM_PROMPT,
+                 counter: Optional[TokenCounter] = None):
+        self.system_prompt = system_prompt
+        self.counter = counter or TokenCounter(api_url)
+        self._messages: List[Dict[str, str]] = []
+        self._tokens: List[int] = []
+        self._system_tokens: Optional[int] = None
+
+    @property
+    def budget(self) -> int:
+        """单次请求可用的上下文长度，默认为一个槽位的上下文长度"""
+        default = config_manager.get_ctx_size() // max(1, config_manager.get_parallel())
+        return config_manager.get_config("chat_context_tokens", default)
+
+    @property
+    def reply_tokens(self) -> int:
+        """为回复预留的 token 数"""
+        default = max(MIN_REPLY_TOKENS, self.budget // 4)
+        return config_manager.get_config("chat_reply_tokens", default)
+
+    @property
+    def messages(self) -> List[Dict[str, str]]:
+        """完整的对话历史（不含系统提示词）"""
+        return list(self._messages)
+
+    def _count(self, content: str) -> int:
+        return self.counter.count(content) + MESSAGE_OVERHEAD_TOKENS
+
+    def add(self, role: str, content: str):
+        """追加一条消息"""
+        self._messages.append({"role": role, "content": content})
+        self._tokens.append(self._count(content))
+
+    def clear(self):
+        """清空对话历史，系统提示词保留"""
+        self._messages.clear()
+        self._tokens.clear()
+
+    def build_messages(self) -> List[Dict[str, str]]:
+        """
+        构造请求的消息列表：系统提示词 + 放得下的最近若干轮对话
+        超出预算时从最早的轮次开始删除，直到降到 chat_trim_ratio 对应的水位
+        """
+        if self._system_tokens is None:
+            self._system_tokens = self._count(self.system_prompt)
+        available = self.budget - self.reply_tokens - self._system_tokens
+
+        if sum(self._tokens) <= available:
+            return [{"role": "system", "content": self.system_prompt}] + self._messages
+
+        # 每次只丢弃刚好超出的部分会让请求前缀每轮都变化，整段历史都要重新计算；
+        # 因此一次裁剪到更低的水位
+        target = int(available * config_manager.get_config("chat_trim_ratio", DEFAULT_TRIM_RATIO))
+        start = len(self._messages)
+        used = 0
+        while start > 0 and used + self._tokens[start - 1] <= target:
+            start -= 1
+            used += self._tokens[start]
+        # 最新的一条消息无论多长都要发送
+        if start == len(self._messages) and self._messages:
+            start -= 1
+            if self._tokens[start] > available:
+                print(f"警告: 最新消息约 {self._tokens[start]} tokens，超出上下文预算 {available}")
+        # 从用户消息开始，避免以一条孤立的助手回复开头
+        while start < len(self._messages) - 1 and self._messages[start]["role"] != "user":
+            start += 1
+        if start > 0:
+            print(f"对话历史超出上下文预算，丢弃最早的 {start} 条消息")
+            del self._messages[:start]
+            del self._tokens[:start]
+
+        return [{"role": "system", "content": self.system_prompt}] + self._messages
+
+    def summary(self) -> str:
+        """对话历史摘要"""
+        return f"当前对话轮次: {sum(1 for m in self._messages if m['role'] == 'user')}"
@@ -2,12 +2,15 @@
 AI对话工作线程
 负责处理用户输入并与LlamaServer进行对话
 """
-import json
 import requests
-import threading
 import time
 from typing import Optional, Dict, Any
-from message_queue import MessageQueue, QueueProcessor, MessageType
+from config_manager import config_manager
+from conversation_context import ConversationContext
+from http_client import CancelScope, RequestCancelled, http_client
+from server_router import server_router
+from inference_metrics import inference_metrics
+from message_queue import MessageQueue, QueueProcessor
 
 
 class AIConversationWorker(QueueProcessor):
@@ -16,20 +19,20 @@ class AIConversationWorker(QueueProcessor):
     def __init__(self, message_queue: MessageQueue, api_url: str):
         super().__init__(message_queue)
         self.api_url = api_url
-        self.session_history = []  # 对话历史记录
-        self.max_history_length = 10  # 最大历史记录长度
+        self.context = ConversationContext(api_url)  # 按 token 预算裁剪的对话历史
+        self._current_scope: Optional[CancelScope] = None  # 正在进行的请求
         
     def _run(self):
         """主运行循环"""
         print("AI对话工作线程已启动")
         
         # 发送系统启动消息
-        self.message_queue.put_system_message("AI助手已准备就绪，可以开始对话了")
+        self.message_queue.put_system_message("AI助手已启动，模型加载完成前发送的消息会排队等待")
         
         while not self._stop_event.is_set():
             try:
-                # 从输入队列获取用户消息，使用更短的超时时间以便更快响应停止信号
-                user_message = self.message_queue.get_user_message(timeout=0.05)
+                # 阻塞等待用户消息，stop() 时会被唤醒并返回 None
+                user_message = self.message_queue.get_user_message()
                 
                 if user_message:
                     self._process_user_message(user_message)
@@ -48,62 +51,57 @@ class AIConversationWorker(QueueProcessor):
             user_input = message.content
             
             # 添加到对话历史
-            self.session_history.append({"role": "user", "content": user_input})
-            
-            # 保持历史记录在合理范围内
-            if len(self.session_history) > self.max_history_length:
-                # 保留系统消息和最近的几条对话
-                self.session_history = self.session_history[-self.max_history_length:]
-                
-            # 构造API请求
+            self.context.add("user", user_input)
+
+            # 构造API请求：系统提示词 + 放得下的最近对话，并为回复预留空间
             payload = {
                 "model": "qwen3-4b",
-                "messages": self.session_history,
-                "stream": True  # 启用流式输出
+                "messages": self.context.build_messages(),
+                "max_tokens": self.context.reply_tokens,
+                # 对话固定在一个槽位上，历史前缀不变时无需重新计算
+                "cache_prompt": True
             }
             
-            # 发送请求到LlamaServer
-            response = requests.post(
-                self.api_url,
-                json=payload,
-                stream=True,
-                timeout=(5, 30)  # 连接超时5秒，读取超时30秒
-            )
-            response.raise_for_status()
-            
-            # 处理流式响应
+            # 发送请求到LlamaServer并处理流式响应
+            scope = CancelScope()
+            self._current_scope = scope
             ai_response = ""
-            for line in response.iter_lines():
-                if line:
-                    try:
-                        # 解析流式响应
-                        decoded_line = line.decode('utf-8')
-                        if decoded_line.startswith('data: '):
-                            data_str = decoded_line[6:]  # 移除 'data: ' 前缀
-                            if data_str.strip() == '[DONE]':
-                                break
-                                
-                            chunk_data = json.loads(data_str)
-                            
-                            # 提取回复内容
-                            if 'choices' in chunk_data and chunk_data['choices']:
-                                delta = chunk_data['choices'][0].get('delta', {})
-                                content = delta.get('content', '')
-                                
-                                if content:
-                                    ai_response += content
-                                    # 实时发送部分回复到输出队列
-                                    self.message_queue.put_ai_message(content, {"partial": True})
-                                    
-                    except json.JSONDecodeError:
-                        continue
-                    except Exception as e:
-                        print(f"解析流式响应出错: {e}")
-                        continue
-            
+            try:
+                # 多实例运行时对话固定在 chat_instance 上，复用该实例槽位中的缓存；
+                # 槽位取自实例启动时的布局，切换模型期间新旧实例的对话槽位可能不同
+                with server_router.lease_chat(config_manager.get_config("chat_instance", 0),
+                                              config_manager.get_slot_affinity()) as (base_url, slot):
+                    if slot is not None:
+                        payload["id_slot"] = slot
+                    for chunk_data in http_client.stream_chat(
+                        f"{base_url}/v1/chat/completions" if base_url else self.api_url,
+                        payload,
+                        scope,
+                        timeout=(5, 30),  # 连接超时5秒，读取超时30秒
+                        metrics_kind="chat",
+                        enqueued_at=(message.metadata or {}).get("enqueued_at")
+                    ):
+                        # 提取回复内容
+                        if 'choices' in chunk_data and chunk_data['choices']:
+                            delta = chunk_data['choices'][0].get('delta', {})
+                            content = delta.get('content', '')
+
+                            if content:
+                                ai_response += content
+                                # 实时发送部分回复到输出队列
+                                self.message_queue.put_ai_message(content, {"partial": True})
+            except RequestCancelled:
+                # 已生成的部分仍然保留在对话历史中
+                if ai_response:
+                    self.context.add("assistant", ai_response)
+                self.message_queue.put_ai_message("", {"partial": False, "complete": True, "cancelled": True})
+                return
+            finally:
+                self._current_scope = None
+
             # 完整回复完成后，添加到历史记录
             if ai_response:
-                self.session_history.append({"role": "assistant", "content": ai_response})
+                self.context.add("assistant", ai_response)
                 # 发送完整回复结束标记
                 self.message_queue.put_ai_message("", {"partial": False, "complete": True})
                 
@@ -116,18 +114,20 @@ class AIConversationWorker(QueueProcessor):
             print(error_msg)
             self.message_queue.put_error_message(error_msg)
 
+    def cancel_generation(self):
+        """中断正在生成的回复，关闭流式连接以立即释放服务端槽位"""
+        scope = self._current_scope
+        if scope is not None:
+            scope.cancel()
+
     def clear_history(self):
         """清空对话历史"""
-        self.session_history.clear()
-        # 重新添加系统提示
-        self.session_history.append({
-            "role": "system", 
-            "content": "你是一个智能AI助手，能够进行自然对话。"
-        })
+        # 系统提示词由上下文管理器在每次请求时自动加上
+        self.context.clear()
         
     def get_history_summary(self) -> str:
         """获取对话历史摘要"""
-        return f"当前对话轮次: {len(self.session_history) // 2}"
+        return self.context.summary()
 
 
 class ConversationManager:
@@ -145,31 +145,40 @@ class ConversationManager:
     def stop(self):
         """停止对话系统"""
         try:
-            # 先停止工作线程
-            self.worker.stop()
-            # 再停止消息队列
+            # 界面即将关闭，不再通知GUI线程
+            self.message_queue.set_output_listener(None)
+            # 先中断正在生成的回复，工作线程才能及时退出
+            self.worker.cancel_generation()
+            # 再停止消息队列，唤醒可能因输出队列已满而阻塞的工作线程
             self.message_queue.stop()
+            # 最后停止工作线程
+            self.worker.stop()
         except Exception as e:
             print(f"停止对话系统时出错: {e}")
         
-    def send_message(self, content: str):
-        """发送用户消息"""
-        self.message_queue.put_user_message(content)
+    def send_message(self, content: str) -> bool:
+        """发送用户消息，输入队列已满时返回 False"""
+        # 记录入队时间，用于统计排队等待
+        return self.message_queue.put_user_message(content, {"enqueued_at": time.monotonic()})
+
+    def cancel_generation(self):
+        """停止当前正在生成的回复"""
+        self.worker.cancel_generation()
         
     def set_gui_update_callback(self, callback):
         """设置GUI更新回调函数"""
         self._gui_update_callback = callback
+
+    def set_message_notifier(self, notifier):
+        """设置输出消息通知函数，工作线程写入消息后调用，用于唤醒GUI线程"""
+        self.message_queue.set_output_listener(notifier)
         
     def process_output_messages(self):
-        """处理输出队列中的消息并更新GUI"""
+        """处理输出队列中已有的消息并更新GUI，不等待新消息"""
         if not self._gui_update_callback:
             return
             
-        while True:
-            message = self.message_queue.get_ai_message(timeout=0.01)
-            if not message:
-                break
-                
+        for message in self.message_queue.get_many():
             # 调用GUI更新回调
             self._gui_update_callback(message.type.value, message.content, message.metadata or {})
 
@@ -188,7 +197,10 @@ class ConversationManager:
             "running": self.is_running(),
             "input_queue_size": self.message_queue.input_queue_size,
             "output_queue_size": self.message_queue.output_queue_size,
-            "history_summary": self.worker.get_history_summary()
+            "history_summary": self.worker.get_history_summary(),
+            "http": http_client.get_stats(),
+            "instances": server_router.get_stats(),
+            "metrics": inference_metrics.snapshot()
         }
 
 
@@ -1,4 +1,33 @@
-import requests
+import json
+import threading
+import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Set, Tuple
+
+from config_manager import config_manager
+from http_client import CancelScope, RequestCancelled, http_client
+from inference_metrics import inference_metrics
+from handler.text_classifier import PASSTHROUGH, SKIP, TRANSLATE, MaskedText, classify, restore_placeholders
+from server_router import server_router
+from translation_journal import TranslationJournal
+from translation_memory import translation_memory
+from translation_progress import TranslationProgress
+
+# 翻译请求失败时返回的译文前缀，这类结果不会写入翻译记忆库
+ERROR_PREFIX = "[错误]"
+# 预分类之外由 keep_the_same 判断为不需要翻译的条目
+UNCHANGED = "unchanged"
+
+# 提示词保持逐字节不变，llama-server 在同一槽位上可以复用已计算的前缀（cache_prompt）
+SINGLE_SYSTEM_PROMPT = "你是一个专业翻译助手，只输出译文，不要解释。原文中的 {0}、{1} 等占位符原样保留。"
+BATCH_SYSTEM_PROMPT = (
+    "你是一个专业翻译助手。用户会给出一个以编号为键的 JSON 对象，"
+    "请逐条翻译其中的值，只输出键不变的 JSON 对象，不要解释。原文中的 {0}、{1} 等占位符原样保留。"
+)
+# 批量请求中系统提示词和模板大致占用的 token 数
+BATCH_PROMPT_OVERHEAD_TOKENS = 128
+# 每个条目的编号、引号和分隔符大致占用的 token 数
+BATCH_ENTRY_OVERHEAD_TOKENS = 6
 
 
 class BaseHandler:
@@ -7,6 +36,14 @@ class BaseHandler:
     def __init__(self, api_url):
         """初始化处理器，api_url由子类传递"""
         self.url = api_url
+        self._cancel_scope = CancelScope()
+        # 按原文字符数计算的进度和剩余时间，界面可以在进度回调中读取
+        self.progress = TranslationProgress()
+        # 预分类时替换了控制符的原文：原文 -> MaskedText
+        self._masked: Dict[str, MaskedText] = {}
+        self.classification: Dict[str, int] = {}
+        # 当前线程翻译的请求单元用到的模型文件，切换模型期间译文按实际生成它的模型写入翻译记忆库
+        self._unit_models = threading.local()
 
     def can_handle(self, text: str) -> bool:
         """判断是否可以处理该文本"""
@@ -16,6 +53,16 @@ class BaseHandler:
         """初始化内部状态（比如解析 JSON、YAML 等） 解析原始文本，准备好内部数据结构"""
         raise NotImplementedError
 
+    def can_handle_file(self, file_path: str, head: bytes) -> bool:
+        """根据文件扩展名和开头的若干字节判断是否可以处理该文件，默认读取全文后调用 can_handle"""
+        with open(file_path, encoding="utf-8") as f:
+            return self.can_handle(f.read())
+
+    def load_file(self, file_path: str):
+        """从文件加载内容，默认读取全文后调用 load，子类可以改为流式解析以降低内存占用"""
+        with open(file_path, encoding="utf-8") as f:
+            self.load(f.read())
+
     def get_total(self) -> int:
         """返回需要翻译的条目总数"""
         raise NotImplementedError
@@ -32,40 +79,366 @@ class BaseHandler:
         """返回处理后的文本"""
         raise NotImplementedError
 
+    def write_to(self, output_path: str):
+        """把处理后的文本写入文件，子类可以改为流式写出，避免在内存中再生成一份完整的文本"""
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.write(self.serialize())
+
+    def close(self):
+        """释放加载文件时占用的资源（文件句柄、内存映射等），写出译文之后调用；默认没有需要释放的资源"""
+
     def keep_the_same(self, text: str) -> bool:
         """判断是否保持原文"""
         raise NotImplementedError
 
-    def translate(self, text: str, target_lang: str, progress_callback=None) -> str:
-        """统一的翻译流程（模板方法）"""
+    def translate(self, text: str, target_lang: str, progress_callback=None, max_workers: int = None,
+                  journal: TranslationJournal = None) -> str:
+        """解析文本并执行翻译流程"""
+        self._cancel_scope = CancelScope()
         self.load(text)
+        return self.translate_loaded(target_lang, progress_callback, max_workers, journal)
+
+    def translate_loaded(self, target_lang: str, progress_callback=None, max_workers: int = None,
+                         journal: TranslationJournal = None, serialize: bool = True,
+                         executor: ThreadPoolExecutor = None) -> Optional[str]:
+        """统一的翻译流程（模板方法），要求已经通过 load 或 load_file 加载内容
 
+        相同的原文只翻译一次，进度 progress_callback(done, total) 按去重后原文的字符数计算。
+        需要翻译的条目会提交到线程池，同时保持 max_workers 个请求在服务端并行解码，
+        结果按完成顺序写回。max_workers 默认取配置中的并发数（即服务端槽位数）。
+        默认先提交最长的请求，避免一个长条目最后才开始、其他槽位都在空等。
+        传入 journal 时，日志中已完成的条目直接恢复，新完成的条目会追加到日志中。
+        调用 cancel() 后会关闭所有进行中的请求并抛出 RequestCancelled，已完成的条目保留在处理器中。
+        serialize 为 False 时不生成结果文本、返回 None，由调用方用 write_to 直接写入文件。
+        传入 executor 时请求提交到这个共享的线程池（忽略 max_workers），多个文件同时翻译时，
+        一个文件收尾阶段空出来的线程会接着处理下一个文件的请求。
+        """
         total = self.get_total()
+        if max_workers is None:
+            max_workers = config_manager.get_translate_workers()
+        max_workers = max(1, int(max_workers))
+
+        # 相同原文只翻译一次，结果写回到所有出现的位置
+        groups = self._classify_entries(total)
+        entry_count = self.classification[TRANSLATE]
+
+        pending = [(indices, original) for original, indices in groups.items()]
+        work_total = len(pending)
+        if entry_count:
+            print(f"待翻译 {entry_count} 条，去重后 {work_total} 条，"
+                  f"去重率 {1 - work_total / entry_count:.1%}")
+
+        self.progress = progress = TranslationProgress(sum(self._cost(original) for _, original in pending))
+        done = 0
+        # 从断点日志恢复上次中断前已完成的条目
+        if journal is not None:
+            remaining = []
+            for indices, original in pending:
+                restored = [journal.restored(i, original) for i in indices]
+                if all(t is not None for t in restored):
+                    for i, translated in zip(indices, restored):
+                        self.set_text(i, translated)
+                    done += 1
+                    progress.skip(self._cost(original))
+                    if progress_callback:
+                        progress_callback(progress.done, progress.total)
+                else:
+                    remaining.append((indices, original))
+            if done:
+                print(f"从断点日志恢复 {done} 条")
+            pending = remaining
+
+        # 先查询翻译记忆库，命中的条目不再请求模型
+        cached = translation_memory.get_many({original for _, original in pending}, target_lang)
+        if cached:
+            remaining = []
+            for indices, original in pending:
+                if original in cached:
+                    for i in indices:
+                        self.set_text(i, cached[original])
+                    done += 1
+                    progress.skip(self._cost(original))
+                    if progress_callback:
+                        progress_callback(progress.done, progress.total)
+                else:
+                    remaining.append((indices, original))
+            print(f"翻译记忆命中 {len(pending) - len(remaining)} 条，需请求模型 {len(remaining)} 条")
+            pending = remaining
+
+        longest_first = config_manager.get_config("schedule", "longest_first") == "longest_first"
+        if longest_first:
+            # 按长度排序后再打包，同一批次中的条目长度相近
+            pending.sort(key=lambda item: len(item[1]), reverse=True)
+        units = self._plan_units(pending)
+        if longest_first:
+            units.sort(key=lambda unit: sum(self._cost(original) for _, original in unit), reverse=True)
+        progress.start()
+        # 批量翻译大量文件时逐条打印会拖慢翻译，可以通过 log_entries 关闭
+        log_entries = config_manager.get_config("log_entries", True)
+        owns_executor = executor is None
+        if owns_executor:
+            executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="translate")
+        futures = {}
+        try:
+            futures = {
+                executor.submit(
+                    self._translate_unit, [original for _, original in unit], target_lang, time.monotonic()
+                ): unit
+                for unit in units
+            }
+            for future in as_completed(futures):
+                unit = futures[future]
+                try:
+                    results, models = future.result()
+                except (RequestCancelled, CancelledError):
+                    # 已取消：丢弃本文件尚未开始的请求（共享的线程池中可能还有其他文件的请求），
+                    # 进行中的请求已由 cancel() 关闭
+                    for other in futures:
+                        other.cancel()
+                    continue
+                for (indices, original), translated in zip(unit, results):
+                    if log_entries:
+                        print(f"original text:{original},Translated text: {translated}")
+                    for i in indices:
+                        self.set_text(i, translated)
+                        if journal is not None and not translated.startswith(ERROR_PREFIX):
+                            journal.record(i, original, translated)
+
+                    done += 1
+                    progress.advance(self._cost(original))
+                    if progress_callback:
+                        progress_callback(progress.done, progress.total)
+
+                # 请求单元跨越了模型切换时不知道译文出自哪个模型，不写入翻译记忆库
+                if len(models) <= 1:
+                    translation_memory.put_many(
+                        [(original, translated) for (_, original), translated in zip(unit, results)
+                         if not translated.startswith(ERROR_PREFIX)],
+                        target_lang,
+                        next(iter(models), None)
+                    )
+        finally:
+            # 异常退出时不再占用共享线程池
+            for future in futures:
+                future.cancel()
+            if owns_executor:
+                executor.shutdown(wait=True)
+
+        stats = http_client.get_stats()
+        print(f"HTTP 请求 {stats['requests']} 次，新建连接 {stats['connections']} 个，复用 {stats['reused']} 次")
+        if progress.chars_per_second:
+            print(f"模型翻译速度 {progress.chars_per_second:.1f} 字符/秒")
+        cache = inference_metrics.prompt_cache_stats("translate")
+        print(f"提示词缓存命中 {cache['cached']} tokens，重新计算 {cache['evaluated']} tokens，命中率 {cache['hit_rate']:.1%}")
+        if self._cancel_scope.cancelled:
+            print(f"翻译已取消，已完成 {done}/{work_total} 条")
+            raise RequestCancelled("翻译已取消")
+        return self.serialize() if serialize else None
+
+    def _classify_entries(self, total: int) -> Dict[str, List[int]]:
+        """
+        预分类：遍历一次全部条目，跳过不需要翻译的条目，记录需要替换控制符的原文
+        分类器放过的条目再由 keep_the_same 判断；avoided_calls 只统计 keep_the_same 本来会发给模型、
+        被分类器拦下的原文数
+        :return: 需要翻译的原文 -> 出现位置的索引列表
+        """
+        mask = config_manager.get_config("mask_placeholders", True)
+        groups: Dict[str, List[int]] = {}
+        kinds: Dict[str, str] = {}
+        counts = {TRANSLATE: 0, SKIP: 0, PASSTHROUGH: 0, UNCHANGED: 0}
+        avoided = 0
+        self._masked = {}
         for i in range(total):
             original = self.get_text(i)
-            if not self.keep_the_same(original):
-                translated = self._translate_single(original, target_lang)
-                print(f"original text:{original},Translated text: {translated}")
-                self.set_text(i, translated)
+            kind = kinds.get(original)
+            if kind is None:
+                kind, masked = classify(original)
+                if kind == TRANSLATE and self.keep_the_same(original):
+                    kind = UNCHANGED
+                elif kind != TRANSLATE and not self.keep_the_same(original):
+                    avoided += 1
+                kinds[original] = kind
+                if mask and kind == TRANSLATE and masked.placeholders:
+                    self._masked[original] = masked
+            counts[kind] += 1
+            if kind == TRANSLATE:
+                groups.setdefault(original, []).append(i)
 
-            if progress_callback:
-                progress_callback(i + 1, total)
+        self.classification = dict(counts, masked=len(self._masked), avoided_calls=avoided)
+        if counts[SKIP] or counts[PASSTHROUGH] or counts[UNCHANGED]:
+            print(f"预分类：跳过 {counts[SKIP]} 条，只有控制符原样保留 {counts[PASSTHROUGH]} 条，"
+                  f"无需翻译 {counts[UNCHANGED]} 条；分类器少请求模型 {avoided} 次，替换控制符 {len(self._masked)} 条")
+        return groups
 
-        return self.serialize()
+    def cancel(self):
+        """取消正在进行的翻译，立即关闭所有进行中的请求以释放服务端槽位"""
+        self._cancel_scope.cancel()
 
-    def _translate_single(self, text: str, target_lang: str) -> str:
-        """统一的翻译 API 调用"""
-        payload = {
-            "model": "qwen3-4b",
-            "messages": [
-                {"role": "system", "content": "你是一个专业翻译助手，只输出译文，不要解释。"},
-                {"role": "user", "content": f"请翻译成{target_lang}：{text}"}
+    @property
+    def cancelled(self) -> bool:
+        """翻译是否已被取消"""
+        return self._cancel_scope.cancelled
+
+    def _plan_units(self, pending):
+        """把待翻译条目划分为请求单元
+
+        批量模式关闭时每个条目单独成为一个单元；开启时把较短的条目按顺序打包，
+        每个批次的条目数不超过 batch_size，估算的 token 数不超过 _batch_token_budget()。
+        """
+        batch_size = config_manager.get_batch_size()
+        if batch_size <= 1:
+            return [[item] for item in pending]
+
+        max_chars = config_manager.get_batch_max_chars()
+        budget = self._batch_token_budget()
+        units = []
+        batch, batch_tokens = [], 0
+        for item in pending:
+            if len(item[1]) > max_chars:
+                units.append([item])
+                continue
+
+            tokens = self._estimate_tokens(item[1]) + BATCH_ENTRY_OVERHEAD_TOKENS
+            if batch and (len(batch) >= batch_size or batch_tokens + tokens > budget):
+                units.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append(item)
+            batch_tokens += tokens
+
+        if batch:
+            units.append(batch)
+        return units
+
+    @staticmethod
+    def _batch_token_budget() -> int:
+        """单个批次原文可占用的 token 数
+
+        llama-server 会把 ctx_size 平分给各个槽位；扣除提示词开销后，
+        剩余空间一半留给原文，一半留给译文。
+        """
+        slot_ctx = config_manager.get_ctx_size() // max(1, config_manager.get_parallel())
+        return max(1, (slot_ctx - BATCH_PROMPT_OVERHEAD_TOKENS) // 2)
+
+    @staticmethod
+    def _cost(text: str) -> int:
+        """估算翻译一个条目的开销：译文长度与原文大致成正比，按原文字符数计"""
+        return max(1, len(text))
+
+    @staticmethod
+    def _estimate_tokens(text: str) -> int:
+        """粗略估算 token 数：中日文字符按每字 1 个 token 保守估计"""
+        return len(text)
+
+    def _translate_unit(self, texts: List[str], target_lang: str,
+                        enqueued_at: float = None) -> Tuple[List[str], Set[Optional[str]]]:
+        """翻译一个请求单元，批量结果对不上的条目回退为逐条翻译
+
+        enqueued_at 为单元提交到线程池的时间，只计入第一个请求的排队等待。
+        返回译文和这些请求用到的模型文件（服务器不由本程序启动时为 None）。
+        """
+        self._cancel_scope.check()
+        models = self._unit_models.models = set()
+        masked = [self._masked.get(text) for text in texts]
+        sources = [m.text if m is not None else text for m, text in zip(masked, texts)]
+        if len(sources) == 1:
+            results = [self._translate_single(sources[0], target_lang, enqueued_at)]
+        else:
+            results = self._translate_batch(sources, target_lang, enqueued_at)
+            results = [
+                translated if translated is not None else self._translate_single(source, target_lang)
+                for source, translated in zip(sources, results)
             ]
-        }
+        restored = [
+            self._restore(original, m, translated, target_lang)
+            for original, m, translated in zip(texts, masked, results)
+        ]
+        return restored, models
+
+    def _restore(self, original: str, masked: Optional[MaskedText], translated: str, target_lang: str) -> str:
+        """还原译文中的控制符；模型弄丢了占位符时用未替换的原文重新翻译一次"""
+        if masked is None or translated.startswith(ERROR_PREFIX):
+            return translated
+        restored = restore_placeholders(translated, masked.placeholders)
+        if restored is None:
+            print(f"译文中的占位符不完整，改用原文重新翻译: {original}")
+            return self._translate_single(original, target_lang)
+        return restored
+
+    def _translate_batch(self, texts: List[str], target_lang: str,
+                         enqueued_at: float = None) -> List[Optional[str]]:
+        """在一次请求中翻译多个条目
+
+        原文以编号 JSON 对象发送，回复按编号拆分；缺失或格式不对的条目返回 None。
+        """
+        numbered = {str(n): text for n, text in enumerate(texts, start=1)}
+        payload = self._build_payload([
+            {"role": "system", "content": BATCH_SYSTEM_PROMPT},
+            {"role": "user", "content": f"请翻译成{target_lang}：\n{json.dumps(numbered, ensure_ascii=False)}"}
+        ])
 
         try:
-            r = requests.post(self.url, json=payload, timeout=120)
-            r.raise_for_status()
-            return r.json()["choices"][0]["message"]["content"]
+            reply = self._request_completion(payload, enqueued_at)
+        except RequestCancelled:
+            raise
         except Exception as e:
-            return f"[错误] {e}"
+            print(f"批量翻译请求失败，回退为逐条翻译: {e}")
+            return [None] * len(texts)
+
+        translated = self._parse_batch_reply(reply)
+        results = []
+        for n in range(1, len(texts) + 1):
+            value = translated.get(str(n))
+            results.append(value if isinstance(value, str) and value.strip() else None)
+        return results
+
+    @staticmethod
+    def _parse_batch_reply(reply: str) -> dict:
+        """从模型回复中提取编号 JSON 对象，解析失败时返回空字典"""
+        start, end = reply.find("{"), reply.rfind("}")
+        if start == -1 or end <= start:
+            return {}
+        try:
+            data = json.loads(reply[start:end + 1])
+        except json.JSONDecodeError:
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def _translate_single(self, text: str, target_lang: str, enqueued_at: float = None) -> str:
+        """统一的翻译 API 调用"""
+        payload = self._build_payload([
+            {"role": "system", "content": SINGLE_SYSTEM_PROMPT},
+            {"role": "user", "content": f"请翻译成{target_lang}：{text}"}
+        ])
+
+        try:
+            return self._request_completion(payload, enqueued_at)
+        except RequestCancelled:
+            raise
+        except Exception as e:
+            return f"{ERROR_PREFIX} {e}"
+
+    @staticmethod
+    def _build_payload(messages: List[dict]) -> dict:
+        """构造请求体：开启 cache_prompt，发送时再指定槽位"""
+        return {"model": "qwen3-4b", "messages": messages, "cache_prompt": True}
+
+    def _request_completion(self, payload: dict, enqueued_at: float = None) -> str:
+        """以流式方式发送请求并拼接完整回复，流式请求可以在生成途中被 cancel() 中断"""
+        parts = []
+        # 实例和槽位一起选择：发往空闲的槽位，多实例运行时其次选择进行中请求最少的实例；
+        # 翻译请求的系统提示词相同，任一翻译槽位都能复用已计算的前缀
+        with server_router.lease_slot(config_manager.get_slot_affinity()) as (base_url, slot, model):
+            models = getattr(self._unit_models, "models", None)
+            if models is not None:
+                models.add(model)
+            url = f"{base_url}/v1/chat/completions" if base_url else self.url
+            if slot is not None:
+                payload = dict(payload, id_slot=slot)
+            for chunk in http_client.stream_chat(url, payload, self._cancel_scope,
+                                                 metrics_kind="translate", enqueued_at=enqueued_at):
+                choices = chunk.get("choices")
+                if choices:
+                    content = choices[0].get("delta", {}).get("content")
+                    if content:
+                        parts.append(content)
+        return "".join(parts)
@@ -0,0 +1,217 @@
+"""
+流式 JSON 解析
+按块读取文件，逐个产出顶层对象的键值对，避免把整个文件读成一个 str；
+也可以同时产出字符串值在文件中的字节位置，写出译文时只替换这些位置
+"""
+import json
+import re
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+UTF8_BOM = b"\xef\xbb\xbf"
+
+_WHITESPACE_RE = re.compile(rb"[ \t\n\r]*")
+_STRING_RE = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+# 数字、true、false、null 一直延伸到下一个分隔符，交给 json.loads 校验
+_SCALAR_RE = re.compile(rb'[^,:{}\[\]" \t\n\r]+')
+_NESTED_TOKEN_RE = re.compile(rb'["{}\[\]]')
+# 一个 "键": 字符串或标量值（不含嵌套的对象、数组）
+_ITEM_PATTERN = (
+    rb'[ \t\n\r]*"[^"\\]*(?:\\.[^"\\]*)*"[ \t\n\r]*:[ \t\n\r]*'
+    rb'(?:"[^"\\]*(?:\\.[^"\\]*)*"|[^,:{}\[\]" \t\n\r]+)[ \t\n\r]*'
+)
+# 快速路径：匹配缓冲区中一串以逗号结尾的简单键值对，整体交给 json.loads 解析
+_RUN_RE = re.compile(rb"(?:" + _ITEM_PATTERN + rb",)+", re.S)
+# 记录位置时的快速路径：逐个匹配以逗号结尾的简单键值对，分组为键和值
+_ITEM_RE = re.compile(
+    rb'[ \t\n\r]*("[^"\\]*(?:\\.[^"\\]*)*")[ \t\n\r]*:[ \t\n\r]*'
+    rb'("[^"\\]*(?:\\.[^"\\]*)*"|[^,:{}\[\]" \t\n\r]+)[ \t\n\r]*,',
+    re.S
+)
+
+
+def _decode_string(raw: bytes) -> str:
+    """解码 JSON 字符串记号，不含转义时直接按 UTF-8 解码"""
+    if b"\\" not in raw:
+        return raw[1:-1].decode("utf-8")
+    return json.loads(raw)
+
+
+class _Reader:
+    """带缓冲区的字节读取器，记录缓冲区起点在文件中的偏移"""
+
+    def __init__(self, stream: BinaryIO, chunk_size: int):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.buf = b""
+        self.pos = 0
+        self.base = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        """读入更多数据，返回是否读到了新内容；同时丢弃已经消费的部分"""
+        if self.eof:
+            return False
+        if self.pos > 0:
+            self.base += self.pos
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        chunk = self.stream.read(max(self.chunk_size, len(self.buf)))
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf += chunk
+        return True
+
+    def skip_whitespace(self):
+        while True:
+            self.pos = _WHITESPACE_RE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf) or not self.fill():
+                return
+
+    def peek(self) -> bytes:
+        self.skip_whitespace()
+        return self.buf[self.pos:self.pos + 1]
+
+    def expect(self, char: bytes):
+        if self.peek() != char:
+            raise ValueError(f"JSON 格式错误：偏移 {self.base + self.pos} 处应为 {char.decode()}")
+        self.pos += 1
+
+    def read_token(self, pattern) -> bytes:
+        """读取一个完整匹配 pattern 的记号；匹配到缓冲区末尾时继续读入，防止记号被截断"""
+        while True:
+            match = pattern.match(self.buf, self.pos)
+            if match and (match.end() < len(self.buf) or self.eof):
+                self.pos = match.end()
+                return match.group()
+            if not self.fill():
+                match = pattern.match(self.buf, self.pos)
+                if match is None:
+                    raise ValueError(f"JSON 格式错误：偏移 {self.base + self.pos} 处无法解析")
+                self.pos = match.end()
+                return match.group()
+
+    def read_nested(self) -> bytes:
+        """读取一个完整的嵌套对象或数组"""
+        start = self.pos
+        while True:
+            depth = 0
+            scan = start
+            while True:
+                match = _NESTED_TOKEN_RE.search(self.buf, scan)
+                if match is None:
+                    break
+                token = match.group()
+                if token == b'"':
+                    string = _STRING_RE.match(self.buf, match.start())
+                    if string is None:
+                        break
+                    scan = string.end()
+                    continue
+                depth += 1 if token in (b"{", b"[") else -1
+                scan = match.end()
+                if depth == 0:
+                    self.pos = scan
+                    return self.buf[start:scan]
+
+            # 数据不完整，读入更多后从容器开头重新扫描
+            offset = start - self.pos
+            if not self.fill():
+                raise ValueError(f"JSON 格式错误：偏移 {self.base + start} 处的对象不完整")
+            start = self.pos + offset
+
+    def read_value(self):
+        char = self.peek()
+        if char == b'"':
+            return _decode_string(self.read_token(_STRING_RE))
+        if char in (b"{", b"["):
+            return json.loads(self.read_nested())
+        return json.loads(self.read_token(_SCALAR_RE))
+
+
+def _open_object(stream: BinaryIO, chunk_size: int) -> Optional[_Reader]:
+    """跳过 BOM 和开头的 {，对象为空时返回 None"""
+    reader = _Reader(stream, chunk_size)
+    while len(reader.buf) < len(UTF8_BOM) and reader.fill():
+        pass
+    if reader.buf.startswith(UTF8_BOM):
+        reader.pos = len(UTF8_BOM)
+
+    reader.expect(b"{")
+    if reader.peek() == b"}":
+        reader.pos += 1
+        return None
+    return reader
+
+
+def _expect_separator(reader: _Reader) -> bool:
+    """读取键值对之后的 , 或 }，返回对象是否结束"""
+    char = reader.peek()
+    reader.pos += 1
+    if char == b"}":
+        return True
+    if char != b",":
+        raise ValueError(f"JSON 格式错误：偏移 {reader.base + reader.pos - 1} 处应为 , 或 }}")
+    return False
+
+
+def iter_object_items(stream: BinaryIO, chunk_size: int = 1 << 20) -> Iterator[Tuple[str, object]]:
+    """
+    逐个产出顶层 JSON 对象的 (键, 值)
+    :param stream: 以二进制模式打开的文件
+    :param chunk_size: 每次读取的字节数
+    """
+    reader = _open_object(stream, chunk_size)
+    if reader is None:
+        return
+
+    while True:
+        match = _RUN_RE.match(reader.buf, reader.pos)
+        if match is not None:
+            run = reader.buf[reader.pos:match.end() - 1]
+            reader.pos = match.end()
+            yield from json.loads(b"{" + run + b"}").items()
+            continue
+
+        # 慢速路径：最后一个键值对、缓冲区中数据不完整，或值是嵌套的对象、数组
+        if reader.peek() != b'"':
+            raise ValueError(f"JSON 格式错误：偏移 {reader.base + reader.pos} 处应为键名")
+        key = _decode_string(reader.read_token(_STRING_RE))
+        reader.expect(b":")
+        yield key, reader.read_value()
+        if _expect_separator(reader):
+            return
+
+
+def iter_object_spans(stream: BinaryIO, chunk_size: int = 1 << 20
+                      ) -> Iterator[Tuple[str, object, Optional[Tuple[int, int]]]]:
+    """
+    逐个产出顶层 JSON 对象的 (键, 值, 值的字节范围)
+    字节范围为字符串记号（含引号）在文件中的 [开始, 结束) 偏移，值不是字符串时为 None
+    """
+    reader = _open_object(stream, chunk_size)
+    if reader is None:
+        return
+
+    while True:
+        match = _ITEM_RE.match(reader.buf, reader.pos)
+        if match is not None:
+            reader.pos = match.end()
+            raw = match.group(2)
+            key = _decode_string(match.group(1))
+            if raw[:1] == b'"':
+                yield key, _decode_string(raw), (reader.base + match.start(2), reader.base + match.end(2))
+            else:
+                yield key, json.loads(raw), None
+            continue
+
+        if reader.peek() != b'"':
+            raise ValueError(f"JSON 格式错误：偏移 {reader.base + reader.pos} 处应为键名")
+        key = _decode_string(reader.read_token(_STRING_RE))
+        reader.expect(b":")
+        is_string = reader.peek() == b'"'
+        start = reader.base + reader.pos
+        value = reader.read_value()
+        yield key, value, (start, reader.base + reader.pos) if is_string else None
+        if _expect_separator(reader):
+            return
@@ -1,9 +1,19 @@
 import json
+import os
 import re
 
 from handler.base import BaseHandler
+from handler.json_stream import UTF8_BOM, iter_object_spans
 from handler.registry import register_handler
 
+# 写出译文时每次复制的原文件字节数
+COPY_CHUNK_SIZE = 1 << 20
+
+# 对象的开头：{ 之后是键名或者空对象
+_OBJECT_START_RE = re.compile(rb"\{\s*[\"}]")
+# 日语字符（平假名、片假名）
+_JAPANESE_RE = re.compile(r'[\u3040-\u309F\u30A0-\u30FF]')
+
 
 @register_handler
 class JSONHandler(BaseHandler):
@@ -12,6 +22,10 @@ class JSONHandler(BaseHandler):
         self.url = api_url
         self._data = None
         self._keys = None
+        # 从文件加载时记录字符串值的字节范围，写出时只替换译文有变化的部分
+        self._source = None
+        self._spans = {}
+        self._changed = set()
 
     def can_handle(self, text: str) -> bool:
         try:
@@ -24,6 +38,37 @@ class JSONHandler(BaseHandler):
     def load(self, text: str):
         self._data = json.loads(text)
         self._keys = [k for k, v in self._data.items() if isinstance(v, str)]
+        self._source = None
+        self._spans = {}
+        self._changed = set()
+
+    def can_handle_file(self, file_path: str, head: bytes) -> bool:
+        # 不解析全文：.json 文件只看第一个非空白字符是否为 {；其他扩展名的文件（例如以 { 开头的脚本）
+        # 还要求 { 之后是键名或 }，真正解析失败时 create_handler 会换下一个处理器
+        head = head[len(UTF8_BOM):] if head.startswith(UTF8_BOM) else head
+        stripped = head.lstrip()
+        is_json_file = os.path.splitext(file_path)[1].lower() == ".json"
+        if not stripped:
+            return is_json_file
+        if is_json_file:
+            return stripped.startswith(b"{")
+        return _OBJECT_START_RE.match(stripped) is not None
+
+    def load_file(self, file_path: str):
+        # 流式解析，内存中只保留解析后的字典和字符串值的字节范围
+        self._data = {}
+        self._spans = {}
+        self._changed = set()
+        stat = os.stat(file_path)
+        with open(file_path, "rb") as f:
+            for key, value, span in iter_object_spans(f):
+                self._data[key] = value
+                if span is not None:
+                    self._spans[key] = span
+                else:
+                    self._spans.pop(key, None)
+        self._keys = [k for k, v in self._data.items() if isinstance(v, str)]
+        self._source = (file_path, stat.st_size, stat.st_mtime_ns)
 
     def get_total(self) -> int:
         return len(self._keys)
@@ -34,12 +79,46 @@ class JSONHandler(BaseHandler):
 
     def set_text(self, index: int, translated: str):
         key = self._keys[index]
+        if self._data[key] != translated:
+            self._changed.add(key)
         self._data[key] = translated
 
     def serialize(self) -> str:
         return json.dumps(self._data, ensure_ascii=False, indent=4)
 
+    def write_to(self, output_path: str):
+        """从文件加载时按原文件的字节流式写出，只替换译文有变化的字符串，格式与原文件保持一致"""
+        if self._source is None:
+            super().write_to(output_path)
+            return
+        source_path, size, mtime_ns = self._source
+        stat = os.stat(source_path)
+        if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+            print(f"{source_path} 在加载后被修改，改为重新生成整个文件")
+            super().write_to(output_path)
+            return
+
+        spans = sorted((self._spans[key], key) for key in self._changed if key in self._spans)
+        with open(source_path, "rb") as src, open(output_path, "wb") as dst:
+            position = 0
+            for (start, end), key in spans:
+                self._copy(src, dst, start - position)
+                dst.write(json.dumps(self._data[key], ensure_ascii=False).encode("utf-8"))
+                src.seek(end)
+                position = end
+            self._copy(src, dst, -1)
+
+    @staticmethod
+    def _copy(src, dst, length: int):
+        """复制 length 个字节，length 为负数时复制到文件末尾"""
+        while length != 0:
+            chunk = src.read(COPY_CHUNK_SIZE if length < 0 else min(length, COPY_CHUNK_SIZE))
+            if not chunk:
+                return
+            dst.write(chunk)
+            if length > 0:
+                length -= len(chunk)
+
     def keep_the_same(self, text: str) -> bool:
         # 检测是否包含日语字符（平假名、片假名）
-        japanese_pattern = re.compile(r'[\u3040-\u309F\u30A0-\u30FF]')
-        return not bool(japanese_pattern.search(text))
+        return not bool(_JAPANESE_RE.search(text))
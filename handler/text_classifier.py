@@ -0,0 +1,90 @@
+"""
+条目预分类
+在翻译前对全部条目做一次分类：纯数字、文件路径、脚本调用直接跳过；只有控制符的条目原样保留；
+其余条目把 RPG Maker 控制符（\\C[2]、\\N[1]、%1 等）替换成简短的占位符再发给模型，译文返回后还原
+"""
+import re
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+# 分类结果
+SKIP = "skip"                # 不需要翻译：数字、路径、脚本等
+PASSTHROUGH = "passthrough"  # 只有控制符和标点，原样保留
+TRANSLATE = "translate"      # 需要翻译
+
+# 纯数字和算式
+_NUMBER_RE = re.compile(r"^[\s\d０-９.,:;+\-*/%()#×]+$")
+# 带扩展名的文件路径或文件名；在替换控制符之后匹配，控制符中的反斜杠不会被当成路径分隔符
+_PATH_RE = re.compile(
+    r"^[^\s]*/[^\s]*\.[A-Za-z0-9]{1,5}$"
+    r"|^[^\s/\\]+\.(?:png|jpe?g|gif|bmp|ogg|m4a|wav|mp3|mp4|webm|json|js|txt|csv|rpgsave)$",
+    re.IGNORECASE
+)
+# 脚本调用，例如 $gameVariables.setValue(1, 2)、this.command355()
+_SCRIPT_RE = re.compile(
+    r"^\s*(?:\$?[A-Za-z_][\w$]*\s*\.\s*)+[A-Za-z_][\w$]*\s*\(.*\)\s*;?\s*$"
+    r"|^\s*(?:this|\$game[A-Z]\w*|\$data[A-Z]\w*|Window_\w+|Scene_\w+|Game_\w+)\s*\.",
+    re.DOTALL
+)
+# RPG Maker 控制符和格式化参数：\C[2]、\N[1]、\V[10]、\FS<24>、\{、\.、\|、\!、\G、%1
+_PLACEHOLDER_RE = re.compile(
+    r"\\[A-Za-z]+\[[^\]\n]*\]"
+    r"|\\[A-Za-z]+<[^>\n]*>"
+    r"|\\[{}$.|!><^]"
+    r"|\\[A-Za-z]{1,2}(?![A-Za-z])"
+    r"|%\d+"
+)
+# 发给模型的占位符，原文中已经出现这种写法时不做替换
+_TOKEN_RE = re.compile(r"\{(\d+)\}")
+# 去掉控制符后只剩这些字符时原样保留
+_NO_TEXT_RE = re.compile(r"^[\s\d\W_]*$")
+# 平假名和片假名：扩展名以外含有假名的不是路径，而是对话（例如 はい/いいえ.OK）
+_KANA_RE = re.compile(r"[\u3040-\u30FF]")
+
+
+@dataclass
+class MaskedText:
+    """替换了控制符的原文"""
+    text: str
+    placeholders: List[str] = field(default_factory=list)
+
+
+def mask_placeholders(text: str) -> MaskedText:
+    """把控制符依次替换成 {0}、{1}……"""
+    if _TOKEN_RE.search(text):
+        return MaskedText(text)
+    placeholders = []
+
+    def replace(match):
+        placeholders.append(match.group())
+        return f"{{{len(placeholders) - 1}}}"
+
+    return MaskedText(_PLACEHOLDER_RE.sub(replace, text), placeholders)
+
+
+def restore_placeholders(translated: str, placeholders: List[str]) -> Optional[str]:
+    """把译文中的占位符还原为控制符；有占位符丢失或重复时返回 None"""
+    if not placeholders:
+        return translated
+    found = [int(n) for n in _TOKEN_RE.findall(translated)]
+    if sorted(found) != list(range(len(placeholders))):
+        return None
+    return _TOKEN_RE.sub(lambda match: placeholders[int(match.group(1))], translated)
+
+
+def _is_path(text: str) -> bool:
+    """带扩展名的路径或文件名，扩展名以外含有假名的不算"""
+    return bool(_PATH_RE.match(text)) and not _KANA_RE.search(text.rpartition(".")[0])
+
+
+def classify(text: str) -> Tuple[str, Optional[MaskedText]]:
+    """
+    判断条目是否需要翻译
+    :return: (分类, 需要翻译时替换了控制符的原文)
+    """
+    masked = mask_placeholders(text)
+    if _NUMBER_RE.match(masked.text) or _is_path(masked.text) or _SCRIPT_RE.match(masked.text):
+        return SKIP, None
+    if _NO_TEXT_RE.match(_TOKEN_RE.sub("", masked.text) if masked.placeholders else text):
+        return (PASSTHROUGH if masked.placeholders else SKIP), None
+    return TRANSLATE, masked
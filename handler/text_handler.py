@@ -0,0 +1,165 @@
+"""
+纯文本脚本处理器
+按行翻译 UTF-8 编码的文本文件（脚本导出、KiriKiri 的 .ks 等）。文件通过 mmap 映射，
+加载时只为含有日语假名的行记录字节范围，get_text 时才解码；写出时按原文件的字节流式复制并替换译文，
+加载耗时和内存占用随需要翻译的行数增长，与文件大小无关
+"""
+import io
+import mmap
+import os
+import re
+from array import array
+from typing import BinaryIO, Dict
+
+from config_manager import config_manager
+from handler.base import BaseHandler
+from handler.json_stream import UTF8_BOM
+from handler.registry import register_handler
+
+# 默认按纯文本处理的扩展名
+DEFAULT_TEXT_EXTENSIONS = [".txt", ".ks"]
+# 建立索引时每次扫描的字节数，扫描完的页面随即交还给系统
+SCAN_WINDOW = 16 << 20
+# 写出译文时每次复制的原文件字节数
+COPY_CHUNK_SIZE = 1 << 20
+
+# 平假名或片假名（U+3040-U+30FF），UTF-8 编码为 E3 81 80 - E3 83 BF
+_KANA_RE = re.compile(rb"\xe3[\x81-\x83][\x80-\xbf]")
+_JAPANESE_RE = re.compile(r'[\u3040-\u309F\u30A0-\u30FF]')
+_LEADING_SPACE = b" \t"
+_TRAILING_SPACE = b" \t\r"
+
+
+@register_handler
+class TextHandler(BaseHandler):
+    def __init__(self, api_url):
+        super().__init__(api_url)
+        self._file = None
+        self._mm = None
+        self._size = 0
+        # 需要翻译的行在文件中的 [开始, 结束) 偏移，不含行首缩进和行尾空白
+        self._starts = array("q")
+        self._ends = array("q")
+        self._translated: Dict[int, str] = {}
+
+    def can_handle(self, text: str) -> bool:
+        # 纯文本没有可以识别的特征，只通过 can_handle_file 按扩展名选择
+        return False
+
+    def load(self, text: str):
+        self._open_buffer(text.encode("utf-8"))
+
+    def can_handle_file(self, file_path: str, head: bytes) -> bool:
+        extensions = config_manager.get_config("text_extensions", DEFAULT_TEXT_EXTENSIONS)
+        if os.path.splitext(file_path)[1].lower() not in extensions or b"\x00" in head:
+            return False
+        try:
+            # 开头可能截断在一个多字节字符中间
+            head.decode("utf-8")
+        except UnicodeDecodeError as e:
+            return e.start >= len(head) - 3
+        return True
+
+    def load_file(self, file_path: str):
+        self.close()
+        self._file = open(file_path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        if size == 0:
+            self._open_buffer(b"")
+            return
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._index(self._mm, size)
+
+    def _open_buffer(self, data: bytes):
+        self._mm = data
+        self._index(data, len(data))
+
+    def _index(self, buffer, size: int):
+        """扫描全文，记录含有假名的行；按窗口扫描，扫描过的页面不常驻内存"""
+        self._size = size
+        self._starts = array("q")
+        self._ends = array("q")
+        self._translated = {}
+        position = len(UTF8_BOM) if buffer[:len(UTF8_BOM)] == UTF8_BOM else 0
+        while position < size:
+            end = min(size, position + SCAN_WINDOW)
+            if end < size:
+                newline = buffer.find(b"\n", end)
+                end = size if newline == -1 else newline + 1
+            self._index_window(buffer, position, end)
+            self._release(position, end)
+            position = end
+
+    def _index_window(self, buffer, position: int, end: int):
+        """记录 [position, end) 中含有假名的行，end 位于行首"""
+        search = _KANA_RE.search
+        while True:
+            match = search(buffer, position, end)
+            if match is None:
+                return
+            line_start = buffer.rfind(b"\n", position, match.start()) + 1 or position
+            line_end = buffer.find(b"\n", match.end(), end)
+            if line_end == -1:
+                line_end = end
+            line = buffer[line_start:line_end]
+            self._starts.append(line_start + len(line) - len(line.lstrip(_LEADING_SPACE)))
+            self._ends.append(line_start + len(line.rstrip(_TRAILING_SPACE)))
+            position = line_end + 1
+
+    def _release(self, start: int, end: int):
+        """扫描或复制过的页面交还给系统，避免大文件整个留在内存中"""
+        if isinstance(self._mm, mmap.mmap) and hasattr(mmap, "MADV_DONTNEED"):
+            aligned = start - start % mmap.PAGESIZE
+            self._mm.madvise(mmap.MADV_DONTNEED, aligned, end - aligned)
+
+    def get_total(self) -> int:
+        return len(self._starts)
+
+    def get_text(self, index: int) -> str:
+        translated = self._translated.get(index)
+        if translated is not None:
+            return translated
+        return self._mm[self._starts[index]:self._ends[index]].decode("utf-8", errors="replace")
+
+    def set_text(self, index: int, translated: str):
+        # 译文中的换行会打乱按行组织的脚本，替换为空格
+        self._translated[index] = translated.replace("\r\n", " ").replace("\n", " ")
+
+    def serialize(self) -> str:
+        stream = io.BytesIO()
+        self._write(stream)
+        return stream.getvalue().decode("utf-8", errors="replace")
+
+    def write_to(self, output_path: str):
+        """按原文件的字节流式写出，只替换已翻译的行"""
+        with open(output_path, "wb") as f:
+            self._write(f)
+
+    def _write(self, stream: BinaryIO):
+        position = 0
+        for index in sorted(self._translated):
+            start = self._starts[index]
+            self._copy(stream, position, start)
+            stream.write(self._translated[index].encode("utf-8"))
+            position = self._ends[index]
+        self._copy(stream, position, self._size)
+
+    def _copy(self, stream: BinaryIO, start: int, end: int):
+        while start < end:
+            chunk_end = min(end, start + COPY_CHUNK_SIZE)
+            stream.write(self._mm[start:chunk_end])
+            self._release(start, chunk_end)
+            start = chunk_end
+
+    def close(self):
+        """释放文件映射，关闭原文件"""
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+        self._mm = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def keep_the_same(self, text: str) -> bool:
+        # 检测是否包含日语字符（平假名、片假名）
+        return not bool(_JAPANESE_RE.search(text))
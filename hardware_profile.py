@@ -0,0 +1,291 @@
+"""
+硬件检测与启动参数选择
+启动时检测 CPU 核心数、内存和 GPU，对候选的量化版本和线程数做一次简短测速，
+把最优的启动参数按硬件指纹缓存下来，之后启动直接复用缓存，不再测速
+"""
+import hashlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+from dataclasses import asdict, dataclass
+from typing import Callable, List, Optional, Tuple
+
+from config_manager import config_manager
+from model_registry import ModelVariant, find_quant_variants
+
+try:
+    import psutil
+except ImportError:  # psutil 为可选依赖
+    psutil = None
+
+# 测速函数：(模型路径, 线程数, 上下文长度, GPU 层数) -> (prompt tokens/s, 生成 tokens/s)
+CalibrationRunner = Callable[[str, int, int, int], Tuple[float, float]]
+
+# 模型文件加载后大约需要的内存倍数（权重 + 运行时开销）
+MODEL_MEMORY_FACTOR = 1.2
+# 上下文较大时为 KV cache 预留的内存（MB）
+KV_CACHE_RESERVE_MB = 1024
+
+
+@dataclass
+class HardwareInfo:
+    """硬件信息"""
+    physical_cores: int
+    logical_cores: int
+    total_ram_mb: int
+    available_ram_mb: int
+    gpu_name: str = ""
+    gpu_vram_mb: int = 0
+    machine: str = ""
+
+    def fingerprint(self, variants: List[ModelVariant]) -> str:
+        """硬件指纹，包含候选模型文件；可用内存会随时变化，不参与计算"""
+        data = {
+            "machine": self.machine,
+            "physical_cores": self.physical_cores,
+            "logical_cores": self.logical_cores,
+            "total_ram_gb": round(self.total_ram_mb / 1024),
+            "gpu": self.gpu_name,
+            "variants": [(v.name, v.size) for v in variants],
+            "use_gpu": bool(config_manager.get_config("use_gpu", False)),
+        }
+        return hashlib.sha1(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class LaunchProfile:
+    """llama-server 的启动参数"""
+    model: str
+    threads: int
+    ctx_size: int
+    gpu_layers: int = 0
+    prompt_tps: float = 0.0
+    gen_tps: float = 0.0
+
+
+def detect_physical_cores() -> int:
+    """检测物理核心数，无法检测时退回逻辑核心数"""
+    if psutil is not None:
+        cores = psutil.cpu_count(logical=False)
+        if cores:
+            return cores
+
+    # Linux：按 (physical id, core id) 去重
+    try:
+        cores = set()
+        physical_id = core_id = None
+        with open("/proc/cpuinfo", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("physical id"):
+                    physical_id = line.split(":", 1)[1].strip()
+                elif line.startswith("core id"):
+                    core_id = line.split(":", 1)[1].strip()
+                elif not line.strip():
+                    if core_id is not None:
+                        cores.add((physical_id, core_id))
+                    physical_id = core_id = None
+        if core_id is not None:
+            cores.add((physical_id, core_id))
+        if cores:
+            return len(cores)
+    except OSError:
+        pass
+
+    return os.cpu_count() or 1
+
+
+def detect_memory() -> Tuple[int, int]:
+    """检测内存，返回（总内存 MB, 可用内存 MB）"""
+    if psutil is not None:
+        memory = psutil.virtual_memory()
+        return memory.total // (1 << 20), memory.available // (1 << 20)
+
+    if os.name == "nt":
+        import ctypes
+
+        class MemoryStatus(ctypes.Structure):
+            _fields_ = [
+                ("dwLength", ctypes.c_ulong),
+                ("dwMemoryLoad", ctypes.c_ulong),
+                ("ullTotalPhys", ctypes.c_ulonglong),
+                ("ullAvailPhys", ctypes.c_ulonglong),
+                ("ullTotalPageFile", ctypes.c_ulonglong),
+                ("ullAvailPageFile", ctypes.c_ulonglong),
+                ("ullTotalVirtual", ctypes.c_ulonglong),
+                ("ullAvailVirtual", ctypes.c_ulonglong),
+                ("ullAvailExtendedVirtual", ctypes.c_ulonglong),
+            ]
+
+        status = MemoryStatus()
+        status.dwLength = ctypes.sizeof(MemoryStatus)
+        ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status))
+        return status.ullTotalPhys // (1 << 20), status.ullAvailPhys // (1 << 20)
+
+    try:
+        info = {}
+        with open("/proc/meminfo", encoding="utf-8") as f:
+            for line in f:
+                name, value = line.split(":", 1)
+                info[name] = int(value.split()[0]) // 1024
+        return info["MemTotal"], info.get("MemAvailable", info.get("MemFree", 0))
+    except (OSError, KeyError, ValueError):
+        return 0, 0
+
+
+def detect_gpu() -> Tuple[str, int]:
+    """检测 NVIDIA GPU，返回（型号, 显存 MB）；没有 GPU 或无法检测时返回 ("", 0)"""
+    if shutil.which("nvidia-smi") is None:
+        return "", 0
+    try:
+        output = subprocess.run(
+            ["nvidia-smi", "--query-gpu=name,memory.total", "--format=csv,noheader,nounits"],
+            capture_output=True, text=True, timeout=5
+        ).stdout
+        name, vram = output.strip().splitlines()[0].rsplit(",", 1)
+        return name.strip(), int(vram.strip())
+    except (OSError, subprocess.SubprocessError, IndexError, ValueError):
+        return "", 0
+
+
+def detect_hardware() -> HardwareInfo:
+    """检测当前机器的硬件信息"""
+    total_ram, available_ram = detect_memory()
+    gpu_name, gpu_vram = detect_gpu()
+    return HardwareInfo(
+        physical_cores=detect_physical_cores(),
+        logical_cores=os.cpu_count() or 1,
+        total_ram_mb=total_ram,
+        available_ram_mb=available_ram,
+        gpu_name=gpu_name,
+        gpu_vram_mb=gpu_vram,
+        machine=f"{platform.system()}-{platform.machine()}",
+    )
+
+
+def candidate_threads(physical_cores: int) -> List[int]:
+    """候选线程数：全部物理核心、留一个核心给界面、一半物理核心"""
+    candidates = {physical_cores, max(1, physical_cores - 1), max(1, physical_cores // 2)}
+    return sorted(candidates, reverse=True)
+
+
+def candidate_models(variants: List[ModelVariant], hardware: HardwareInfo) -> List[ModelVariant]:
+    """过滤出内存放得下的量化版本；都放不下时只保留最小的一个"""
+    if not hardware.available_ram_mb:
+        return list(variants)
+    fitting = [
+        v for v in variants
+        if v.size / (1 << 20) * MODEL_MEMORY_FACTOR <= hardware.available_ram_mb
+    ]
+    return fitting or variants[:1]
+
+
+def choose_ctx_size(hardware: HardwareInfo, model_size: int, configured: int) -> int:
+    """内存紧张时缩小上下文长度"""
+    if not hardware.available_ram_mb:
+        return configured
+    free_mb = hardware.available_ram_mb - model_size / (1 << 20) * MODEL_MEMORY_FACTOR
+    if free_mb < KV_CACHE_RESERVE_MB:
+        return min(configured, 2048)
+    return configured
+
+
+def choose_gpu_layers(hardware: HardwareInfo) -> int:
+    """配置启用 GPU 且检测到 GPU 时把全部层放到 GPU 上"""
+    if config_manager.get_config("use_gpu", False) and hardware.gpu_name:
+        return config_manager.get_config("gpu_layers", 999)
+    return 0
+
+
+def calibrate(hardware: HardwareInfo, variants: List[ModelVariant], runner: CalibrationRunner,
+              min_gen_tps: float, ctx_size: int) -> Optional[LaunchProfile]:
+    """
+    测速并选择启动参数
+    从精度最高的量化版本开始尝试，选出第一个生成速度不低于 min_gen_tps 的版本及其最快的线程数；
+    都达不到时选择生成速度最快的组合
+    """
+    gpu_layers = choose_gpu_layers(hardware)
+    fastest: Optional[LaunchProfile] = None
+    for variant in reversed(candidate_models(variants, hardware)):
+        best: Optional[LaunchProfile] = None
+        variant_ctx = choose_ctx_size(hardware, variant.size, ctx_size)
+        for threads in candidate_threads(hardware.physical_cores):
+            try:
+                prompt_tps, gen_tps = runner(variant.path, threads, variant_ctx, gpu_layers)
+            except Exception as e:
+                print(f"测速失败 {variant.name} threads={threads}: {e}")
+                continue
+            print(f"测速 {variant.name} threads={threads}: prompt {prompt_tps:.1f} t/s, 生成 {gen_tps:.1f} t/s")
+            if best is None or gen_tps > best.gen_tps:
+                best = LaunchProfile(variant.path, threads, variant_ctx, gpu_layers, prompt_tps, gen_tps)
+
+        if best is None:
+            continue
+        if best.gen_tps >= min_gen_tps:
+            return best
+        if fastest is None or best.gen_tps > fastest.gen_tps:
+            fastest = best
+    return fastest
+
+
+class ProfileCache:
+    """按硬件指纹缓存启动参数的 JSON 文件"""
+
+    def __init__(self, path: str = None):
+        self.path = path or os.path.join(config_manager.get_config_dir(), "hardware_profile.json")
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def load(self, fingerprint: str) -> Optional[LaunchProfile]:
+        data = self._read().get(fingerprint)
+        if data is None:
+            return None
+        try:
+            return LaunchProfile(**data)
+        except TypeError:
+            return None
+
+    def save(self, fingerprint: str, profile: LaunchProfile):
+        data = self._read()
+        data[fingerprint] = asdict(profile)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def get_launch_profile(runner: CalibrationRunner, hardware: HardwareInfo = None,
+                       cache: ProfileCache = None, force: bool = False) -> Optional[LaunchProfile]:
+    """
+    获取启动参数，缓存命中时直接返回，否则测速后写入缓存
+    :param runner: 测速函数
+    :param hardware: 硬件信息，为 None 时自动检测
+    :param cache: 缓存，为 None 时使用配置文件旁的 hardware_profile.json
+    :param force: 忽略缓存重新测速
+    :return: 启动参数；找不到任何可用的模型文件时返回 None
+    """
+    hardware = hardware or detect_hardware()
+    cache = cache or ProfileCache()
+    variants = find_quant_variants(config_manager.get_model_path())
+    if not variants:
+        return None
+
+    fingerprint = hardware.fingerprint(variants)
+    if not force:
+        profile = cache.load(fingerprint)
+        if profile is not None and os.path.exists(profile.model):
+            return profile
+
+    print(f"检测到硬件：{hardware}，开始测速选择启动参数")
+    profile = calibrate(
+        hardware, variants, runner,
+        config_manager.get_config("min_gen_tps", 5.0),
+        config_manager.get_ctx_size()
+    )
+    if profile is not None:
+        cache.save(fingerprint, profile)
+    return profile
@@ -0,0 +1,245 @@
+"""
+HTTP 客户端
+对话与文件翻译共用的连接池，与 llama-server 保持长连接，避免每次请求重新建立 TCP 连接
+"""
+import json
+import threading
+from typing import Any, Dict, Iterator, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config_manager import config_manager
+from inference_metrics import inference_metrics
+
+
+class RequestCancelled(Exception):
+    """请求被主动取消"""
+
+
+class CancelScope:
+    """
+    一组可以整体取消的流式请求
+    取消时直接关闭正在读取的响应，llama-server 发现连接断开后会立即释放槽位
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._responses = set()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def check(self):
+        """已取消时抛出 RequestCancelled"""
+        if self._event.is_set():
+            raise RequestCancelled("请求已取消")
+
+    def cancel(self):
+        """取消范围内的所有请求"""
+        self._event.set()
+        with self._lock:
+            responses = list(self._responses)
+            self._responses.clear()
+        for response in responses:
+            try:
+                response.close()
+            except Exception:
+                pass
+
+    def _register(self, response: requests.Response):
+        with self._lock:
+            if not self._event.is_set():
+                self._responses.add(response)
+                return
+        response.close()
+        raise RequestCancelled("请求已取消")
+
+    def _unregister(self, response: requests.Response):
+        with self._lock:
+            self._responses.discard(response)
+
+
+class ServerNotReady(Exception):
+    """llama-server 启动失败，请求无法发送"""
+
+
+class HttpClient:
+    """共享的 HTTP 客户端，内部维护一个带连接池的 requests.Session"""
+
+    def __init__(self, pool_size: int = None):
+        self._pool_size = pool_size
+        self._session: Optional[requests.Session] = None
+        self._adapter: Optional[HTTPAdapter] = None
+        self._lock = threading.Lock()
+        self._request_count = 0
+        # 服务器就绪前请求在这里排队；默认已就绪，不由本程序启动服务器时不受影响
+        self._ready = threading.Event()
+        self._ready.set()
+        self._start_error: Optional[str] = None
+
+    def mark_starting(self):
+        """服务器开始启动，之后的请求等待 mark_ready() 或 mark_failed()"""
+        self._start_error = None
+        self._ready.clear()
+
+    def mark_ready(self):
+        """服务器已就绪，放行排队中的请求"""
+        self._start_error = None
+        self._ready.set()
+
+    def mark_failed(self, error: str):
+        """服务器启动失败，排队中的请求立即以 ServerNotReady 结束"""
+        self._start_error = error
+        self._ready.set()
+
+    @property
+    def server_ready(self) -> bool:
+        return self._ready.is_set() and self._start_error is None
+
+    def wait_until_ready(self, timeout: float = None):
+        """
+        等待服务器就绪
+        :param timeout: 最长等待时间，为 None 时使用配置中的 server_start_timeout；超时后不再等待，直接发送
+        """
+        if timeout is None:
+            timeout = config_manager.get_config("server_start_timeout", 300)
+        self._ready.wait(timeout)
+        if self._start_error is not None:
+            raise ServerNotReady(f"llama-server 启动失败: {self._start_error}")
+
+    @property
+    def pool_size(self) -> int:
+        """连接池大小：文件翻译的并发数再加上对话使用的一个连接"""
+        if self._pool_size is None:
+            return config_manager.get_translate_workers() + 1
+        return self._pool_size
+
+    def _get_session(self) -> requests.Session:
+        """首次使用时创建 Session"""
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    # 每个 llama-server 实例一个连接池，另留一个给测速用的临时服务器
+                    pools = len(config_manager.get_instances()) + 1
+                    adapter = HTTPAdapter(pool_connections=pools, pool_maxsize=self.pool_size)
+                    session = requests.Session()
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    self._adapter = adapter
+                    self._session = session
+        return self._session
+
+    def post(self, url: str, payload: Dict[str, Any], timeout=None, stream: bool = False,
+             wait_ready: bool = True) -> requests.Response:
+        """
+        发送 JSON POST 请求
+        :param url: 请求地址
+        :param payload: 请求体
+        :param timeout: 本次请求的超时时间，为 None 时使用配置中的 request_timeout
+        :param stream: 是否以流式方式读取响应
+        :param wait_ready: 是否先等待服务器就绪；测速和预热请求不经过排队
+        :return: 响应对象
+        """
+        if wait_ready:
+            self.wait_until_ready()
+        if timeout is None:
+            timeout = config_manager.get_config("request_timeout", 120)
+        session = self._get_session()
+        with self._lock:
+            self._request_count += 1
+        return session.post(url, json=payload, timeout=timeout, stream=stream)
+
+    def get(self, url: str, timeout=None) -> requests.Response:
+        """发送 GET 请求（健康检查等），不等待服务器就绪"""
+        if timeout is None:
+            timeout = config_manager.get_config("request_timeout", 120)
+        session = self._get_session()
+        with self._lock:
+            self._request_count += 1
+        return session.get(url, timeout=timeout)
+
+    def stream_chat(self, url: str, payload: Dict[str, Any], scope: CancelScope = None,
+                    timeout=None, metrics_kind: str = None,
+                    enqueued_at: float = None) -> Iterator[Dict[str, Any]]:
+        """
+        以流式方式请求对话接口，逐个产出解析后的 SSE 数据块
+        :param url: 请求地址
+        :param payload: 请求体，会自动加上 "stream": true
+        :param scope: 取消范围，取消后抛出 RequestCancelled
+        :param timeout: 本次请求的超时时间
+        :param metrics_kind: 推理指标中的请求类型（chat / translate），为 None 时不统计
+        :param enqueued_at: 请求进入队列的时间（time.monotonic()），用于统计排队等待
+        """
+        if scope is not None:
+            scope.check()
+        timer = inference_metrics.start_request(metrics_kind, enqueued_at) if metrics_kind else None
+        timings = usage = None
+        response = self.post(url, dict(payload, stream=True), timeout=timeout, stream=True)
+        try:
+            if scope is not None:
+                scope._register(response)
+            response.raise_for_status()
+            finished = False
+            # 读到 [DONE] 后继续把响应读完，连接才能放回连接池复用
+            for line in response.iter_lines():
+                if finished or not line or not line.startswith(b"data: "):
+                    continue
+                data = line[6:].strip()
+                if data == b"[DONE]":
+                    finished = True
+                    continue
+                try:
+                    chunk = json.loads(data)
+                except json.JSONDecodeError:
+                    continue
+                if timer is not None:
+                    # llama-server 在最后一个数据块中附带 timings，OpenAI 格式为 usage
+                    timings = chunk.get("timings", timings)
+                    usage = chunk.get("usage", usage)
+                    choices = chunk.get("choices")
+                    if choices and choices[0].get("delta", {}).get("content"):
+                        timer.on_token()
+                yield chunk
+            if timer is not None:
+                timer.finish(timings, usage)
+        except RequestCancelled:
+            raise
+        except Exception:
+            # 被其他线程关闭连接时，读取会以各种异常结束
+            if scope is not None and scope.cancelled:
+                raise RequestCancelled("请求已取消")
+            raise
+        finally:
+            if scope is not None:
+                scope._unregister(response)
+            response.close()
+
+    def get_stats(self) -> Dict[str, int]:
+        """获取连接复用统计：请求数、新建连接数和复用次数"""
+        connections = 0
+        if self._adapter is not None:
+            pools = self._adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is not None:
+                    connections += pool.num_connections
+        return {
+            "requests": self._request_count,
+            "connections": connections,
+            "reused": max(0, self._request_count - connections),
+        }
+
+    def close(self):
+        """关闭所有连接"""
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+                self._adapter = None
+
+
+# 全局 HTTP 客户端实例
+http_client = HttpClient()
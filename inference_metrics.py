@@ -0,0 +1,289 @@
+"""
+推理指标统计
+记录每个请求的排队等待、首 token 延迟、生成速度、总耗时和 token 数，
+以滚动直方图汇总，并通过状态接口、定期 JSONL 日志和可选的 Prometheus 文本接口对外提供
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+from config_manager import config_manager
+
+# Prometheus 直方图的分桶上界（秒 / tokens每秒 / token 数共用一组，按量级覆盖）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+# 每个请求记录的指标：名称 -> 说明
+METRIC_FIELDS = {
+    "queue_wait_seconds": "请求进入队列到开始发送的等待时间",
+    "ttft_seconds": "开始发送到收到第一个 token 的时间",
+    "decode_tokens_per_second": "生成阶段的 tokens/s",
+    "prompt_eval_tokens_per_second": "预填充阶段的 tokens/s（来自 llama-server 日志）",
+    "total_seconds": "请求总耗时",
+    "prompt_tokens": "提示词中重新计算的 token 数",
+    "cached_prompt_tokens": "提示词中命中槽位缓存、无需重新计算的 token 数",
+    "completion_tokens": "生成 token 数",
+    "draft_tokens": "投机解码中草稿模型起草的 token 数",
+    "draft_accepted_tokens": "投机解码中被主模型接受的草稿 token 数",
+}
+
+
+class RollingHistogram:
+    """
+    滚动直方图
+    保留最近 window 个样本用于计算分位数，同时维护累计分桶计数供 Prometheus 使用
+    """
+
+    def __init__(self, window: int = 1024, buckets=DEFAULT_BUCKETS):
+        self._samples = deque(maxlen=window)
+        self._buckets = buckets
+        self._bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self._samples.append(value)
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self._buckets):
+            if value <= bound:
+                self._bucket_counts[i] += 1
+
+    def snapshot(self) -> Dict[str, float]:
+        """最近窗口内样本的均值和分位数"""
+        samples = sorted(self._samples)
+        if not samples:
+            return {"count": self.count}
+
+        def pick(fraction):
+            return samples[min(len(samples) - 1, int(round(fraction * (len(samples) - 1))))]
+
+        return {
+            "count": self.count,
+            "mean": sum(samples) / len(samples),
+            "p50": pick(0.50),
+            "p90": pick(0.90),
+            "p99": pick(0.99),
+        }
+
+    def prometheus_lines(self, name: str, labels: str) -> List[str]:
+        lines = [
+            f'{name}_bucket{{{labels},le="{bound}"}} {count}'
+            for bound, count in zip(self._buckets, self._bucket_counts)
+        ]
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+class RequestTimer:
+    """
+    单个请求的计时器
+    在发送前创建，收到 token 时调用 on_token()，结束时调用 finish() 写入统计
+    """
+
+    def __init__(self, metrics: "InferenceMetrics", kind: str, enqueued_at: Optional[float] = None):
+        self._metrics = metrics
+        self.kind = kind
+        self.started = time.monotonic()
+        self.enqueued_at = enqueued_at
+        self.first_token_at: Optional[float] = None
+        self.token_chunks = 0
+
+    def on_token(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.monotonic()
+        self.token_chunks += 1
+
+    def finish(self, timings: Optional[dict] = None, usage: Optional[dict] = None):
+        """
+        结束计时
+        :param timings: llama-server 返回的 timings 字段
+        :param usage: OpenAI 格式的 usage 字段
+        """
+        finished = time.monotonic()
+        timings = timings or {}
+        usage = usage or {}
+        values = {"total_seconds": finished - self.started}
+        if self.enqueued_at is not None:
+            values["queue_wait_seconds"] = max(0.0, self.started - self.enqueued_at)
+        if self.first_token_at is not None:
+            values["ttft_seconds"] = self.first_token_at - self.started
+
+        completion_tokens = timings.get("predicted_n", usage.get("completion_tokens", self.token_chunks))
+        # llama-server 的 prompt_n 只含重新计算的部分，cache_n 为复用的部分；
+        # OpenAI 格式的 prompt_tokens 包含缓存部分
+        if "prompt_n" in timings:
+            prompt_tokens = timings["prompt_n"]
+            cached_tokens = timings.get("cache_n")
+        else:
+            prompt_tokens = usage.get("prompt_tokens")
+            cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+            if cached_tokens is not None and prompt_tokens is not None:
+                prompt_tokens -= cached_tokens
+        if prompt_tokens is not None:
+            values["prompt_tokens"] = prompt_tokens
+        if cached_tokens is not None:
+            values["cached_prompt_tokens"] = cached_tokens
+        values["completion_tokens"] = completion_tokens
+        # 启用投机解码时 llama-server 会返回起草和被接受的 token 数
+        if "draft_n" in timings:
+            values["draft_tokens"] = timings["draft_n"]
+            values["draft_accepted_tokens"] = timings.get("draft_n_accepted", 0)
+
+        if timings.get("predicted_per_second"):
+            values["decode_tokens_per_second"] = timings["predicted_per_second"]
+        elif self.first_token_at is not None and completion_tokens > 1 and finished > self.first_token_at:
+            values["decode_tokens_per_second"] = (completion_tokens - 1) / (finished - self.first_token_at)
+
+        self._metrics.record(self.kind, values)
+
+
+class InferenceMetrics:
+    """推理指标汇总，按请求类型（chat / translate / server）分别统计，server 为解析服务端日志得到的计时"""
+
+    def __init__(self, window: int = 1024):
+        self._window = window
+        self._histograms: Dict[str, Dict[str, RollingHistogram]] = {}
+        self._lock = threading.Lock()
+        self._log_thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._httpd: Optional[ThreadingHTTPServer] = None
+
+    def start_request(self, kind: str, enqueued_at: Optional[float] = None) -> RequestTimer:
+        """开始记录一个请求"""
+        return RequestTimer(self, kind, enqueued_at)
+
+    def record(self, kind: str, values: Dict[str, float]):
+        """写入一个请求的指标"""
+        with self._lock:
+            histograms = self._histograms.setdefault(kind, {})
+            for name, value in values.items():
+                histogram = histograms.get(name)
+                if histogram is None:
+                    histogram = histograms[name] = RollingHistogram(self._window)
+                histogram.observe(value)
+
+    def snapshot(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """各请求类型、各指标的统计快照，prompt_cache 为累计的提示词缓存命中情况"""
+        with self._lock:
+            kinds = list(self._histograms)
+            result = {
+                kind: {name: histogram.snapshot() for name, histogram in histograms.items()}
+                for kind, histograms in self._histograms.items()
+            }
+        for kind in kinds:
+            result[kind]["prompt_cache"] = self.prompt_cache_stats(kind)
+            if "draft_tokens" in result[kind]:
+                result[kind]["speculative"] = self.speculative_stats(kind)
+        return result
+
+    def prompt_cache_stats(self, kind: str) -> Dict[str, float]:
+        """累计的提示词缓存命中 token 数、重新计算的 token 数和命中率"""
+        with self._lock:
+            histograms = self._histograms.get(kind, {})
+            cached = histograms["cached_prompt_tokens"].sum if "cached_prompt_tokens" in histograms else 0
+            evaluated = histograms["prompt_tokens"].sum if "prompt_tokens" in histograms else 0
+        total = cached + evaluated
+        return {
+            "cached": int(cached),
+            "evaluated": int(evaluated),
+            "hit_rate": cached / total if total else 0.0,
+        }
+
+    def speculative_stats(self, kind: str) -> Dict[str, float]:
+        """累计的草稿 token 数、被接受的 token 数和接受率"""
+        with self._lock:
+            histograms = self._histograms.get(kind, {})
+            drafted = histograms["draft_tokens"].sum if "draft_tokens" in histograms else 0
+            accepted = histograms["draft_accepted_tokens"].sum if "draft_accepted_tokens" in histograms else 0
+        return {
+            "drafted": int(drafted),
+            "accepted": int(accepted),
+            "acceptance_rate": accepted / drafted if drafted else 0.0,
+        }
+
+    def to_prometheus(self) -> str:
+        """Prometheus 文本格式"""
+        lines = []
+        with self._lock:
+            for name, description in METRIC_FIELDS.items():
+                metric = f"aiassistant_{name}"
+                lines.append(f"# HELP {metric} {description}")
+                lines.append(f"# TYPE {metric} histogram")
+                for kind, histograms in self._histograms.items():
+                    if name in histograms:
+                        lines.extend(histograms[name].prometheus_lines(metric, f'kind="{kind}"'))
+        return "\n".join(lines) + "\n"
+
+    def start_jsonl_log(self, path: str, interval: float):
+        """每隔 interval 秒把快照追加到 JSONL 文件"""
+        if self._log_thread is not None:
+            return
+
+        def run():
+            while not self._stop_event.wait(interval):
+                line = json.dumps({"time": time.time(), "metrics": self.snapshot()}, ensure_ascii=False)
+                try:
+                    with open(path, "a", encoding="utf-8") as f:
+                        f.write(line + "\n")
+                except OSError as e:
+                    print(f"写入指标日志失败: {e}")
+
+        self._log_thread = threading.Thread(target=run, daemon=True)
+        self._log_thread.start()
+
+    def start_http_endpoint(self, port: int):
+        """在 127.0.0.1:port/metrics 提供 Prometheus 文本格式的指标"""
+        if self._httpd is not None:
+            return
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.to_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self._httpd.daemon_threads = True
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        print(f"指标接口已启动：http://127.0.0.1:{port}/metrics")
+
+    def start_from_config(self):
+        """按配置启动 JSONL 日志和 Prometheus 接口"""
+        interval = config_manager.get_config("metrics_log_interval", 0)
+        if interval:
+            path = config_manager.get_config(
+                "metrics_log_path", os.path.join(config_manager.get_config_dir(), "metrics.jsonl")
+            )
+            self.start_jsonl_log(path, interval)
+
+        port = config_manager.get_config("metrics_port", 0)
+        if port:
+            self.start_http_endpoint(port)
+
+    def stop(self):
+        """停止日志线程和 HTTP 接口"""
+        self._stop_event.set()
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+
+# 全局推理指标实例
+inference_metrics = InferenceMetrics()
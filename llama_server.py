@@ -1 +1,315 @@
-import subprocessfrom config_manager import config_managerclass LlamaServer:    def __init__(self):        self.process = None    def start(self):        model = config_manager.get_config("model")        ctx = str(config_manager.get_config("ctx_size"))        threads = str(config_manager.get_config("threads"))        port = str(config_manager.get_config("port"))        cmd = [            "llama-server.exe",            "--model", model,            "--ctx-size", ctx,            "--threads", threads,            "--port", port        ]        self.process = subprocess.Popen(            cmd,            stdout=subprocess.PIPE,            stderr=subprocess.STDOUT,            text=True,            creationflags=subprocess.CREATE_NO_WINDOW        )        # 阻塞等待模型加载完毕        while True:            line = self.process.stdout.readline()            if not line:                continue            print(line.strip())  # 你可以选择打印或不打印            if "listening on" in line:                break    def stop(self):        if self.process is None:            return        try:            print("正在终止llama-server进程...")            self.process.terminate()            # 等待进程结束，最多等待5秒            self.process.wait(timeout=5)            print("llama-server进程已终止")        except subprocess.TimeoutExpired:            print("进程终止超时，强制杀死进程...")            self.process.kill()            self.process.wait()            print("进程已被强制杀死")        except Exception as e:            print(f"终止进程时出错: {e}")            # 即使出错也继续执行            pass
\ No newline at end of file
+import os
+import subprocess
+import threading
+import time
+
+import requests
+
+from config_manager import config_manager
+from conversation_context import DEFAULT_SYSTEM_PROMPT
+from handler.base import BATCH_SYSTEM_PROMPT, SINGLE_SYSTEM_PROMPT
+from hardware_profile import get_launch_profile
+from http_client import http_client
+from server_output import MAX_LINE_CHARS, ServerOutputMonitor
+
+try:
+    import psutil
+except ImportError:  # psutil 为可选依赖，仅在 Windows 上设置 CPU 亲和性时需要
+    psutil = None
+
+# 测速时使用的提示词和生成长度
+CALIBRATION_PROMPT = "请把下面的句子翻译成英文：今天天气很好，我们一起去公园散步吧。"
+CALIBRATION_TOKENS = 32
+# 启动时轮询 /health 的间隔（秒）
+HEALTH_POLL_INTERVAL = 0.25
+# 启动失败时错误信息中附带的最近输出行数
+STARTUP_LOG_LINES = 50
+
+
+class ServerStartError(Exception):
+    """llama-server 启动失败"""
+
+
+class LlamaServer:
+    def __init__(self, model=None, threads=None, ctx_size=None, port=None, gpu_layers=None, cpus=None,
+                 draft_model=None, config=None):
+        """
+        未指定的启动参数从配置文件读取；stop() 之后实例不能再次启动
+        :param cpus: 绑定的 CPU 编号列表，为 None 时不绑定
+        :param draft_model: 投机解码的草稿模型，为 None 时从配置读取，为空字符串时不启用
+        :param config: 读取启动参数的配置，默认为全局配置；切换模型时新实例使用重新读取的配置
+        """
+        self.config = config if config is not None else config_manager
+        self.process = None
+        self.cpus = cpus
+        self.draft_model = draft_model
+        self.model = model
+        self.threads = threads
+        self.ctx_size = ctx_size
+        self.port = port
+        self.gpu_layers = gpu_layers
+        self.output = ServerOutputMonitor(self.config.get_config("server_log_lines", 1000))
+        self._reader = None
+        self._ready = threading.Event()
+        self._stopping = threading.Event()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port or self.config.get_port()}"
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def _apply_launch_profile(self):
+        """配置了 auto_profile 时，用按硬件选出的启动参数填充未指定的参数"""
+        if not self.config.get_config("auto_profile", False):
+            return
+        if self.model is not None or self.threads is not None or self.ctx_size is not None:
+            return
+
+        profile = get_launch_profile(LlamaServer.measure_speed)
+        if profile is None:
+            print("未找到可用的模型文件，使用配置文件中的启动参数")
+            return
+        print(f"使用启动参数：{profile}")
+        self.model = profile.model
+        self.threads = profile.threads
+        self.ctx_size = profile.ctx_size
+        self.gpu_layers = profile.gpu_layers
+
+    def start(self, wait: bool = True):
+        """
+        启动 llama-server
+        :param wait: 是否阻塞到 /health 报告就绪
+        """
+        self._apply_launch_profile()
+        self._launch()
+        if wait:
+            self.wait_until_ready()
+
+    def start_in_background(self, on_ready=None, on_error=None):
+        """
+        在后台线程中启动服务器并预热，不阻塞调用方
+        就绪前发出的对话和翻译请求在 http_client 中排队，就绪后自动发送
+        :param on_ready: 就绪后在后台线程中调用
+        :param on_error: 启动失败时在后台线程中调用，参数为错误信息
+        """
+        http_client.mark_starting()
+
+        def run():
+            try:
+                self.start()
+                if self.config.get_config("warmup", True):
+                    self.warm_up()
+            except Exception as e:
+                print(f"llama-server 启动失败: {e}")
+                http_client.mark_failed(str(e))
+                if on_error:
+                    on_error(str(e))
+                return
+            http_client.mark_ready()
+            if on_ready:
+                on_ready()
+
+        threading.Thread(target=run, daemon=True, name="llama-server-start").start()
+
+    def _launch(self):
+        """启动进程，不等待模型加载"""
+        model = self.model or self.config.get_config("model")
+        ctx = str(self.ctx_size or self.config.get_config("ctx_size"))
+        threads = str(self.threads or self.config.get_config("threads"))
+        self.port = self.port or self.config.get_port()
+        parallel = str(self.config.get_parallel())
+        gpu_layers = self.gpu_layers if self.gpu_layers is not None else self.config.get_config("gpu_layers", 0)
+
+        cmd = [
+            self.config.get_config("server_executable", "llama-server.exe" if os.name == "nt" else "llama-server"),
+            "--model", model,
+            "--ctx-size", ctx,
+            "--threads", threads,
+            "--parallel", parallel,
+            "--port", str(self.port)
+        ]
+        if gpu_layers:
+            cmd += ["--n-gpu-layers", str(gpu_layers)]
+
+        # 投机解码：小模型起草，主模型一次前向验证多个 token
+        draft_model = self.draft_model if self.draft_model is not None else self.config.get_draft_model()
+        if draft_model:
+            cmd += [
+                "--model-draft", draft_model,
+                "--draft-max", str(self.config.get_draft_max()),
+                "--draft-min", str(self.config.get_draft_min())
+            ]
+            draft_p_min = self.config.get_draft_p_min()
+            if draft_p_min is not None:
+                cmd += ["--draft-p-min", str(draft_p_min)]
+            if gpu_layers:
+                cmd += ["--n-gpu-layers-draft", str(gpu_layers)]
+
+        if self._stopping.is_set():
+            raise ServerStartError("启动已取消")
+        self.process = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+            creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0)
+        )
+        self._apply_cpu_affinity()
+        self._reader = threading.Thread(target=self._drain_output, daemon=True, name="llama-server-output")
+        self._reader.start()
+
+    def _apply_cpu_affinity(self):
+        """把进程绑定到指定的 CPU 上；进程启动后才创建的计算线程会继承这个设置"""
+        if not self.cpus:
+            return
+        try:
+            if hasattr(os, "sched_setaffinity"):
+                os.sched_setaffinity(self.process.pid, self.cpus)
+            elif psutil is not None:
+                psutil.Process(self.process.pid).cpu_affinity(list(self.cpus))
+            else:
+                print("设置 CPU 亲和性需要安装 psutil，已忽略 cpus 配置")
+                return
+            print(f"llama-server（端口 {self.port}）已绑定到 CPU {self.cpus}")
+        except Exception as e:
+            print(f"设置 CPU 亲和性失败: {e}")
+
+    def _drain_output(self):
+        """
+        在服务器整个运行期间持续读取进程输出，避免管道写满后服务器阻塞
+        输出保存在有界的环形缓冲区中并解析计时信息；进程退出时读到 EOF 结束
+        """
+        stdout = self.process.stdout
+        for line in iter(lambda: stdout.readline(MAX_LINE_CHARS), ""):
+            self.output.feed(line)
+            if not self._ready.is_set():
+                print(line.rstrip())
+
+    def get_recent_logs(self, count: int = 100):
+        """最近的服务器输出，用于诊断"""
+        return self.output.recent_lines(count)
+
+    def wait_until_ready(self, timeout: float = None):
+        """
+        轮询 /health 直到服务器就绪
+        :param timeout: 最长等待时间（秒），为 None 时使用配置中的 server_start_timeout
+        :raises ServerStartError: 进程退出、超时或启动被取消
+        """
+        if timeout is None:
+            timeout = self.config.get_config("server_start_timeout", 300)
+        deadline = time.monotonic() + timeout
+        health_url = f"{self.base_url}/health"
+
+        while True:
+            if self._stopping.is_set():
+                self._terminate()
+                raise ServerStartError("启动已取消")
+
+            code = self.process.poll()
+            if code is not None:
+                self._reader.join(timeout=1)
+                recent = "\n".join(self.output.recent_lines(STARTUP_LOG_LINES))
+                raise ServerStartError(f"llama-server 进程已退出（退出码 {code}）\n{recent}")
+
+            try:
+                # 模型加载中返回 503，加载完成后返回 200
+                if http_client.get(health_url, timeout=2).status_code == 200:
+                    self._ready.set()
+                    print(f"llama-server 已就绪：{self.base_url}")
+                    return
+            except requests.RequestException:
+                pass
+
+            if time.monotonic() > deadline:
+                self._terminate()
+                raise ServerStartError(f"等待 llama-server 就绪超时（{timeout} 秒）")
+            self._stopping.wait(HEALTH_POLL_INTERVAL)
+
+    def warm_up(self):
+        """预热：在每个槽位上预先计算对应的系统提示词，第一个真实请求只需计算新增的部分"""
+        url = f"{self.base_url}/v1/chat/completions"
+        translate_prompt = BATCH_SYSTEM_PROMPT if self.config.get_batch_size() > 1 else SINGLE_SYSTEM_PROMPT
+        chat_slot = self.config.get_chat_slot()
+        started = time.monotonic()
+        for slot in range(max(1, self.config.get_parallel())):
+            system_prompt = DEFAULT_SYSTEM_PROMPT if slot == chat_slot else translate_prompt
+            payload = {
+                "model": "qwen3-4b",
+                "messages": [
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": "你好"}
+                ],
+                "max_tokens": 1,
+                "cache_prompt": True
+            }
+            if self.config.get_slot_affinity():
+                payload["id_slot"] = slot
+            try:
+                response = http_client.post(url, payload, wait_ready=False)
+                response.raise_for_status()
+                response.close()
+            except requests.RequestException as e:
+                print(f"预热失败，跳过: {e}")
+                return
+        print(f"预热完成，用时 {time.monotonic() - started:.2f} 秒")
+
+    @staticmethod
+    def measure_speed(model: str, threads: int, ctx_size: int, gpu_layers: int):
+        """
+        用给定参数临时启动一个 llama-server 并测速
+        :return: (prompt tokens/s, 生成 tokens/s)
+        """
+        server = LlamaServer(
+            model=model, threads=threads, ctx_size=ctx_size, gpu_layers=gpu_layers,
+            port=config_manager.get_config("calibration_port", config_manager.get_port() + 100)
+        )
+        server.start()
+        try:
+            payload = {
+                "model": "qwen3-4b",
+                "messages": [{"role": "user", "content": CALIBRATION_PROMPT}],
+                "max_tokens": CALIBRATION_TOKENS,
+                "cache_prompt": False
+            }
+            url = f"http://127.0.0.1:{server.port}/v1/chat/completions"
+            started = time.time()
+            r = http_client.post(url, payload, wait_ready=False)
+            r.raise_for_status()
+            timings = r.json().get("timings")
+            if timings:
+                return timings.get("prompt_per_second", 0.0), timings.get("predicted_per_second", 0.0)
+            # 旧版本 llama-server 不返回 timings，只能按总耗时估算生成速度
+            return 0.0, CALIBRATION_TOKENS / max(time.time() - started, 1e-6)
+        finally:
+            server.stop()
+
+    def stop(self):
+        """停止服务器；正在后台启动时取消启动"""
+        self._stopping.set()
+        self._terminate()
+
+    def _terminate(self):
+        process = self.process
+        if process is None:
+            return
+
+        try:
+            print("正在终止llama-server进程...")
+            process.terminate()
+            # 等待进程结束，最多等待5秒
+            process.wait(timeout=5)
+            print("llama-server进程已终止")
+        except subprocess.TimeoutExpired:
+            print("进程终止超时，强制杀死进程...")
+            process.kill()
+            process.wait()
+            print("进程已被强制杀死")
+        except Exception as e:
+            print(f"终止进程时出错: {e}")
+            # 即使出错也继续执行
+            pass
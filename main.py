@@ -1,16 +1,18 @@
 import os
 import sys
 
-from PySide6.QtCore import QTimer
 from PySide6.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QTextEdit, QLineEdit,
     QPushButton, QFileDialog, QMessageBox, QComboBox, QProgressBar
 )
 
+from chat_renderer import MessageNotifier, StreamingTextRenderer
 from config_manager import config_manager
 from conversation_worker import ConversationManager
-from llama_server import LlamaServer
+from inference_metrics import inference_metrics
+from server_pool import ServerPool
 from translation_manager import TranslationManager
+from translation_progress import format_eta
 
 
 class TranslatorGUI(QWidget):
@@ -28,17 +30,30 @@ class TranslatorGUI(QWidget):
 
         # 预加载配置以确保只读取一次
         config_manager.load_config()
+        # 按配置启动推理指标日志和 Prometheus 接口
+        inference_metrics.start_from_config()
 
         # 初始化对话管理系统
         self.conversation_manager = ConversationManager(config_manager.get_api_url())
         self.conversation_manager.set_gui_update_callback(self.on_conversation_message)
         self.conversation_manager.start()
 
+        # 在后台启动 llama-server（一个或多个实例），模型加载与界面构建同时进行；
+        # 加载完成前发出的对话和翻译请求会排队等待
+        message_queue = self.conversation_manager.message_queue
+        self.server = ServerPool()
+        self.server.start_in_background(
+            on_ready=lambda: message_queue.put_system_message("模型已加载完毕，可以开始对话了"),
+            on_error=lambda error: message_queue.put_error_message(f"llama-server 启动失败：{error}")
+        )
+
         layout = QVBoxLayout()
 
         self.chat_box = QTextEdit()
         self.chat_box.setReadOnly(True)
         layout.addWidget(self.chat_box)
+        # 流式回复按帧合并写入，避免逐 token 刷新界面
+        self.reply_renderer = StreamingTextRenderer(self.chat_box)
 
         self.input_box = QLineEdit()
         self.input_box.setPlaceholderText("输入要对话的内容...")
@@ -48,6 +63,11 @@ class TranslatorGUI(QWidget):
         self.send_btn.clicked.connect(self.handle_translate)
         layout.addWidget(self.send_btn)
 
+        self.stop_btn = QPushButton("停止")
+        self.stop_btn.setEnabled(False)
+        self.stop_btn.clicked.connect(self.handle_stop)
+        layout.addWidget(self.stop_btn)
+
         self.file_btn = QPushButton("选择文件并翻译")
         self.file_btn.clicked.connect(self.handle_file_translate)
         layout.addWidget(self.file_btn)
@@ -57,6 +77,12 @@ class TranslatorGUI(QWidget):
         self.lang_box.setCurrentText("中文")  # 默认中文
         layout.addWidget(self.lang_box)
 
+        # 同一模型的不同量化版本，运行中可以切换
+        self.model_box = QComboBox()
+        self.model_box.activated.connect(self.handle_model_switch)
+        layout.addWidget(self.model_box)
+        self.refresh_model_box()
+
         self.progress = QProgressBar()
         self.progress.setValue(0)
         self.progress.setVisible(False)  # 默认隐藏
@@ -64,14 +90,12 @@ class TranslatorGUI(QWidget):
 
         self.setLayout(layout)
 
-        # 设置定时器定期处理消息队列
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.process_conversation_messages)
-        self.timer.start(100)  # 每100毫秒检查一次
-
-        # 启动 llama-server
-        self.server = LlamaServer()
-        self.server.start()
+        # 工作线程写入消息后通过信号唤醒界面线程处理，不再定时轮询
+        self.message_notifier = MessageNotifier(self)
+        self.message_notifier.message_available.connect(self.process_conversation_messages)
+        self.conversation_manager.set_message_notifier(self.message_notifier.notify)
+        # 处理界面创建之前已经写入的消息
+        self.message_notifier.notify()
 
     def on_conversation_message(self, msg_type, content, metadata):
         """处理来自对话系统的消息"""
@@ -82,13 +106,14 @@ class TranslatorGUI(QWidget):
                     self.chat_box.append("AI：")
                     self._current_reply_started = True
 
-                # 追加回复内容
-                self.chat_box.insertPlainText(content)
-
-                # 强制GUI刷新
-                QApplication.processEvents()
+                # 追加回复内容，下一帧统一写入
+                self.reply_renderer.append(content)
 
             elif metadata.get("complete"):  # 完整回复结束
+                self.reply_renderer.flush()
+                print(f"渲染统计: {self.reply_renderer.get_stats()}")
+                if metadata.get("cancelled"):
+                    self.chat_box.append("[已停止生成]")
                 # 添加换行和分隔符
                 self.chat_box.append("\n" + "-" * 30 + "\n")
                 self._current_reply_started = False
@@ -96,15 +121,24 @@ class TranslatorGUI(QWidget):
                 # 重新启用发送按钮
                 self.send_btn.setEnabled(True)
                 self.send_btn.setText("对话")
+                self.update_stop_button()
 
         elif msg_type == "system":
+            self.reply_renderer.flush()
             self.chat_box.append(f"[系统] {content}\n")
+            if metadata.get("model_switch"):
+                self.refresh_model_box()
 
         elif msg_type == "error":
+            self.reply_renderer.flush()
             self.chat_box.append(f"[错误] {content}\n")
+            if metadata.get("model_switch"):
+                self.refresh_model_box()
+                return
             # 出错时也要重新启用按钮
             self.send_btn.setEnabled(True)
             self.send_btn.setText("对话")
+            self.update_stop_button()
 
     def handle_translate(self):
         """
@@ -116,10 +150,13 @@ class TranslatorGUI(QWidget):
             return
 
         # 显示用户输入
+        self.reply_renderer.flush()
         self.chat_box.append(f"你：{text}")
 
         # 通过消息队列发送给AI工作线程
-        self.conversation_manager.send_message(text)
+        if not self.conversation_manager.send_message(text):
+            self.chat_box.append("[错误] 待处理的消息过多，请稍后再试\n")
+            return
 
         # 清空输入框
         self.input_box.clear()
@@ -127,6 +164,62 @@ class TranslatorGUI(QWidget):
         # 禁用发送按钮防止重复点击
         self.send_btn.setEnabled(False)
         self.send_btn.setText("发送中...")
+        self.update_stop_button()
+
+    def handle_stop(self):
+        """
+            stop the running chat generation and file translation
+        :return: none
+        """
+        if not self.send_btn.isEnabled():
+            self.conversation_manager.cancel_generation()
+
+        if self.translation_manager.is_translating():
+            # 后台线程退出时会发出 cancelled 信号，由 on_translation_cancelled 恢复界面
+            self.translation_manager.cancel()
+
+    def update_stop_button(self, translating=None):
+        """对话生成中或文件翻译中时启用停止按钮"""
+        if translating is None:
+            translating = bool(self.translation_manager.is_translating())
+        self.stop_btn.setEnabled(not self.send_btn.isEnabled() or translating)
+
+    def refresh_model_box(self):
+        """列出可切换的量化版本并选中当前使用的模型"""
+        variants = self.server.list_variants()
+        current = os.path.abspath(self.server.model_path)
+        self.model_box.clear()
+        for variant in variants:
+            label = f"{variant.quant or variant.name}（{variant.size / (1 << 30):.1f} GB）"
+            self.model_box.addItem(label, variant.path)
+            if os.path.abspath(variant.path) == current:
+                self.model_box.setCurrentIndex(self.model_box.count() - 1)
+        self.model_box.setEnabled(len(variants) > 1 and not self.server.switching)
+
+    def handle_model_switch(self, index):
+        """
+            switch to another quantization of the model without restarting
+        :param index: selected index of the model box
+        """
+        model_path = self.model_box.itemData(index)
+        if not model_path or os.path.abspath(model_path) == os.path.abspath(self.server.model_path):
+            return
+
+        message_queue = self.conversation_manager.message_queue
+        started = self.server.switch_model(
+            model_path,
+            on_ready=lambda: message_queue.put_system_message(
+                f"已切换到 {os.path.basename(model_path)}", {"model_switch": True}),
+            on_error=lambda error: message_queue.put_error_message(
+                f"切换模型失败，继续使用原来的模型：{error}", {"model_switch": True})
+        )
+        if not started:
+            self.chat_box.append("[系统] 模型加载完成前或上一次切换结束前不能切换模型\n")
+            self.refresh_model_box()
+            return
+
+        self.model_box.setEnabled(False)
+        self.chat_box.append(f"[系统] 正在切换到 {os.path.basename(model_path)}，切换期间可以继续对话和翻译\n")
 
     def handle_file_translate(self):
         """
@@ -146,16 +239,19 @@ class TranslatorGUI(QWidget):
                 target_lang,
                 progress_callback=self.update_progress_bar,
                 finished_callback=self.on_translation_finished,
-                error_callback=self.on_translation_error
+                error_callback=self.on_translation_error,
+                cancelled_callback=self.on_translation_cancelled
             )
 
             # 显示进度条
             self.progress.setVisible(True)
             self.progress.setValue(0)
+            self.progress.setFormat("%p%")
 
             # 禁用按钮防止重复点击
             self.file_btn.setEnabled(False)
             self.file_btn.setText("翻译中...")
+            self.update_stop_button(translating=True)
 
         except Exception as e:
             QMessageBox.critical(self, "错误", str(e))
@@ -163,13 +259,17 @@ class TranslatorGUI(QWidget):
     def update_progress_bar(self, done, total):
         percent = int(done / total * 100)
         self.progress.setValue(percent)
+        # 按已测得的翻译速度显示剩余时间
+        handler = self.translation_manager.current_handler
+        eta = format_eta(handler.progress.eta_seconds) if handler is not None else ""
+        self.progress.setFormat(f"%p%  剩余约 {eta}" if eta else "%p%")
 
-    def on_translation_finished(self, result, target_lang, file_path):
+    def on_translation_finished(self, output_path, target_lang, file_path):
         """
             finish translation
-        :param result: the translated result
+        :param output_path: the translated file, already written by the worker
         :param target_lang: target language
-        :param file_path: output path
+        :param file_path: input file path
         """
         # 翻译完成后隐藏进度条
         self.progress.setVisible(False)
@@ -177,19 +277,9 @@ class TranslatorGUI(QWidget):
         # 恢复按钮状态
         self.file_btn.setEnabled(True)
         self.file_btn.setText("选择文件并翻译")
+        self.update_stop_button(translating=False)
 
-        # 保存结果到与输入文件相同的文件夹
-        input_dir = os.path.dirname(file_path)
-        input_filename = os.path.splitext(os.path.basename(file_path))[0]
-        output_filename = f"{input_filename}_translated.txt"
-        output_path = os.path.join(input_dir, output_filename)
-
-        try:
-            with open(output_path, "w", encoding="utf-8") as f:
-                f.write(result)
-            QMessageBox.information(self, "完成", f"翻译完成（{target_lang}），已保存到：{output_path}")
-        except Exception as e:
-            QMessageBox.critical(self, "错误", f"保存文件失败：{str(e)}")
+        QMessageBox.information(self, "完成", f"翻译完成（{target_lang}），已保存到：{output_path}")
 
     def on_translation_error(self, error_msg):
         """
@@ -202,13 +292,33 @@ class TranslatorGUI(QWidget):
         # 恢复按钮状态
         self.file_btn.setEnabled(True)
         self.file_btn.setText("选择文件并翻译")
+        self.update_stop_button(translating=False)
 
         # 显示错误信息
         QMessageBox.critical(self, "翻译错误", f"翻译过程中发生错误：\n{error_msg}")
 
+    def on_translation_cancelled(self, file_path, temp_path):
+        """
+            when translation is cancelled by the user
+        :param file_path: input file path
+        :param temp_path: the saved partial translation, empty if saving failed
+        """
+        self.progress.setVisible(False)
+
+        self.file_btn.setEnabled(True)
+        self.file_btn.setText("选择文件并翻译")
+        self.update_stop_button(translating=False)
+
+        QMessageBox.information(
+            self, "已取消",
+            f"翻译已取消，{'已完成的部分已保存到：' + temp_path if temp_path else '临时文件保存失败'}。\n"
+            f"再次翻译 {os.path.basename(file_path)} 时会从断点继续。"
+        )
+
     def process_conversation_messages(self):
         """处理对话系统输出队列中的消息"""
         try:
+            self.message_notifier.acknowledge()
             self.conversation_manager.process_output_messages()
         except Exception as e:
             print(f"处理对话消息时出错: {e}")
@@ -217,15 +327,6 @@ class TranslatorGUI(QWidget):
         """窗口关闭事件"""
         print("开始关闭应用程序...")
 
-        try:
-            # 停止定时器
-            if hasattr(self, 'timer'):
-                print("正在停止定时器...")
-                self.timer.stop()
-                print("定时器已停止")
-        except Exception as e:
-            print(f"停止定时器时出错: {e}")
-
         try:
             # 停止对话系统
             if hasattr(self, 'conversation_manager'):
@@ -244,6 +345,11 @@ class TranslatorGUI(QWidget):
         except Exception as e:
             print(f"停止服务器时出错: {e}")
 
+        try:
+            inference_metrics.stop()
+        except Exception as e:
+            print(f"停止指标统计时出错: {e}")
+
         print("正在接受关闭事件...")
         event.accept()
         print("关闭事件已接受")
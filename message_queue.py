@@ -1,12 +1,23 @@
 """
 消息队列系统
 用于GUI和后台工作线程之间的异步通信
+消费者阻塞等待消息或停止信号，不做定时轮询；队列有容量上限，生产者过快时会被阻塞
 """
 import queue
 import threading
 from dataclasses import dataclass
 from enum import Enum
-from typing import Optional
+from typing import Callable, List, Optional
+
+# 输入队列容量：用户消息由GUI线程写入，队列满时直接拒绝，不阻塞界面
+DEFAULT_INPUT_MAXSIZE = 64
+# 输出队列容量：流式回复每个 token 一条消息，GUI来不及处理时阻塞工作线程
+DEFAULT_OUTPUT_MAXSIZE = 4096
+# 输出队列满时，生产者每隔多久检查一次队列是否已停止（秒）
+PUT_RETRY_INTERVAL = 0.1
+
+# 唤醒阻塞中的消费者的哨兵
+_WAKE = object()
 
 
 class MessageType(Enum):
@@ -28,40 +39,72 @@ class Message:
 class MessageQueue:
     """消息队列管理器"""
 
-    def __init__(self):
-        self._input_queue = queue.Queue()  # 用户输入队列
-        self._output_queue = queue.Queue()  # AI输出队列
-        self._lock = threading.Lock()
+    def __init__(self, input_maxsize: int = DEFAULT_INPUT_MAXSIZE,
+                 output_maxsize: int = DEFAULT_OUTPUT_MAXSIZE):
+        self._input_queue = queue.Queue(maxsize=input_maxsize)  # 用户输入队列
+        self._output_queue = queue.Queue(maxsize=output_maxsize)  # AI输出队列
+        # 只由 stop() 修改，读取布尔值不需要加锁
         self._running = True
-
-    def put_user_message(self, content: str, metadata: Optional[dict] = None):
-        """添加用户消息到输入队列"""
+        self._output_listener: Optional[Callable[[], None]] = None  # 输出队列有新消息时的回调
+
+    def set_output_listener(self, listener: Optional[Callable[[], None]]):
+        """设置输出队列的监听回调，在写入消息的线程中调用"""
+        self._output_listener = listener
+
+    def _notify_output(self):
+        listener = self._output_listener
+        if listener is not None:
+            listener()
+
+    def _put_output(self, message: Message) -> bool:
+        """写入输出队列，队列满时阻塞直到有空位或队列停止"""
+        while self._running:
+            try:
+                self._output_queue.put(message, timeout=PUT_RETRY_INTERVAL)
+            except queue.Full:
+                continue
+            self._notify_output()
+            return True
+        return False
+
+    def put_user_message(self, content: str, metadata: Optional[dict] = None) -> bool:
+        """添加用户消息到输入队列，队列已停止或已满时返回 False"""
+        if not self._running:
+            return False
         message = Message(
             type=MessageType.USER_INPUT,
             content=content,
             metadata=metadata
         )
-        with self._lock:
-            if self._running:
-                self._input_queue.put(message)
+        try:
+            self._input_queue.put_nowait(message)
+        except queue.Full:
+            return False
+        return True
 
-    def get_user_message(self, timeout: float = 0.1) -> Optional[Message]:
-        """从输入队列获取用户消息"""
+    def get_user_message(self, timeout: Optional[float] = None) -> Optional[Message]:
+        """从输入队列获取用户消息，timeout 为 None 时一直等到有消息或被 wake() 唤醒"""
         try:
-            return self._input_queue.get(timeout=timeout)
+            message = self._input_queue.get(timeout=timeout)
         except queue.Empty:
             return None
+        return None if message is _WAKE else message
+
+    def wake(self):
+        """唤醒阻塞在 get_user_message 上的消费者，使其返回 None"""
+        try:
+            self._input_queue.put_nowait(_WAKE)
+        except queue.Full:
+            # 队列已满说明消费者不会阻塞
+            pass
 
-    def put_ai_message(self, content: str, metadata: Optional[dict] = None):
+    def put_ai_message(self, content: str, metadata: Optional[dict] = None) -> bool:
         """添加AI消息到输出队列"""
-        message = Message(
+        return self._put_output(Message(
             type=MessageType.AI_RESPONSE,
             content=content,
             metadata=metadata
-        )
-        with self._lock:
-            if self._running:
-                self._output_queue.put(message)
+        ))
 
     def get_ai_message(self, timeout: float = 0.1) -> Optional[Message]:
         """从输出队列获取AI消息"""
@@ -70,58 +113,57 @@ class MessageQueue:
         except queue.Empty:
             return None
 
-    def put_system_message(self, content: str, metadata: Optional[dict] = None):
+    def get_many(self, max_items: Optional[int] = None) -> List[Message]:
+        """一次取出输出队列中已有的消息（最多 max_items 条），不等待"""
+        messages = []
+        while max_items is None or len(messages) < max_items:
+            try:
+                messages.append(self._output_queue.get_nowait())
+            except queue.Empty:
+                break
+        return messages
+
+    def put_system_message(self, content: str, metadata: Optional[dict] = None) -> bool:
         """添加系统消息"""
-        message = Message(
+        return self._put_output(Message(
             type=MessageType.SYSTEM_MESSAGE,
             content=content,
             metadata=metadata
-        )
-        with self._lock:
-            if self._running:
-                self._output_queue.put(message)
+        ))
 
-    def put_error_message(self, content: str, metadata: Optional[dict] = None):
+    def put_error_message(self, content: str, metadata: Optional[dict] = None) -> bool:
         """添加错误消息"""
-        message = Message(
+        return self._put_output(Message(
             type=MessageType.ERROR,
             content=content,
             metadata=metadata
-        )
-        with self._lock:
-            if self._running:
-                self._output_queue.put(message)
+        ))
 
     def clear_queues(self):
         """清空所有队列"""
-        with self._lock:
-            # 清空输入队列
-            while not self._input_queue.empty():
-                try:
-                    self._input_queue.get_nowait()
-                except queue.Empty:
-                    break
-
-            # 清空输出队列
-            while not self._output_queue.empty():
-                try:
-                    self._output_queue.get_nowait()
-                except queue.Empty:
-                    break
+        # 清空输入队列，保留唤醒哨兵
+        woken = False
+        while True:
+            try:
+                woken = self._input_queue.get_nowait() is _WAKE or woken
+            except queue.Empty:
+                break
+        if woken:
+            self.wake()
+
+        # 清空输出队列
+        self.get_many()
 
     def stop(self):
-        """停止消息队列"""
+        """停止消息队列，并唤醒阻塞中的消费者和生产者"""
         print("正在停止消息队列...")
-        with self._lock:
-            self._running = False
-            # 不再清空队列，避免与其他线程竞争锁
-            # self.clear_queues()  # 移除这行
+        self._running = False
+        self.wake()
         print("消息队列已停止")
 
     def is_running(self) -> bool:
         """检查队列是否运行中"""
-        with self._lock:
-            return self._running
+        return self._running
 
     @property
     def input_queue_size(self) -> int:
@@ -152,6 +194,8 @@ class QueueProcessor:
     def stop(self):
         """停止处理器"""
         self._stop_event.set()
+        # 唤醒阻塞在队列上的处理线程
+        self.message_queue.wake()
         if self._thread and self._thread.is_alive():
             # 等待线程正常退出
             self._thread.join(timeout=3)
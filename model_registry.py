@@ -0,0 +1,63 @@
+"""
+模型文件登记
+查找同一模型的不同量化版本（q2_K / q4_K_M / q5_K / f16 等）
+"""
+import os
+import re
+from dataclasses import dataclass
+from typing import List
+
+# 文件名末尾的量化标记，例如 -Q4_K_M、.q2_k、-IQ3_XS、-F16、-BF16
+_QUANT_SUFFIX_RE = re.compile(r"[-._](I?Q\d+(?:_[A-Z0-9]+)*|F16|BF16|F32)$", re.IGNORECASE)
+
+
+@dataclass
+class ModelVariant:
+    """一个量化版本的模型文件"""
+    path: str
+    quant: str
+    size: int
+
+    @property
+    def name(self) -> str:
+        return os.path.basename(self.path)
+
+
+def split_quant(file_name: str):
+    """
+    把模型文件名拆分为（基础名, 量化标记）
+    :param file_name: 例如 Qwen3-4B-Instruct-2507-Q4_K_M.gguf
+    :return: 例如 ("Qwen3-4B-Instruct-2507", "Q4_K_M")，没有量化标记时量化标记为空字符串
+    """
+    stem = os.path.splitext(os.path.basename(file_name))[0]
+    match = _QUANT_SUFFIX_RE.search(stem)
+    if match is None:
+        return stem, ""
+    return stem[:match.start()], match.group(1).upper()
+
+
+def find_quant_variants(model_path: str) -> List[ModelVariant]:
+    """
+    在模型文件所在目录中查找同一模型的全部量化版本
+    :param model_path: 当前配置的模型文件路径
+    :return: 按文件大小从小到大排序的量化版本列表（文件越大精度越高）
+    """
+    model_dir = os.path.dirname(os.path.abspath(model_path))
+    base, _ = split_quant(model_path)
+    variants = []
+    try:
+        names = os.listdir(model_dir)
+    except OSError:
+        return variants
+
+    for name in names:
+        if not name.lower().endswith(".gguf"):
+            continue
+        name_base, quant = split_quant(name)
+        if name_base != base:
+            continue
+        path = os.path.join(model_dir, name)
+        variants.append(ModelVariant(path=path, quant=quant, size=os.path.getsize(path)))
+
+    variants.sort(key=lambda v: v.size)
+    return variants
@@ -0,0 +1,175 @@
+"""
+llama-server 输出监控
+后台线程持续读取进程输出并放入有界的环形缓冲区，防止管道写满后服务器阻塞；
+同时解析 llama.cpp 每个请求结束时打印的计时信息，转成结构化的指标
+"""
+import re
+import threading
+from collections import deque
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional
+
+from inference_metrics import inference_metrics
+
+# 单行最多保留的字符数，超长的行会被截断
+MAX_LINE_CHARS = 2000
+
+# 日志中的槽位和任务编号，例如 "slot print_timing: id  0 | task 12 |"
+_SLOT_TASK_RE = re.compile(r"\bid\s+(\d+)\s*\|\s*task\s+(-?\d+)")
+# 新请求的提示词长度，例如 "new prompt, n_ctx_slot = 2048, n_keep = 0, n_prompt_tokens = 25"
+_N_PROMPT_RE = re.compile(r"n_prompt_tokens\s*=\s*(\d+)")
+# 复用的 KV cache 长度，例如 "kv cache rm [18, end)"
+_CACHE_REUSE_RE = re.compile(r"kv cache rm \[(\d+),\s*end\)")
+# 计时信息，例如 "prompt eval time =  35.12 ms /  22 tokens (  1.60 ms per token,  626.42 tokens per second)"
+_PROMPT_EVAL_RE = re.compile(
+    r"prompt eval time\s*=\s*([\d.]+)\s*ms\s*/\s*(\d+)\s*tokens.*?([\d.]+)\s*tokens per second"
+)
+_EVAL_RE = re.compile(
+    r"(?<!prompt )\beval time\s*=\s*([\d.]+)\s*ms\s*/\s*(\d+)\s*(?:tokens|runs).*?([\d.]+)\s*tokens per second"
+)
+_TOTAL_RE = re.compile(r"total time\s*=\s*([\d.]+)\s*ms\s*/\s*(\d+)\s*tokens")
+# 投机解码的接受率，例如 "draft acceptance rate = 0.57143 (   40 accepted /    70 generated)"
+_DRAFT_RE = re.compile(r"draft acceptance rate\s*=\s*[\d.]+\s*\(\s*(\d+)\s*accepted\s*/\s*(\d+)\s*generated")
+
+
+@dataclass
+class ServerTiming:
+    """llama-server 打印的一次请求的计时"""
+    slot: int
+    task: int
+    prompt_tokens: int = 0
+    prompt_ms: float = 0.0
+    prompt_tps: float = 0.0
+    eval_tokens: int = 0
+    eval_ms: float = 0.0
+    eval_tps: float = 0.0
+    total_ms: float = 0.0
+    n_prompt_tokens: Optional[int] = None
+    cached_tokens: Optional[int] = None
+    draft_accepted: Optional[int] = None
+    draft_tokens: Optional[int] = None
+
+
+class ServerOutputMonitor:
+    """保存最近的输出行和计时记录，内存占用不随运行时间增长"""
+
+    def __init__(self, max_lines: int = 1000, max_timings: int = 256):
+        self._lines = deque(maxlen=max_lines)
+        self._timings = deque(maxlen=max_timings)
+        self._lock = threading.Lock()
+        self._slot = self._task = None
+        # 进行中的任务：任务编号 -> (n_prompt_tokens, cached_tokens)，只保留少量最近的任务
+        self._pending: Dict[int, list] = {}
+        self._current: Optional[ServerTiming] = None
+        self.total_lines = 0
+
+    def feed(self, line: str):
+        """处理一行输出"""
+        line = line.rstrip()[:MAX_LINE_CHARS]
+        with self._lock:
+            self._lines.append(line)
+            self.total_lines += 1
+            self._parse(line)
+
+    def _parse(self, line: str):
+        match = _SLOT_TASK_RE.search(line)
+        if match:
+            self._slot, self._task = int(match.group(1)), int(match.group(2))
+
+        match = _N_PROMPT_RE.search(line)
+        if match and self._task is not None:
+            self._task_info(self._task)[0] = int(match.group(1))
+            return
+
+        match = _CACHE_REUSE_RE.search(line)
+        if match and self._task is not None:
+            self._task_info(self._task)[1] = int(match.group(1))
+            return
+
+        match = _PROMPT_EVAL_RE.search(line)
+        if match:
+            n_prompt, cached = self._pending.pop(self._task, [None, None])
+            self._current = ServerTiming(
+                slot=self._slot if self._slot is not None else -1,
+                task=self._task if self._task is not None else -1,
+                prompt_ms=float(match.group(1)),
+                prompt_tokens=int(match.group(2)),
+                prompt_tps=float(match.group(3)),
+                n_prompt_tokens=n_prompt,
+                cached_tokens=cached,
+            )
+            return
+
+        match = _EVAL_RE.search(line)
+        if match and self._current is not None:
+            self._current.eval_ms = float(match.group(1))
+            self._current.eval_tokens = int(match.group(2))
+            self._current.eval_tps = float(match.group(3))
+            return
+
+        match = _TOTAL_RE.search(line)
+        if match and self._current is not None:
+            self._current.total_ms = float(match.group(1))
+            self._finish(self._current)
+            return
+
+        # 接受率在 total time 之后打印，补充到刚结束的请求上
+        match = _DRAFT_RE.search(line)
+        if match and self._timings:
+            timing = self._timings[-1]
+            timing.draft_accepted, timing.draft_tokens = int(match.group(1)), int(match.group(2))
+            inference_metrics.record("server", {
+                "draft_tokens": timing.draft_tokens,
+                "draft_accepted_tokens": timing.draft_accepted,
+            })
+
+    def _task_info(self, task: int) -> list:
+        info = self._pending.get(task)
+        if info is None:
+            if len(self._pending) >= 64:
+                self._pending.pop(next(iter(self._pending)))
+            info = self._pending[task] = [None, None]
+        return info
+
+    def _finish(self, timing: ServerTiming):
+        self._timings.append(timing)
+        self._current = None
+        values = {
+            "prompt_tokens": timing.prompt_tokens,
+            "completion_tokens": timing.eval_tokens,
+            "total_seconds": timing.total_ms / 1000,
+        }
+        if timing.prompt_tps:
+            values["prompt_eval_tokens_per_second"] = timing.prompt_tps
+        if timing.eval_tps:
+            values["decode_tokens_per_second"] = timing.eval_tps
+        if timing.cached_tokens is not None:
+            values["cached_prompt_tokens"] = timing.cached_tokens
+        inference_metrics.record("server", values)
+
+    def recent_lines(self, count: int = 100) -> List[str]:
+        """最近的输出行，用于诊断"""
+        with self._lock:
+            return list(self._lines)[-count:]
+
+    def recent_timings(self, count: int = 20) -> List[dict]:
+        """最近的请求计时"""
+        with self._lock:
+            return [asdict(t) for t in list(self._timings)[-count:]]
+
+    def get_stats(self) -> Dict[str, float]:
+        """最近若干个请求的平均预填充速度、生成速度和各槽位的请求数"""
+        with self._lock:
+            timings = list(self._timings)
+        if not timings:
+            return {"requests": 0, "lines": self.total_lines}
+        slots: Dict[int, int] = {}
+        for t in timings:
+            slots[t.slot] = slots.get(t.slot, 0) + 1
+        return {
+            "requests": len(timings),
+            "lines": self.total_lines,
+            "prompt_tps": sum(t.prompt_tps for t in timings) / len(timings),
+            "eval_tps": sum(t.eval_tps for t in timings) / len(timings),
+            "slots": slots,
+        }
@@ -0,0 +1,219 @@
+"""
+llama-server 实例池
+按配置在连续端口上启动一个或多个实例，每个实例有自己的线程数和 CPU 亲和性；
+定期做健康检查，把不可用的实例移出调度，恢复后重新加入；
+切换量化版本时在另一组端口上启动新实例，就绪后切换过去，旧实例上的请求完成后再停止旧实例
+"""
+import threading
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+from config_manager import ConfigManager, config_manager
+from http_client import http_client
+from llama_server import LlamaServer
+from model_registry import ModelVariant, find_quant_variants
+from server_router import server_router
+
+# 健康检查的默认间隔（秒）
+DEFAULT_HEALTH_CHECK_INTERVAL = 5
+# 切换模型时新实例使用的端口偏移，新旧两组实例在两组端口之间交替
+DEFAULT_SWAP_PORT_OFFSET = 50
+# 切换模型后等待旧实例上的请求结束的最长时间（秒）
+DEFAULT_SWAP_DRAIN_TIMEOUT = 600
+
+
+class ServerPool:
+    """管理全部 llama-server 实例，接口与单个 LlamaServer 的后台启动一致"""
+
+    def __init__(self):
+        self.servers: List[LlamaServer] = self._create_servers()
+        self._stop_event = threading.Event()
+        self._health_thread = None
+        # 切换模型时正在启动的新实例
+        self._pending: List[LlamaServer] = []
+        self._switch_lock = threading.Lock()
+        self._switching = False
+        self._alternate_ports = False
+
+    @staticmethod
+    def _create_servers(model: str = None, port_offset: int = 0, config: ConfigManager = None) -> List[LlamaServer]:
+        """按配置创建实例；config 默认为全局配置，切换模型时为重新读取的配置"""
+        config = config if config is not None else config_manager
+        return [
+            LlamaServer(model=model, port=instance["port"] + port_offset, threads=instance["threads"],
+                        cpus=instance["cpus"], config=config)
+            for instance in config.get_instances()
+        ]
+
+    @staticmethod
+    def _start_server(server: LlamaServer):
+        """启动一个实例并等待就绪，按配置预热"""
+        server.start()
+        if server.config.get_config("warmup", True):
+            server.warm_up()
+
+    @property
+    def model_path(self) -> str:
+        """当前使用的模型文件"""
+        return self.servers[0].model or config_manager.get_model_path()
+
+    @property
+    def switching(self) -> bool:
+        return self._switching
+
+    def list_variants(self) -> List[ModelVariant]:
+        """当前模型目录中可以切换的量化版本"""
+        return find_quant_variants(self.model_path)
+
+    def start_in_background(self, on_ready=None, on_error=None):
+        """
+        在后台并行启动全部实例
+        第一个实例就绪后即开始处理请求，其余实例就绪后陆续加入调度；全部启动失败时调用 on_error
+        """
+        server_router.set_endpoints([server.base_url for server in self.servers], self.model_path,
+                                    config_manager.get_parallel(), config_manager.get_chat_slot())
+        http_client.mark_starting()
+        lock = threading.Lock()
+        state = {"ready": False, "failed": 0, "errors": []}
+
+        def run(server: LlamaServer):
+            try:
+                self._start_server(server)
+            except Exception as e:
+                print(f"llama-server（端口 {server.port}）启动失败: {e}")
+                with lock:
+                    state["failed"] += 1
+                    state["errors"].append(str(e))
+                    all_failed = state["failed"] == len(self.servers)
+                if all_failed:
+                    error = "\n".join(state["errors"])
+                    http_client.mark_failed(error)
+                    if on_error:
+                        on_error(error)
+                return
+
+            server_router.mark_up(server.base_url)
+            with lock:
+                first = not state["ready"]
+                state["ready"] = True
+            if first:
+                http_client.mark_ready()
+                if on_ready:
+                    on_ready()
+
+        for server in self.servers:
+            threading.Thread(target=run, args=(server,), daemon=True, name=f"llama-server-start-{server.port}").start()
+
+        if len(self.servers) > 1:
+            self._health_thread = threading.Thread(target=self._health_loop, daemon=True, name="llama-server-health")
+            self._health_thread.start()
+
+    def _health_loop(self):
+        """定期检查已就绪的实例：进程退出或 /health 失败时移出调度"""
+        interval = config_manager.get_config("health_check_interval", DEFAULT_HEALTH_CHECK_INTERVAL)
+        while not self._stop_event.wait(interval):
+            for server in self.servers:
+                if not server.ready:
+                    continue
+                if server.process is not None and server.process.poll() is not None:
+                    server_router.mark_down(server.base_url)
+                    continue
+                try:
+                    healthy = http_client.get(f"{server.base_url}/health", timeout=2).status_code == 200
+                except requests.RequestException:
+                    healthy = False
+                if healthy:
+                    server_router.mark_up(server.base_url)
+                else:
+                    server_router.mark_down(server.base_url)
+
+    def switch_model(self, model_path: str, on_ready: Optional[Callable[[], None]] = None,
+                     on_error: Optional[Callable[[str], None]] = None) -> bool:
+        """
+        在后台切换到另一个模型文件（通常是同一模型的另一个量化版本），不中断正在进行的对话和文件翻译
+        新实例在另一组端口上启动并预热，全部就绪后新请求改发新实例；旧实例上的请求结束后停止旧实例。
+        新实例启动失败时继续使用旧实例
+        :param on_ready: 切换完成后在后台线程中调用
+        :param on_error: 切换失败时在后台线程中调用，参数为错误信息
+        :return: 服务器尚未就绪或上一次切换还没结束时返回 False，不做切换
+        """
+        with self._switch_lock:
+            if self._switching or not http_client.server_ready or self._stop_event.is_set():
+                return False
+            self._switching = True
+
+        def run():
+            try:
+                self._switch(model_path)
+            except Exception as e:
+                print(f"切换模型失败: {e}")
+                if on_error:
+                    on_error(str(e))
+                return
+            finally:
+                self._switching = False
+            if on_ready:
+                on_ready()
+
+        threading.Thread(target=run, daemon=True, name="llama-server-switch").start()
+        return True
+
+    def _switch(self, model_path: str):
+        # 重新读取配置文件，修改过的线程数、槽位数等参数随新实例生效；新配置只用于创建新实例，
+        # 旧实例上的请求仍然按当前配置分配，切换实例之后才换成新配置
+        config = config_manager.read_file()
+        offset = 0 if self._alternate_ports else config.get_config("swap_port_offset", DEFAULT_SWAP_PORT_OFFSET)
+        self._pending = self._create_servers(model_path, offset, config)
+        print(f"正在切换模型：{model_path}")
+
+        errors = []
+        threads = []
+        for server in self._pending:
+            def run(server=server):
+                try:
+                    self._start_server(server)
+                except Exception as e:
+                    errors.append(f"端口 {server.port}: {e}")
+            thread = threading.Thread(target=run, daemon=True, name=f"llama-server-start-{server.port}")
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+
+        new_servers, self._pending = self._pending, []
+        if errors or self._stop_event.is_set():
+            for server in new_servers:
+                server.stop()
+            raise RuntimeError("\n".join(errors) or "已停止")
+
+        # 新实例全部就绪后整组切换，之后的请求都发往新实例
+        old_servers = self.servers
+        old_endpoints = server_router.replace_endpoints([server.base_url for server in new_servers], model_path,
+                                                        config.get_parallel(), config.get_chat_slot())
+        self.servers = new_servers
+        self._alternate_ports = not self._alternate_ports
+        config_manager.apply(config)
+        config_manager.set_config("model", model_path)
+
+        timeout = config_manager.get_config("swap_drain_timeout", DEFAULT_SWAP_DRAIN_TIMEOUT)
+        if not server_router.wait_drained(old_endpoints, timeout):
+            print(f"旧实例上的请求在 {timeout} 秒内没有结束，强制停止")
+        for server in old_servers:
+            server.stop()
+        print(f"模型已切换为 {model_path}")
+
+    def get_recent_logs(self, count: int = 100) -> Dict[int, List[str]]:
+        """各实例最近的输出，按端口分组"""
+        return {server.port: server.get_recent_logs(count) for server in self.servers}
+
+    def get_stats(self) -> List[Dict]:
+        """各实例的调度状态"""
+        return server_router.get_stats()
+
+    def stop(self):
+        """停止全部实例"""
+        self._stop_event.set()
+        server_router.clear()
+        for server in self.servers + self._pending:
+            server.stop()
@@ -0,0 +1,199 @@
+"""
+llama-server 实例路由
+多实例运行时，文件翻译请求发往进行中请求最少的可用实例，对话固定在一个实例上以复用缓存；
+切换模型时整组替换实例，旧实例上进行中的请求照常完成；每个实例记录自己启动时的槽位数和对话槽位，
+切换期间新旧实例的槽位布局可以不同；
+服务器不由本程序启动时没有登记任何实例，请求使用调用方自己的地址，槽位布局按当前配置
+"""
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from config_manager import config_manager
+from http_client import ServerNotReady, http_client
+
+
+class Endpoint:
+    """一个 llama-server 实例"""
+
+    def __init__(self, base_url: str, model: Optional[str] = None, parallel: int = 1, chat_slot: int = 0):
+        self.base_url = base_url
+        # 实例加载的模型文件，切换模型期间新旧实例的模型不同
+        self.model = model
+        # 实例启动时的 --parallel 和对话使用的槽位
+        self.parallel = max(1, parallel)
+        self.chat_slot = chat_slot
+        self.healthy = False
+        self.in_flight = 0
+        self.requests = 0
+        # 各槽位上进行中的请求数
+        self.slot_in_flight: Dict[int, int] = {}
+
+    def translation_slots(self) -> List[int]:
+        """文件翻译可以使用的槽位：有多个槽位时留出对话槽位，对话不必排在翻译请求后面"""
+        if self.parallel == 1:
+            return [0]
+        return [slot for slot in range(self.parallel) if slot != self.chat_slot]
+
+
+class ServerRouter:
+    """在多个实例之间分配请求"""
+
+    def __init__(self):
+        self._endpoints: List[Endpoint] = []
+        self._lock = threading.Lock()
+        # 请求结束时通知等待旧实例排空的线程
+        self._released = threading.Condition(self._lock)
+        # 服务器不由本程序启动时，只在这里记录各槽位上进行中的请求数
+        self._unmanaged = Endpoint(None)
+
+    def set_endpoints(self, base_urls: List[str], model: Optional[str] = None, parallel: int = 1,
+                      chat_slot: int = 0):
+        """登记实例（初始为不可用，健康检查通过后才参与分配）"""
+        with self._lock:
+            self._endpoints = [Endpoint(url, model, parallel, chat_slot) for url in base_urls]
+
+    def replace_endpoints(self, base_urls: List[str], model: Optional[str] = None, parallel: int = 1,
+                          chat_slot: int = 0) -> List[Endpoint]:
+        """
+        换成一组已经就绪的新实例，之后的请求全部发往新实例
+        :return: 被替换的旧实例，已经发出的请求继续在旧实例上完成
+        """
+        with self._lock:
+            old = self._endpoints
+            self._endpoints = [Endpoint(url, model, parallel, chat_slot) for url in base_urls]
+            for endpoint in self._endpoints:
+                endpoint.healthy = True
+        print(f"llama-server 实例已切换到 {', '.join(base_urls)}")
+        return old
+
+    def wait_drained(self, endpoints: List[Endpoint], timeout: Optional[float] = None) -> bool:
+        """等待这些实例上的请求全部结束，超时返回 False"""
+        with self._released:
+            return self._released.wait_for(lambda: all(e.in_flight == 0 for e in endpoints), timeout)
+
+    def clear(self):
+        with self._lock:
+            self._endpoints = []
+
+    def mark_up(self, base_url: str):
+        self._set_health(base_url, True)
+
+    def mark_down(self, base_url: str):
+        self._set_health(base_url, False)
+
+    def _set_health(self, base_url: str, healthy: bool):
+        with self._lock:
+            for endpoint in self._endpoints:
+                if endpoint.base_url == base_url and endpoint.healthy != healthy:
+                    endpoint.healthy = healthy
+                    print(f"llama-server 实例 {base_url} {'已加入' if healthy else '已移出'}调度")
+
+    @contextmanager
+    def lease(self, prefer: Optional[int] = None) -> Iterator[Optional[str]]:
+        """
+        选择一个实例发送请求，请求结束前计入该实例的进行中请求数
+        :param prefer: 优先使用的实例序号，该实例不可用时退回进行中请求最少的实例
+        :return: 实例的基础地址；没有登记实例时为 None
+        """
+        if not self._endpoints:
+            yield None
+            return
+
+        http_client.wait_until_ready()
+        with self._lock:
+            endpoint = self._prefer_locked(prefer)
+            self._acquire_locked(endpoint, None)
+        try:
+            yield endpoint.base_url
+        finally:
+            self._release(endpoint, None)
+
+    @contextmanager
+    def lease_chat(self, prefer: Optional[int], use_slot: bool) -> Iterator[Tuple[Optional[str], Optional[int]]]:
+        """
+        为对话请求选择实例，并给出该实例的对话槽位
+        :param prefer: 优先使用的实例序号
+        :param use_slot: 是否指定槽位（slot_affinity）
+        :return: (实例的基础地址, 对话槽位)；没有登记实例时地址为 None
+        """
+        if self._endpoints:
+            http_client.wait_until_ready()
+        with self._lock:
+            endpoint = self._prefer_locked(prefer) if self._endpoints else self._unmanaged_locked()
+            slot = endpoint.chat_slot if use_slot else None
+            self._acquire_locked(endpoint, slot)
+        try:
+            yield endpoint.base_url, slot
+        finally:
+            self._release(endpoint, slot)
+
+    @contextmanager
+    def lease_slot(self, use_slots: bool) -> Iterator[Tuple[Optional[str], Optional[int], Optional[str]]]:
+        """
+        为文件翻译请求同时选择实例和槽位：优先选择空闲的槽位，其次是进行中请求最少的实例，
+        避免两个请求排在同一实例的同一槽位上，而其他槽位空闲；槽位取自实例自己的槽位布局
+        :param use_slots: 是否指定槽位（slot_affinity），为 False 时只选择实例
+        :return: (实例的基础地址, 槽位, 实例加载的模型文件)；没有登记实例时地址和模型为 None
+        """
+        if self._endpoints:
+            http_client.wait_until_ready()
+        with self._lock:
+            candidates = self._healthy_locked() if self._endpoints else [self._unmanaged_locked()]
+            if use_slots:
+                endpoint, slot = min(
+                    ((e, slot) for e in candidates for slot in e.translation_slots()),
+                    key=lambda pair: (pair[0].slot_in_flight.get(pair[1], 0), pair[0].in_flight)
+                )
+            else:
+                endpoint, slot = min(candidates, key=lambda e: e.in_flight), None
+            self._acquire_locked(endpoint, slot)
+        try:
+            yield endpoint.base_url, slot, endpoint.model
+        finally:
+            self._release(endpoint, slot)
+
+    def _prefer_locked(self, prefer: Optional[int]) -> Endpoint:
+        """优先使用指定序号的实例，该实例不可用时退回进行中请求最少的实例"""
+        healthy = self._healthy_locked()
+        if prefer is not None and prefer < len(self._endpoints) and self._endpoints[prefer].healthy:
+            return self._endpoints[prefer]
+        return min(healthy, key=lambda e: e.in_flight)
+
+    def _unmanaged_locked(self) -> Endpoint:
+        """服务器不由本程序启动时，槽位布局按当前配置"""
+        self._unmanaged.parallel = max(1, config_manager.get_parallel())
+        self._unmanaged.chat_slot = config_manager.get_chat_slot()
+        return self._unmanaged
+
+    def _healthy_locked(self) -> List[Endpoint]:
+        healthy = [e for e in self._endpoints if e.healthy]
+        if not healthy:
+            raise ServerNotReady("没有可用的 llama-server 实例")
+        return healthy
+
+    @staticmethod
+    def _acquire_locked(endpoint: Endpoint, slot: Optional[int]):
+        endpoint.in_flight += 1
+        endpoint.requests += 1
+        if slot is not None:
+            endpoint.slot_in_flight[slot] = endpoint.slot_in_flight.get(slot, 0) + 1
+
+    def _release(self, endpoint: Endpoint, slot: Optional[int]):
+        with self._lock:
+            endpoint.in_flight -= 1
+            if slot is not None:
+                endpoint.slot_in_flight[slot] -= 1
+            self._released.notify_all()
+
+    def get_stats(self) -> List[Dict]:
+        """各实例的状态、进行中请求数和累计请求数"""
+        with self._lock:
+            return [
+                {"url": e.base_url, "healthy": e.healthy, "in_flight": e.in_flight, "requests": e.requests}
+                for e in self._endpoints
+            ]
+
+
+# 全局实例路由
+server_router = ServerRouter()
@@ -0,0 +1,28 @@
+import json
+import os
+import sys
+
+import pytest
+
+# 项目模块都在根目录，直接以模块名导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config_manager import config_manager  # noqa: E402
+
+
+@pytest.fixture
+def config(tmp_path):
+    """在临时目录中写入配置文件并换成当前配置，测试结束后恢复为未加载状态"""
+
+    def load(**data):
+        path = tmp_path / "config.json"
+        path.write_text(json.dumps(data), encoding="utf-8")
+        config_manager._config_data = None
+        config_manager._overrides = None
+        config_manager.load_config(str(path))
+        return config_manager
+
+    yield load
+    config_manager._config_data = None
+    config_manager._overrides = None
+    config_manager._config_path = "config.json"
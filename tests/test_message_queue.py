@@ -0,0 +1,68 @@
+import threading
+import time
+
+from message_queue import MessageQueue
+
+
+def test_consumer_wakes_on_message_without_polling():
+    queue = MessageQueue()
+    received = []
+    consumer = threading.Thread(target=lambda: received.append(queue.get_user_message()))
+    consumer.start()
+    time.sleep(0.05)
+    assert queue.put_user_message("こんにちは")
+    consumer.join(1)
+    assert not consumer.is_alive()
+    assert received[0].content == "こんにちは"
+
+
+def test_wake_releases_blocked_consumer():
+    queue = MessageQueue()
+    received = []
+    consumer = threading.Thread(target=lambda: received.append(queue.get_user_message()))
+    consumer.start()
+    time.sleep(0.05)
+    queue.wake()
+    consumer.join(1)
+    assert not consumer.is_alive()
+    assert received == [None]
+
+
+def test_full_input_queue_rejects_without_blocking():
+    queue = MessageQueue(input_maxsize=2)
+    assert queue.put_user_message("1")
+    assert queue.put_user_message("2")
+    assert not queue.put_user_message("3")
+
+
+def test_clear_queues_keeps_pending_wake():
+    queue = MessageQueue()
+    queue.put_user_message("1")
+    queue.wake()
+    queue.clear_queues()
+    assert queue.input_queue_size == 1
+    assert queue.get_user_message(timeout=0) is None
+
+
+def test_stop_releases_blocked_producer():
+    queue = MessageQueue(output_maxsize=1)
+    assert queue.put_ai_message("1")
+    results = []
+    producer = threading.Thread(target=lambda: results.append(queue.put_ai_message("2")))
+    producer.start()
+    time.sleep(0.05)
+    assert producer.is_alive()
+    queue.stop()
+    producer.join(1)
+    assert not producer.is_alive()
+    assert results == [False]
+
+
+def test_output_listener_called_for_each_message():
+    queue = MessageQueue()
+    calls = []
+    queue.set_output_listener(lambda: calls.append(1))
+    queue.put_ai_message("a")
+    queue.put_system_message("b")
+    assert len(calls) == 2
+    assert [m.content for m in queue.get_many()] == ["a", "b"]
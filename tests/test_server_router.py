@@ -0,0 +1,92 @@
+from contextlib import ExitStack
+
+import pytest
+
+from server_router import ServerRouter
+
+URLS = ["http://127.0.0.1:8080", "http://127.0.0.1:8081"]
+
+
+@pytest.fixture(autouse=True)
+def settings(config):
+    # 等待服务器就绪等路径会读取配置，不依赖当前目录下的 config.json
+    return config()
+
+
+def lease_many(router, count, use_slots=True):
+    """同时持有 count 个翻译请求，返回各请求分到的 (地址, 槽位)"""
+    stack = ExitStack()
+    leases = [stack.enter_context(router.lease_slot(use_slots))[:2] for _ in range(count)]
+    return stack, leases
+
+
+def test_lease_slot_spreads_over_endpoints_and_slots():
+    router = ServerRouter()
+    router.replace_endpoints(URLS, "a.gguf", parallel=3, chat_slot=2)
+    stack, leases = lease_many(router, 4)
+    with stack:
+        # 2 个实例 × 2 个翻译槽位，每个槽位各分到一个请求，对话槽位不参与
+        assert sorted(leases) == sorted((url, slot) for url in URLS for slot in (0, 1))
+        stats = router.get_stats()
+        assert [s["in_flight"] for s in stats] == [2, 2]
+    assert [s["in_flight"] for s in router.get_stats()] == [0, 0]
+
+
+def test_lease_slot_stacks_evenly_when_all_slots_busy():
+    router = ServerRouter()
+    router.replace_endpoints(URLS, "a.gguf", parallel=3, chat_slot=2)
+    stack, leases = lease_many(router, 8)
+    with stack:
+        counts = {}
+        for lease in leases:
+            counts[lease] = counts.get(lease, 0) + 1
+        assert set(counts.values()) == {2}
+        assert all(slot != 2 for _, slot in leases)
+
+
+def test_lease_slot_reuses_released_slot():
+    router = ServerRouter()
+    router.replace_endpoints(URLS[:1], "a.gguf", parallel=3, chat_slot=2)
+    with router.lease_slot(True) as (_, first, _):
+        with router.lease_slot(True) as (_, second, _):
+            assert {first, second} == {0, 1}
+        with router.lease_slot(True) as (_, again, _):
+            assert again == second
+
+
+def test_lease_slot_single_slot_shares_with_chat():
+    router = ServerRouter()
+    router.replace_endpoints(URLS[:1], "a.gguf", parallel=1, chat_slot=0)
+    with router.lease_slot(True) as (url, slot, model):
+        assert (url, slot, model) == (URLS[0], 0, "a.gguf")
+
+
+def test_lease_slot_without_slot_affinity_balances_endpoints():
+    router = ServerRouter()
+    router.replace_endpoints(URLS, "a.gguf", parallel=2, chat_slot=1)
+    stack, leases = lease_many(router, 4, use_slots=False)
+    with stack:
+        assert sorted(url for url, _ in leases) == sorted(URLS * 2)
+        assert all(slot is None for _, slot in leases)
+
+
+def test_replaced_endpoints_keep_their_own_slot_layout():
+    router = ServerRouter()
+    router.replace_endpoints(URLS[:1], "old.gguf", parallel=2, chat_slot=1)
+    with router.lease_slot(True) as (url, slot, model):
+        assert (url, slot, model) == (URLS[0], 0, "old.gguf")
+        old = router.replace_endpoints(URLS[1:], "new.gguf", parallel=3, chat_slot=2)
+        assert not router.wait_drained(old, timeout=0)
+        stack, leases = lease_many(router, 2)
+        with stack:
+            assert sorted(leases) == [(URLS[1], 0), (URLS[1], 1)]
+    assert router.wait_drained(old, timeout=0)
+
+
+def test_lease_chat_uses_chat_slot_of_preferred_endpoint():
+    router = ServerRouter()
+    router.replace_endpoints(URLS, "a.gguf", parallel=3, chat_slot=2)
+    with router.lease_chat(1, True) as (url, slot):
+        assert (url, slot) == (URLS[1], 2)
+    with router.lease_chat(0, False) as (url, slot):
+        assert (url, slot) == (URLS[0], None)
@@ -0,0 +1,66 @@
+import pytest
+
+from handler.text_classifier import (
+    PASSTHROUGH, SKIP, TRANSLATE, classify, mask_placeholders, restore_placeholders
+)
+
+
+@pytest.mark.parametrize("text", [
+    r"\C[4]攻撃力\C[0]×1.5",
+    r"\N[1]は\V[10]ゴールド手に入れた！\!",
+    r"%1の攻撃！ %2のダメージ",
+    r"\FS<24>大きな文字\{\}",
+])
+def test_mask_restore_round_trip(text):
+    masked = mask_placeholders(text)
+    assert masked.placeholders
+    assert "\\" not in masked.text and "%" not in masked.text
+    assert restore_placeholders(masked.text, masked.placeholders) == text
+
+
+def test_restore_keeps_translated_order():
+    masked = mask_placeholders(r"\N[1]は\I[5]を手に入れた")
+    assert masked.text == "{0}は{1}を手に入れた"
+    assert restore_placeholders("获得了{1}（{0}）", masked.placeholders) == r"获得了\I[5]（\N[1]）"
+
+
+@pytest.mark.parametrize("translated", [
+    "{0}获得了",            # 丢失占位符
+    "{0}{1}{1}获得了",      # 重复占位符
+    "{0}{2}获得了",         # 编号错误
+])
+def test_restore_rejects_dropped_or_duplicated_tokens(translated):
+    masked = mask_placeholders(r"\N[1]は\I[5]を手に入れた")
+    assert restore_placeholders(translated, masked.placeholders) is None
+
+
+def test_text_with_literal_tokens_is_not_masked():
+    masked = mask_placeholders(r"{0}と\C[2]赤\C[0]")
+    assert masked.text == r"{0}と\C[2]赤\C[0]"
+    assert masked.placeholders == []
+
+
+@pytest.mark.parametrize("text, expected", [
+    (r"\N[1]はLv.5", TRANSLATE),
+    (r"\C[4]攻撃力\C[0]×1.5", TRANSLATE),
+    ("はい/いいえ.OK", TRANSLATE),
+    ("img/faces/Actor1.png", SKIP),
+    ("Actor1.png", SKIP),
+    ("123", SKIP),
+    ("1,000 + 50%", SKIP),
+    ("$gameVariables.setValue(1, 2)", SKIP),
+    ("%1", PASSTHROUGH),
+    (r"\C[2]\N[1]！", PASSTHROUGH),
+    ("……！？", SKIP),
+])
+def test_classify(text, expected):
+    kind, masked = classify(text)
+    assert kind == expected
+    assert (masked is not None) == (expected == TRANSLATE)
+
+
+def test_classify_masks_control_codes():
+    kind, masked = classify(r"\N[1]はLv.5")
+    assert kind == TRANSLATE
+    assert masked.text == "{0}はLv.5"
+    assert masked.placeholders == [r"\N[1]"]
@@ -0,0 +1,79 @@
+import os
+
+from translation_journal import TranslationJournal
+
+
+def make_input(tmp_path, content="こんにちは\nさようなら\n"):
+    path = tmp_path / "script.txt"
+    path.write_text(content, encoding="utf-8")
+    return str(path)
+
+
+def test_resume_restores_recorded_entries(tmp_path):
+    path = make_input(tmp_path)
+    journal = TranslationJournal.for_input(path, "中文", flush_every=1)
+    assert journal.open() == 0
+    journal.record(0, "こんにちは", "你好")
+    journal.close()
+
+    resumed = TranslationJournal.for_input(path, "中文")
+    assert resumed.open() == 1
+    assert resumed.restored(0, "こんにちは") == "你好"
+    assert resumed.restored(1, "さようなら") is None
+    # 同一位置的原文变了，不使用旧译文
+    assert resumed.restored(0, "こんばんは") is None
+    resumed.close()
+
+
+def test_buffered_entries_are_written_on_close(tmp_path):
+    path = make_input(tmp_path)
+    journal = TranslationJournal.for_input(path, "中文", flush_every=100)
+    journal.open()
+    journal.record(1, "さようなら", "再见")
+    journal.close()
+
+    resumed = TranslationJournal.for_input(path, "中文")
+    assert resumed.open() == 1
+    assert resumed.restored(1, "さようなら") == "再见"
+    resumed.close()
+
+
+def test_changed_input_or_language_starts_over(tmp_path):
+    path = make_input(tmp_path)
+    journal = TranslationJournal.for_input(path, "中文", flush_every=1)
+    journal.open()
+    journal.record(0, "こんにちは", "你好")
+    journal.close()
+
+    other_lang = TranslationJournal.for_input(path, "英文")
+    assert other_lang.open() == 0
+    other_lang.close()
+
+    journal = TranslationJournal.for_input(path, "中文", flush_every=1)
+    journal.open()
+    journal.record(0, "こんにちは", "你好")
+    journal.close()
+    make_input(tmp_path, "こんにちは\nさようなら\nまたね\n")
+    changed = TranslationJournal.for_input(path, "中文")
+    assert changed.open() == 0
+    changed.close()
+
+
+def test_truncated_last_line_is_ignored(tmp_path):
+    path = make_input(tmp_path)
+    journal = TranslationJournal.for_input(path, "中文", flush_every=1)
+    journal.open()
+    journal.record(0, "こんにちは", "你好")
+    journal.close()
+    with open(journal.path, "a", encoding="utf-8") as f:
+        f.write('{"i": 1, "h": "')
+
+    resumed = TranslationJournal.for_input(path, "中文", flush_every=1)
+    assert resumed.open() == 1
+    resumed.record(1, "さようなら", "再见")
+    resumed.close()
+
+    again = TranslationJournal.for_input(path, "中文")
+    assert again.open() == 2
+    again.discard()
+    assert not os.path.exists(again.path)
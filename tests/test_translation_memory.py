@@ -0,0 +1,72 @@
+from translation_memory import TranslationMemory
+
+
+def open_memory(tmp_path, max_entries=100):
+    return TranslationMemory(str(tmp_path / "memory.db"), max_entries)
+
+
+def test_entries_are_keyed_by_model_and_language(tmp_path, config):
+    settings = config(model="/models/a.gguf")
+    memory = open_memory(tmp_path)
+    memory.put_many([("はい", "是")], "中文")
+    assert memory.get_many(["はい", "いいえ"], "中文") == {"はい": "是"}
+    assert memory.get_many(["はい"], "英文") == {}
+
+    settings.set_config("model", "/models/b.gguf")
+    assert memory.get_many(["はい"], "中文") == {}
+    memory.close()
+
+
+def test_switching_models_keeps_other_models_entries(tmp_path, config):
+    settings = config(model="/models/a.gguf")
+    memory = open_memory(tmp_path)
+    memory.put_many([("はい", "是")], "中文")
+    memory.close()
+
+    settings.set_config("model", "/models/b.gguf")
+    memory = open_memory(tmp_path)
+    memory.put_many([("はい", "好的")], "中文")
+    assert memory.get_many(["はい"], "中文") == {"はい": "好的"}
+    memory.close()
+
+    settings.set_config("model", "/models/a.gguf")
+    memory = open_memory(tmp_path)
+    assert memory.get_many(["はい"], "中文") == {"はい": "是"}
+    assert memory.get_stats()["entries"] == 2
+
+    memory.invalidate()
+    assert memory.get_stats()["entries"] == 1
+    assert memory.get_many(["はい"], "中文") == {"はい": "是"}
+    memory.close()
+
+
+def test_put_many_records_translation_under_given_model(tmp_path, config):
+    settings = config(model="/models/new.gguf")
+    memory = open_memory(tmp_path)
+    memory.put_many([("はい", "是")], "中文", "/models/old.gguf")
+    assert memory.get_many(["はい"], "中文") == {}
+
+    settings.set_config("model", "/models/old.gguf")
+    assert memory.get_many(["はい"], "中文") == {"はい": "是"}
+    memory.close()
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, config):
+    config(model="/models/a.gguf")
+    memory = open_memory(tmp_path, max_entries=10)
+    memory.put_many([(f"原文{i}", f"译文{i}") for i in range(10)], "中文")
+    memory.get_many(["原文0"], "中文")
+    memory.put_many([("原文10", "译文10")], "中文")
+
+    assert memory.get_stats()["entries"] == 9
+    assert memory.get_many(["原文0", "原文10"], "中文") == {"原文0": "译文0", "原文10": "译文10"}
+    assert memory.get_many(["原文1"], "中文") == {}
+    memory.close()
+
+
+def test_disabled_memory_stores_nothing(tmp_path, config):
+    config(model="/models/a.gguf", translation_memory=False)
+    memory = open_memory(tmp_path)
+    memory.put_many([("はい", "是")], "中文")
+    assert memory.get_many(["はい"], "中文") == {}
+    memory.close()
@@ -0,0 +1,124 @@
+"""
+翻译断点日志
+文件翻译过程中以追加方式记录已完成的条目，进程崩溃后可以从断点继续
+"""
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, Optional
+
+
+def source_hash(text: str) -> str:
+    """计算原文的短哈希，用于校验日志条目与当前文件是否一致"""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+class TranslationJournal:
+    """
+    追加写入的断点日志
+    第一行记录输入文件的指纹和目标语言，之后每行记录一个条目：{"i": 索引, "h": 原文哈希, "t": 译文}
+    """
+
+    def __init__(self, path: str, fingerprint: str, target_lang: str, flush_every: int = 20):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.target_lang = target_lang
+        self.flush_every = max(1, flush_every)
+        self._completed: Dict[int, tuple] = {}
+        self._buffer = []
+        self._file = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_input(cls, file_path: str, target_lang: str, flush_every: int = 20) -> "TranslationJournal":
+        """为输入文件创建日志，日志文件与输入文件放在同一目录"""
+        input_dir = os.path.dirname(file_path)
+        input_filename = os.path.splitext(os.path.basename(file_path))[0]
+        path = os.path.join(input_dir, f"{input_filename}_journal.jsonl")
+
+        stat = os.stat(file_path)
+        fingerprint = f"{stat.st_size}:{stat.st_mtime_ns}"
+        return cls(path, fingerprint, target_lang, flush_every)
+
+    def open(self) -> int:
+        """
+        打开日志
+        已有日志与当前输入、目标语言一致时读取已完成的条目并继续追加，否则重新开始
+        :return: 可恢复的条目数
+        """
+        header = {"fingerprint": self.fingerprint, "target_lang": self.target_lang}
+        if os.path.exists(self.path):
+            self._read_existing(header)
+
+        if self._completed:
+            self._file = open(self.path, "a", encoding="utf-8")
+            # 上次崩溃时可能留下半行，先补一个换行，避免与新追加的条目连在一起
+            if self._file.tell() > 0:
+                self._file.write("\n")
+        else:
+            self._file = open(self.path, "w", encoding="utf-8")
+            self._file.write(json.dumps(header, ensure_ascii=False) + "\n")
+            self._file.flush()
+        return len(self._completed)
+
+    def _read_existing(self, header: dict):
+        with open(self.path, encoding="utf-8") as f:
+            first = f.readline()
+            try:
+                if json.loads(first) != header:
+                    return
+            except json.JSONDecodeError:
+                return
+
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    self._completed[record["i"]] = (record["h"], record["t"])
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    # 崩溃时最后一行可能只写了一半
+                    continue
+
+    def restored(self, index: int, text: str) -> Optional[str]:
+        """返回已记录的译文；原文哈希不一致时返回 None"""
+        record = self._completed.get(index)
+        if record is not None and record[0] == source_hash(text):
+            return record[1]
+        return None
+
+    def record(self, index: int, text: str, translated: str):
+        """记录一个已完成的条目，每累计 flush_every 条写入一次磁盘"""
+        line = json.dumps({"i": index, "h": source_hash(text), "t": translated}, ensure_ascii=False)
+        with self._lock:
+            self._buffer.append(line)
+            if len(self._buffer) >= self.flush_every:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        if self._file is None or not self._buffer:
+            return
+        self._file.write("\n".join(self._buffer) + "\n")
+        self._file.flush()
+        self._buffer.clear()
+
+    def flush(self):
+        """立即把缓冲的条目写入磁盘"""
+        with self._lock:
+            self._flush_locked()
+
+    def close(self):
+        """写入剩余条目并关闭日志"""
+        with self._lock:
+            self._flush_locked()
+            if self._file is not None:
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+
+    def discard(self):
+        """翻译结果保存成功后删除日志"""
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
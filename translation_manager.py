@@ -1,7 +1,9 @@
-import os
 from PySide6.QtCore import QObject, Signal
+
+from config_manager import config_manager
+from translation_journal import TranslationJournal
 from translation_threads.file_translate_worker import FileTranslateWorker
-from translator import Translator
+from translator import Translator, UnsupportedFormat
 
 
 class TranslationSignals(QObject):
@@ -19,33 +21,43 @@ class TranslationManager:
         self.worker = None
         self.input_file_path = None
         self.current_handler = None
+        self.journal = None
         self.signals = TranslationSignals()
 
     def translate_file(self, file_path, target_language, progress_callback=None,
-                       finished_callback=None, error_callback=None):
+                       finished_callback=None, error_callback=None, cancelled_callback=None):
         """翻译文件"""
+        # 根据文件开头判断格式，只解析一次，解析结果直接交给后台线程
         try:
-            with open(file_path, encoding="utf-8") as f:
-                content = f.read()
+            handler = self.translator.create_handler(file_path)
         except OSError:
             raise Exception("无法读取文件")
+        except UnsupportedFormat:
+            self.current_handler = None
+            raise Exception("未找到合适的翻译处理器")
+        except ValueError as e:
+            self.current_handler = None
+            raise Exception(f"无法解析文件：{e}")
 
-        # 保存输入文件路径
+        # 保存输入文件路径和处理器引用
         self.input_file_path = file_path
+        self.current_handler = handler
 
-        # 查找合适的处理器并保存引用
-        for handler in self.translator.handlers:
-            if handler.can_handle(content):
-                self.current_handler = handler
-                # 加载内容到处理器
-                self.current_handler.load(content)
-                break
-        else:
+        # 打开断点日志，同一输入文件上次未完成的条目会被跳过
+        try:
+            self.journal = TranslationJournal.for_input(
+                file_path, target_language, config_manager.get_config("journal_flush_every", 20)
+            )
+            restored = self.journal.open()
+        except OSError as e:
+            handler.close()
             self.current_handler = None
-            raise Exception("未找到合适的翻译处理器")
+            raise Exception(f"无法打开断点日志：{e}")
+        if restored:
+            print(f"检测到未完成的翻译日志，将跳过已完成的 {restored} 条")
 
         # 创建并启动后台线程
-        self.worker = FileTranslateWorker(self.translator, content, target_language, file_path)
+        self.worker = FileTranslateWorker(handler, target_language, file_path, self.journal)
         
         if progress_callback:
             self.worker.signals.progress.connect(progress_callback)
@@ -53,6 +65,8 @@ class TranslationManager:
             self.worker.signals.finished.connect(finished_callback)
         if error_callback:
             self.worker.signals.error.connect(error_callback)
+        if cancelled_callback:
+            self.worker.signals.cancelled.connect(cancelled_callback)
             
         self.worker.start()
 
@@ -60,25 +74,15 @@ class TranslationManager:
         """检查是否正在翻译"""
         return self.worker and self.worker.is_alive()
 
-    def save_temp_translation_file(self):
-        """保存临时翻译文件"""
-        if not self.input_file_path or not self.current_handler:
+    def cancel(self) -> bool:
+        """
+        取消正在进行的文件翻译
+        关闭进行中的请求后立即返回，不阻塞界面线程；后台线程停止翻译后保存临时文件并发出 cancelled 信号。
+        断点日志保留，下次翻译同一文件时从断点继续
+        :return: 是否发出了取消请求
+        """
+        if not self.is_translating():
             return False
 
-        try:
-            # 生成临时文件路径
-            input_dir = os.path.dirname(self.input_file_path)
-            input_filename = os.path.splitext(os.path.basename(self.input_file_path))[0]
-            temp_filename = f"{input_filename}_temp.txt"
-            temp_path = os.path.join(input_dir, temp_filename)
-
-            # 获取当前翻译状态并保存
-            temp_content = self.current_handler.serialize()
-            with open(temp_path, "w", encoding="utf-8") as f:
-                f.write(temp_content)
-
-            print(f"临时文件已保存到: {temp_path}")
-            return True
-        except Exception as e:
-            print(f"保存临时文件失败: {e}")
-            return False
+        self.worker.cancel()
+        return True
@@ -0,0 +1,183 @@
+"""
+翻译记忆库
+把已经翻译过的条目持久化到 SQLite，供后续任务直接复用
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from config_manager import config_manager
+
+# 提示词版本号，修改翻译提示词时需要递增，使旧的记忆条目失效
+PROMPT_VERSION = 2
+
+
+class TranslationMemory:
+    """
+    翻译记忆库
+    以（原文、目标语言、模型文件、提示词版本）为键缓存译文，
+    不同模型的条目互不影响，切换回原来的模型时仍可命中；条目数超过上限时按最近使用时间淘汰
+    """
+
+    def __init__(self, db_path: str = None, max_entries: int = None):
+        self._db_path = db_path
+        self._max_entries = max_entries
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._count = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        """是否启用翻译记忆库"""
+        return bool(config_manager.get_config("translation_memory", True))
+
+    @staticmethod
+    def current_model() -> str:
+        """当前模型文件名，作为缓存键的一部分"""
+        return os.path.basename(config_manager.get_model_path())
+
+    def _connect(self) -> sqlite3.Connection:
+        """首次使用时打开数据库"""
+        if self._conn is None:
+            if self._db_path is None:
+                self._db_path = config_manager.get_config(
+                    "translation_memory_path",
+                    os.path.join(config_manager.get_config_dir(), "translation_memory.db")
+                )
+            if self._max_entries is None:
+                self._max_entries = config_manager.get_config("translation_memory_max_entries", 200000)
+
+            self._conn = sqlite3.connect(self._db_path, check_same_thread=False)
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS memory (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    target_lang TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    translation TEXT NOT NULL,
+                    last_used REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_memory_last_used ON memory(last_used);
+            """)
+            self._count = self._conn.execute("SELECT COUNT(*) FROM memory").fetchone()[0]
+        return self._conn
+
+    @staticmethod
+    def _make_key(text: str, target_lang: str, model: str) -> str:
+        raw = f"{PROMPT_VERSION}\0{model}\0{target_lang}\0{text}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def get_many(self, texts: Iterable[str], target_lang: str) -> Dict[str, str]:
+        """批量查询译文，返回命中的 原文 -> 译文 字典"""
+        texts = list(texts)
+        if not texts or not self.enabled:
+            return {}
+
+        model = self.current_model()
+        keys = {self._make_key(text, target_lang, model): text for text in texts}
+        found = {}
+        with self._lock:
+            conn = self._connect()
+            key_list = list(keys)
+            # SQLite 单条语句的参数个数有限，分段查询
+            for start in range(0, len(key_list), 500):
+                chunk = key_list[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    f"SELECT key, translation FROM memory WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, translation in rows:
+                    found[keys[key]] = translation
+
+            if found:
+                now = time.time()
+                conn.executemany(
+                    "UPDATE memory SET last_used = ? WHERE key = ?",
+                    [(now, self._make_key(text, target_lang, model)) for text in found]
+                )
+                conn.commit()
+
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, pairs: Iterable[Tuple[str, str]], target_lang: str, model_path: Optional[str] = None):
+        """
+        批量写入 (原文, 译文)
+        :param model_path: 生成译文的模型文件，默认为当前配置的模型；切换模型期间旧实例上完成的译文记在旧模型下
+        """
+        if not self.enabled:
+            return
+
+        model = os.path.basename(model_path) if model_path else self.current_model()
+        now = time.time()
+        rows = [
+            (self._make_key(source, target_lang, model), model, target_lang, source, translation, now)
+            for source, translation in pairs
+        ]
+        if not rows:
+            return
+
+        with self._lock:
+            conn = self._connect()
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO memory (key, model, target_lang, source, translation, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self._count += conn.total_changes - before
+            conn.executemany(
+                "UPDATE memory SET translation = ?, last_used = ? WHERE key = ?",
+                [(row[4], now, row[0]) for row in rows]
+            )
+            if self._count > self._max_entries:
+                self._evict_locked()
+            conn.commit()
+
+    def _evict_locked(self):
+        """淘汰最久未使用的条目，保留上限的 90%，避免每次写入都触发淘汰"""
+        keep = int(self._max_entries * 0.9)
+        self._conn.execute(
+            "DELETE FROM memory WHERE key IN "
+            "(SELECT key FROM memory ORDER BY last_used ASC LIMIT ?)",
+            (self._count - keep,)
+        )
+        self._count = self._conn.execute("SELECT COUNT(*) FROM memory").fetchone()[0]
+
+    def _invalidate_locked(self, keep_model: str = None):
+        if keep_model is None:
+            self._conn.execute("DELETE FROM memory")
+        else:
+            self._conn.execute("DELETE FROM memory WHERE model != ?", (keep_model,))
+        self._count = self._conn.execute("SELECT COUNT(*) FROM memory").fetchone()[0]
+
+    def invalidate(self, keep_current_model: bool = True):
+        """
+        使记忆条目失效
+        :param keep_current_model: 为 True 时只清除非当前模型的条目，否则全部清除
+        """
+        with self._lock:
+            self._connect()
+            self._invalidate_locked(self.current_model() if keep_current_model else None)
+            self._conn.commit()
+
+    def get_stats(self) -> Dict[str, int]:
+        """获取命中统计"""
+        return {"hits": self.hits, "misses": self.misses, "entries": self._count}
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# 全局翻译记忆库实例
+translation_memory = TranslationMemory()
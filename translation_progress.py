@@ -0,0 +1,70 @@
+"""
+翻译进度估算
+按原文字符数而不是条目数计算进度，长短条目混在一起时进度也能均匀前进；
+根据实际请求模型的部分测得的字符/秒估算剩余时间
+"""
+import threading
+import time
+from typing import Optional
+
+
+def format_eta(seconds: Optional[float]) -> str:
+    """把剩余秒数格式化为"1小时2分" / "3分4秒" / "5秒"，未知时返回空字符串"""
+    if seconds is None:
+        return ""
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}小时{minutes}分"
+    if minutes:
+        return f"{minutes}分{seconds}秒"
+    return f"{seconds}秒"
+
+
+class TranslationProgress:
+    """
+    一次文件翻译的进度
+    从断点日志或翻译记忆库恢复的部分只计入进度，不参与速度估算
+    """
+
+    def __init__(self, total: int = 0):
+        self.total = total
+        self.done = 0
+        self._measured = 0
+        self._started_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def skip(self, chars: int):
+        """不经过模型直接完成的部分"""
+        with self._lock:
+            self.done += chars
+
+    def start(self):
+        """开始请求模型，从这里开始计时"""
+        with self._lock:
+            self._started_at = time.monotonic()
+            self._measured = 0
+
+    def advance(self, chars: int):
+        """模型完成了一部分"""
+        with self._lock:
+            self.done += chars
+            self._measured += chars
+
+    @property
+    def chars_per_second(self) -> float:
+        """请求模型部分的平均速度"""
+        with self._lock:
+            if self._started_at is None or not self._measured:
+                return 0.0
+            elapsed = time.monotonic() - self._started_at
+            return self._measured / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta_seconds(self) -> Optional[float]:
+        """预计剩余时间（秒），还没有测得速度时为 None"""
+        speed = self.chars_per_second
+        if not speed:
+            return None
+        return max(0, self.total - self.done) / speed
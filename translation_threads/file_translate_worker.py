@@ -1,23 +1,40 @@
 from PySide6.QtCore import Signal, QObject
+import os
 import threading
-from translator import Translator
+from handler.base import BaseHandler
+from http_client import RequestCancelled
+from translation_journal import TranslationJournal
 
 
 class WorkerSignals(QObject):
-    finished = Signal(str, str, str)  # result, target_lang, file_path
+    finished = Signal(str, str, str)  # output_path, target_lang, file_path
     progress = Signal(int, int)  # done, total
     error = Signal(str)  # error message
+    cancelled = Signal(str, str)  # file_path, temp_path（保存失败时为空字符串）
+
+
+def output_path_for(file_path: str, suffix: str) -> str:
+    """与输入文件放在同一目录的输出文件，例如 data.json -> data_translated.txt"""
+    input_dir = os.path.dirname(file_path)
+    input_filename = os.path.splitext(os.path.basename(file_path))[0]
+    return os.path.join(input_dir, f"{input_filename}{suffix}.txt")
 
 
 class FileTranslateWorker(threading.Thread):
-    def __init__(self, translator: Translator, content: str, target_lang: str, file_path: str):
+    def __init__(self, handler: BaseHandler, target_lang: str, file_path: str,
+                 journal: TranslationJournal = None):
         super().__init__()
-        self.translator = translator
-        self.content = content
+        # handler 已经加载好文件内容
+        self.handler = handler
         self.target_lang = target_lang
         self.file_path = file_path
+        self.journal = journal
         self.signals = WorkerSignals()
 
+    def cancel(self):
+        """取消翻译，进行中的请求会被立即关闭"""
+        self.handler.cancel()
+
     def run(self):
         try:
             # 回调函数：发送进度信号
@@ -25,13 +42,45 @@ class FileTranslateWorker(threading.Thread):
                 self.signals.progress.emit(done, total)
 
             # 执行翻译
-            result = self.translator.translate_from_file(
-                self.content,
+            self.handler.translate_loaded(
                 self.target_lang,
-                progress_callback=update_progress
+                progress_callback=update_progress,
+                journal=self.journal,
+                serialize=False
             )
 
-            # 发送完成信号（包含文件路径）
-            self.signals.finished.emit(result, self.target_lang, self.file_path)
+            # 大文件写出耗时较长，在后台线程中完成，界面只显示结果
+            output_path = output_path_for(self.file_path, "_translated")
+            try:
+                self.handler.write_to(output_path)
+            except Exception as e:
+                self.signals.error.emit(f"保存文件失败：{e}")
+                return
+            if self.journal is not None:
+                self.journal.discard()
+
+            # 发送完成信号（包含输出文件路径）
+            self.signals.finished.emit(output_path, self.target_lang, self.file_path)
+        except RequestCancelled:
+            # 翻译已经停止，已完成的条目保留在处理器和断点日志中，保存为临时文件
+            self.signals.cancelled.emit(self.file_path, self._save_temp())
         except Exception as e:
             self.signals.error.emit(str(e))
+        finally:
+            if self.journal is not None:
+                self.journal.close()
+            # 写出译文或临时文件之后释放原文件（文本处理器的内存映射和文件句柄）
+            self.handler.close()
+
+    def _save_temp(self) -> str:
+        """保存临时翻译文件，返回文件路径，失败时返回空字符串"""
+        if self.journal is not None:
+            self.journal.flush()
+        temp_path = output_path_for(self.file_path, "_temp")
+        try:
+            self.handler.write_to(temp_path)
+        except Exception as e:
+            print(f"保存临时文件失败: {e}")
+            return ""
+        print(f"临时文件已保存到: {temp_path}")
+        return temp_path
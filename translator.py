@@ -6,6 +6,14 @@ from typing import List
 from config_manager import config_manager
 from handler import HANDLER_REGISTRY
 from handler.base import BaseHandler
+from translation_journal import TranslationJournal
+
+# 判断文件格式时读取的字节数
+SNIFF_SIZE = 4096
+
+
+class UnsupportedFormat(ValueError):
+    """没有处理器可以处理该文件"""
 
 
 class Translator:
@@ -21,13 +29,46 @@ class Translator:
             cls(self.url) for cls in HANDLER_REGISTRY
         ]
 
-    def translate_from_file(self, text: str, target_lang: str, progress_callback=None) -> str:
+    def create_handler(self, file_path: str) -> BaseHandler:
+        """
+        根据文件开头的字节和扩展名选择处理器并加载文件
+        返回一个新的、已经加载好文件的处理器实例，多个文件可以同时处于加载或翻译状态；
+        按注册顺序尝试，某个处理器解析失败（ValueError）时换下一个可以处理该文件的处理器
+        :raises UnsupportedFormat: 没有处理器可以处理该文件
+        :raises ValueError: 可以处理的处理器全部解析失败，为最后一个处理器的错误
+        """
+        with open(file_path, "rb") as f:
+            head = f.read(SNIFF_SIZE)
+
+        error = None
+        for handler in self.handlers:
+            if not handler.can_handle_file(file_path, head):
+                continue
+            candidate = type(handler)(self.url)
+            try:
+                candidate.load_file(file_path)
+            except ValueError as e:
+                candidate.close()
+                print(f"{type(handler).__name__} 无法解析 {file_path}，尝试其他处理器：{e}")
+                error = e
+                continue
+            except Exception:
+                candidate.close()
+                raise
+            return candidate
+
+        if error is not None:
+            raise error
+        raise UnsupportedFormat("没有找到可以处理该文本格式的翻译处理器")
+
+    def translate_from_file(self, text: str, target_lang: str, progress_callback=None,
+                            journal: TranslationJournal = None) -> str:
         """翻译文件内容"""
         # 遍历所有已注册的处理器
         for handler in self.handlers:
             if handler.can_handle(text):
                 # 交给处理器执行完整翻译流程
-                return handler.translate(text, target_lang, progress_callback)
+                return handler.translate(text, target_lang, progress_callback, journal=journal)
 
         # 没有找到合适的处理器
         raise ValueError("没有找到可以处理该文本格式的翻译处理器")